@@ -0,0 +1,1433 @@
+# -*- coding: utf-8 -*-
+"""
+สคริปต์วัดความเร็วของ scraper.py (ไม่ยิงเว็บ TGO จริง ใช้ HTTP server ในเครื่องแทน)
+
+ตัวอย่าง:
+    python benchmark.py browser --pages 6
+    python benchmark.py schedule --workers 4
+    python benchmark.py cache
+    python benchmark.py incremental
+    python benchmark.py parse
+    python benchmark.py classify
+    python benchmark.py keywords
+    python benchmark.py startup
+    python benchmark.py upload
+    python benchmark.py detail
+    python benchmark.py search
+    python benchmark.py images
+    python benchmark.py waits
+    python benchmark.py snapshot
+    python benchmark.py dedupe
+    python benchmark.py suite --output before.json
+    python benchmark.py compare before.json after.json --threshold 0.15
+"""
+import argparse
+import contextlib
+import csv
+import html as html_lib
+import http.server
+import json
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+from contextlib import contextmanager
+
+import scraper
+
+# --- 1. สร้างหน้า catalog ปลอม (โครงสร้างเดียวกับหน้า TGO ที่ parse_product_data อ่าน) ---
+SAMPLE_NAMES = ["ปูนซีเมนต์ปอร์ตแลนด์ ประเภท 1", "เหล็กเส้นกลม SR24", "สีทาอาคารภายนอก", "กระเบื้องเซรามิกปูพื้น"]
+
+NO_RESULTS_HTML = """<!DOCTYPE html><html><head><meta charset="utf-8"></head>
+<body><div class="alert alert-warning">ไม่พบข้อมูล</div></body></html>"""
+
+def make_catalog_row(i, name, label="CFP", year=2024, quarter=1):
+    name = html_lib.escape(name)
+    return f"""<tr><td>
+<table class="catalog-template">
+<tr><th class="catalog-header" colspan="2"><span>TGO{label}-{year}{quarter}-{i:05d}</span></th></tr>
+<tr>
+<td class="catalog-col-l">
+<h1>{name}</h1>
+หน่วยการทำงาน: 1 กิโลกรัม<br>
+ขอบเขต: Cradle-to-Gate<br>
+<strong>บริษัท ตัวอย่าง {i % 97} จำกัด</strong><br>
+ติดต่อ คุณทดสอบ ระบบ<br>
+โทรศัพท์ 02-000-{i % 10000:04d} #{i % 100}<br>
+อีเมล์ contact{i}@example.com<br>
+<h4>คาร์บอนฟุตพริ้นท์: <span>{(i * 7) % 1000 + 0.25:,.2f} <i>kgCO2eq</i></span></h4>
+วันรับรอง: 1/{quarter * 3}/{year + 543} - 30/{quarter * 3}/{year + 546}
+</td>
+<td class="catalog-col-r">
+<img src="/images/label_{label}.png">
+<div class="catalog-qrcode"><a href="https://thaicarbonlabel.tgo.or.th/detail?id={i}">QR</a></div>
+</td>
+</tr>
+</table>
+</td></tr>"""
+
+# หน้าที่รวมกรณีแปลก ๆ (ไม่มี h1, comment, script, label ซ้อนในบรรทัดเดียว, ไม่มีรูป ฯลฯ) ไว้เทียบ parser
+EDGE_CASE_HTML = """<html><body><table class="catalog-table"><tbody>
+<tr><td><table class="catalog-template"><tr><th class="catalog-header"><span> </span></th></tr><tr>
+<td class="catalog-col-l">  ชื่อจาก text node <!-- c --> <b>x</b>
+<strong> บริษัท &amp; ลูก </strong> ติดต่อ คุณ ก โทรศัพท์ 02-111 อีเมล์ a@b.c
+<p>Carbon Footprint (kg): 1,234.5 kgCO2e</p><script>var x='ขอบเขต: ไม่ใช่';</script>
+<div>Date of Approval : 01/2/2565 - 1/02/2568</div></td>
+<td class="catalog-col-r"><p><span>no img</span></p><div class="x catalog-qrcode"><a>no href</a></div></td></tr></table></td></tr>
+<tr><td><table class="catalog-template"><tr><th>no header class</th></tr></table></td></tr>
+<tr><td><table class="catalog-template"><tr><th class="catalog-header"><span>CFP-9</span></th></tr><tr>
+<td class="catalog-col-r"><span>no p no img</span></td></tr></table></td></tr>
+<tr><td><table class="catalog-template"><tr><th class="catalog-header"><span>CFR-1</span></th></tr><tr>
+<td class="catalog-col-l"><h1></h1><!--first-->หน่วยการทำงาน:
+<b>1 ตัน</b><h4><span><!--v--> - <i>kg</i></span></h4> ลดการปล่อย: 12 tCO2
+วันรับรอง: 1/1/2400 - 1/1/2570</td></tr></table></td></tr>
+<tr><td><table class="catalog-template"><tr><th class="catalog-header"><span>TGO-CFP-77</span></th></tr><tr>
+<td class="catalog-col-l"><h1>สีรองพื้น &nbsp;กันซึม</h1><h4><span>1,2x <i> kgCO2eq </i></span></h4>
+ขอบเขต:<br>Business-to-Consumer<br>โทรศัพท์ 081 234 5678#12<br>คาร์บอนฟุตพริ้นท์ต่อหน่วย: 3.5 kg</td>
+<td class="catalog-col-r"><img src="https://cdn.example.com/a.png"><div class="catalog-qrcode"><a href="/d?id=77">QR</a></div></td>
+</tr></table></td></tr>
+<tr><td><table class="catalog-template"><tr><th class="catalog-header"><span>CFP-88</span></th></tr><tr>
+<td class="catalog-col-l"><p>x <h4><span>2.5 <i>kg</i></span></h4> y</p><strong>บริษัท ข</strong></td>
+<td class="catalog-col-r"><img src="/b.png"></td></tr></table></td></tr>
+<tr><td>no template</td></tr>
+</tbody></table></body></html>"""
+
+# ตารางหลักที่ไม่มี <tbody> (HTML ดิบจาก HTTP อาจไม่มี แต่เบราว์เซอร์เติมให้)
+NO_TBODY_HTML = """<html><body><table class="catalog-table">
+<tr><td><table class="catalog-template"><tr><th class="catalog-header"><span>CFR-5</span></th></tr><tr>
+<td class="catalog-col-l"><h1>ชื่อ</h1><strong>บริษัท ค</strong></td><td class="catalog-col-r"><img src="/c.png"></td>
+</tr></table></td></tr></table></body></html>"""
+
+def load_training_names(path="training_data.csv"):
+    """ชื่อสินค้าจริง (ภาษาไทย) จาก training_data.csv ไว้ใช้สร้างหน้า catalog ปลอม"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [row["product_name"] for row in csv.DictReader(f) if row.get("product_name")]
+    except FileNotFoundError:
+        return list(SAMPLE_NAMES)
+
+def make_catalog_html(rows, names=None, label="CFP", year=2024, quarter=1):
+    """สร้างหน้า catalog ที่มี `rows` แถว (ชื่อวนจาก `names`)"""
+    names = names or SAMPLE_NAMES
+    body = "\n".join(make_catalog_row(i + 1, names[i % len(names)], label, year, quarter) for i in range(rows))
+    return f"""<!DOCTYPE html><html><head><meta charset="utf-8"><title>catalog</title></head>
+<body><table class="catalog-table"><tbody>
+{body}
+</tbody></table></body></html>"""
+
+# --- 2. HTTP server ในเครื่อง (เสิร์ฟหน้า catalog ตาม path) ---
+class CatalogServer:
+    """
+    เสิร์ฟหน้า HTML ที่กำหนดใน `pages` ({path หรือ path?query: html}) บน 127.0.0.1
+    path ที่ไม่มีใน `pages` จะได้หน้า 'ไม่พบข้อมูล', `latency` คือเวลาหน่วงต่อ request (วินาที)
+    ค่าที่เป็น bytes (เช่นรูป) ส่งตามนั้นเป็น application/octet-stream
+    `failure_rate` = โอกาสตอบ 503 (จำลอง error ชั่วคราว), `content_type` = header ของหน้า HTML
+    """
+    def __init__(self, pages=None, latency=0.0, failure_rate=0.0, seed=1, content_type='text/html; charset=utf-8'):
+        self.pages = pages or {}
+        self.content_type = content_type
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.hits = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.hits += 1
+                    fail = server._random.random() < server.failure_rate
+                    if fail: server.failures += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if fail:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                page = server.pages.get(self.path) or server.pages.get(self.path.split('?')[0], NO_RESULTS_HTML)
+                binary = isinstance(page, bytes)
+                body = page if binary else page.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream' if binary else server.content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class SupabaseStub:
+    """
+    server จำลอง PostgREST ของ Supabase (POST /rest/v1/<table> = upsert, GET = select + order + offset/limit)
+    เก็บแถวไว้ใน memory ตาม product_id
+    `latency` = เวลาหน่วงต่อ request, `failure_rate` = โอกาสตอบ 503 (จำลอง error ชั่วคราว)
+    """
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=1):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rows = {}
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+                with server._lock:
+                    server.requests += 1
+                    rows = list(server.rows.values())
+                order = params.get("order", [""])[0].split(".")[0]
+                if order:
+                    rows.sort(key=lambda row: str(row.get(order)))
+                offset = int(params.get("offset", [0])[0])
+                limit = int(params.get("limit", [len(rows)])[0])
+                columns = params.get("select", ["*"])[0]
+                rows = rows[offset:offset + limit]
+                if columns != "*":
+                    rows = [{column: row.get(column) for column in columns.split(",")} for row in rows]
+                self._reply(200, json.dumps(rows, ensure_ascii=False).encode('utf-8'))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if server.latency:
+                    time.sleep(server.latency)
+                with server._lock:
+                    server.requests += 1
+                    fail = server._random.random() < server.failure_rate
+                    if fail: server.failures += 1
+                if fail:
+                    self._reply(503, b'{"message": "stub: service unavailable"}')
+                    return
+                rows = json.loads(body or b'[]')
+                rows = rows if isinstance(rows, list) else [rows]
+                with server._lock:
+                    for row in rows:
+                        server.rows[row.get("product_id")] = row
+                self._reply(201, json.dumps(rows, ensure_ascii=False).encode('utf-8'))
+
+            def _reply(self, status, body):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def client(self):
+        """Supabase client จริง แต่ชี้มาที่ stub นี้"""
+        from supabase import create_client
+        return create_client(self.url, "stub.anon.key")
+
+@contextmanager
+def timed(results, name):
+    start = time.perf_counter()
+    yield
+    results[name] = time.perf_counter() - start
+
+# --- 3. Benchmark: เปิด Chrome ใหม่ทุกหน้า vs ใช้ BrowserPool ---
+def bench_browser(args):
+    pages = {f"/p{i}": make_catalog_html(20) for i in range(args.pages)}
+    results = {}
+    with CatalogServer(pages) as srv:
+        urls = [f"{srv.base_url}/p{i}" for i in range(args.pages)]
+        scraper.resolve_chromedriver_path() # ไม่นับเวลาหา driver ครั้งแรกทั้งสองแบบ
+
+        with timed(results, "per_call"):
+            for url in urls:
+                assert scraper.fetch_tgo_data_with_selenium(url)
+
+        with timed(results, "pool"):
+            with scraper.BrowserPool(size=1, headless=True) as pool:
+                for url in urls:
+                    assert scraper.fetch_tgo_data_with_selenium(url, pool=pool)
+
+    print(f"\n=== Browser startup: {args.pages} หน้า ===")
+    for name, seconds in results.items():
+        print(f"  {name:<10} {seconds:8.2f} s  ({seconds / args.pages:.2f} s/หน้า)")
+    print(f"  เร็วขึ้น {results['per_call'] / results['pool']:.2f} เท่า")
+    return results
+
+# --- 4. Benchmark: ตัวจัดคิวงานแบบทีละงาน vs หลาย worker ---
+def period_path(task):
+    return scraper.build_period_url(task["section"], task["year"], task["quarter"], base_url="")
+
+def make_period_pages(tasks, rows=20, empty_every=3):
+    """หน้า catalog สำหรับทุกงาน (เว้นทุก ๆ `empty_every` งานให้เป็นหน้า 'ไม่พบข้อมูล')"""
+    pages = {}
+    for i, task in enumerate(tasks):
+        if empty_every and i % empty_every == empty_every - 1: continue
+        pages[period_path(task)] = make_catalog_html(rows, label=task["label"], year=task["year"], quarter=task["quarter"])
+    return pages
+
+def http_only_fetch(url):
+    """ตัวดึงหน้าสำหรับ benchmark (HTTP อย่างเดียว ไม่เปิดเบราว์เซอร์)"""
+    return scraper.fetch_period_html(url, mode="http", raise_on_error=True)
+
+def bench_schedule(args):
+    tasks = scraper.build_period_tasks(args.start_year, args.end_year)
+    pages = make_period_pages(tasks, rows=args.rows)
+    results = {}
+    summaries = {}
+    with CatalogServer(pages, latency=args.latency) as srv:
+        for workers in (1, args.workers):
+            with timed(results, f"workers={workers}"):
+                summaries[workers], _ = scraper.run_period_tasks(
+                    tasks, http_only_fetch, workers=workers, max_rps=args.max_rps,
+                    upload=None, base_url=srv.base_url)
+
+    print(f"\n=== Scheduler: {len(tasks)} งาน, server หน่วง {args.latency}s/หน้า ===")
+    for name, seconds in results.items():
+        print(f"  {name:<12} {seconds:8.2f} s")
+    for workers, summary in summaries.items():
+        print(f"  workers={workers:<4} {summary}")
+    same = summaries[1] == summaries[args.workers]
+    print(f"  ผลรวมตรงกับแบบทีละงาน: {'✅' if same else '❌'}")
+    scraper.print_fetch_stats()
+    return results
+
+# --- 5. Benchmark: ดึงจากเว็บ (server ในเครื่อง) vs แยกข้อมูลใหม่จากแคช HTML ---
+def bench_cache(args):
+    tasks = scraper.build_period_tasks(args.start_year, args.end_year)
+    pages = make_period_pages(tasks, rows=args.rows)
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = scraper.HtmlCache(root=cache_dir)
+        with CatalogServer(pages, latency=args.latency) as srv:
+            with timed(results, "fetch"):
+                fetched, _ = scraper.run_period_tasks(tasks, http_only_fetch, max_rps=0, upload=None,
+                                                      base_url=srv.base_url, cache=cache)
+        with timed(results, "from_cache"):
+            offline, _ = scraper.run_period_tasks(tasks, None, upload=None, cache=cache)
+        # อายุแคช: ไตรมาสที่ปิดแล้วถาวรเฉพาะหน้าที่ดึงหลังปิดไตรมาส (หน้าที่ดึงกลางไตรมาสต้องดึงใหม่)
+        closed_end = scraper.period_end_timestamp(2020, 1)
+        freshness = {"ไตรมาสปิดแล้ว ดึงหลังปิด": (cache.is_fresh(2020, 1, closed_end + 86400), True),
+                     "ไตรมาสปิดแล้ว ดึงกลางไตรมาส": (cache.is_fresh(2020, 1, closed_end - 14 * 86400), False),
+                     "ไตรมาสปัจจุบัน ดึงเมื่อครู่": (cache.is_fresh(*scraper.current_year_quarter(), time.time()), True),
+                     "ไตรมาสปัจจุบัน ดึงเกิน TTL": (cache.is_fresh(*scraper.current_year_quarter(),
+                                                                 time.time() - cache.current_ttl - 1), False)}
+        size = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(cache_dir) for f in fs)
+
+    print(f"\n=== HTML cache: {len(tasks)} งาน, {args.rows} แถว/หน้า ===")
+    for name, seconds in results.items():
+        print(f"  {name:<12} {seconds:8.2f} s")
+    print(f"  ขนาดแคชบนดิสก์ {size / 1024:.0f} KiB")
+    print(f"  จำนวนสินค้าตรงกัน: {'✅' if fetched['products'] == offline['products'] else '❌'} ({offline['products']})")
+    for label, (fresh, expected) in freshness.items():
+        print(f"  {label:<28} ใช้แคชได้: {fresh} {'✅' if fresh == expected else '❌'}")
+    if any(fresh != expected for fresh, expected in freshness.values()): raise SystemExit(1)
+    return results
+
+# --- 6. Benchmark: รันเต็มครั้งแรก vs รันซ้ำแบบ incremental (manifest) ---
+class CountingUpload:
+    """ตัวส่งข้อมูลปลอม นับจำนวนแถวที่จะถูก upsert จริง (`table` = สถานะตารางหลัง upsert ตาม product_id)"""
+    def __init__(self):
+        self.rows = 0
+        self.calls = 0
+        self.table = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, products, on_success=None):
+        with self._lock:
+            self.rows += len(products)
+            self.calls += 1
+            self.table.update((p["product_id"], dict(p)) for p in products)
+        if on_success: on_success()
+        return True
+
+def bench_incremental(args):
+    tasks = scraper.build_period_tasks(args.start_year, args.end_year)
+    pages = make_period_pages(tasks, rows=args.rows)
+    results = {}
+    with tempfile.TemporaryDirectory() as state_dir, CatalogServer(pages, latency=args.latency) as srv:
+        manifest = scraper.ScrapeManifest(os.path.join(state_dir, "manifest.sqlite"))
+        cache = scraper.HtmlCache(root=os.path.join(state_dir, "html_cache"))
+        for name in ("first_run", "second_run"):
+            upload = CountingUpload()
+            run_id, _ = manifest.start_run()
+            with timed(results, name):
+                summary, _ = scraper.run_period_tasks(tasks, http_only_fetch, max_rps=0, upload=upload,
+                                                      base_url=srv.base_url, cache=cache,
+                                                      manifest=manifest, run_id=run_id)
+            manifest.finish_run(run_id)
+            print(f"  {name}: upsert {upload.rows} แถว ({upload.calls} ครั้ง), หน้าไม่เปลี่ยน {summary['unchanged']} งาน")
+
+    print(f"\n=== Incremental: {len(tasks)} งาน ===")
+    for name, seconds in results.items():
+        print(f"  {name:<12} {seconds:8.2f} s")
+    return results
+
+# --- 7. Benchmark: parser bs4 (ตัวเดิม) vs lxml + ตรวจว่าผลลัพธ์ตรงกันทุก field ---
+# ความต่างที่ตั้งใจ (หน้า, product_id, field) -> (ค่าจาก bs4 html.parser ตัวเดิม, ค่าจาก lxml)
+# <h4> ใน <p>: html.parser ซ้อน h4 ไว้ใน p ตามตัวอักษร แต่ libxml2 ปิด <p> ก่อนตามกฎ HTML (แบบเดียวกับเบราว์เซอร์)
+# ' y' จึงกลายเป็น text node ตรงของ col_l และถูกใช้เป็นชื่อแทน h1 (HTML จาก Selenium ก็ได้ 'y' แบบนี้)
+KNOWN_PARSER_DIVERGENCES = {("edge_cases", "CFP-88", "product_name"): (None, "y")}
+
+def check_parser_equivalence(pages):
+    """คืนรายการความต่าง (ว่าง = ตรงกันทุก field ทุกแถว ยกเว้นที่อยู่ใน KNOWN_PARSER_DIVERGENCES ตามค่าที่ระบุเป๊ะ)"""
+    problems = []
+    seen = set()
+    for name, page in pages.items():
+        expected = scraper._parse_rows_bs4(page, 2024, 1)
+        actual = scraper._parse_rows_lxml(page, 2024, 1)
+        if not expected:
+            problems.append(f"{name}: ไม่ได้แถวเลย")
+        if len(expected) != len(actual):
+            problems.append(f"{name}: จำนวนแถว {len(expected)} != {len(actual)}")
+            continue
+        for row_expected, row_actual in zip(expected, actual):
+            for key in row_expected:
+                known = KNOWN_PARSER_DIVERGENCES.get((name, row_expected['product_id'], key))
+                if known is not None:
+                    seen.add((name, row_expected['product_id'], key))
+                    if (row_expected[key], row_actual.get(key)) != known:
+                        problems.append(f"{name} [{row_expected['product_id']}] {key}: คาดว่าต่างกันเป็น {known!r}"
+                                        f" แต่ได้ {(row_expected[key], row_actual.get(key))!r}")
+                    continue
+                if row_expected[key] != row_actual.get(key):
+                    problems.append(f"{name} [{row_expected['product_id']}] {key}: {row_expected[key]!r} != {row_actual.get(key)!r}")
+    for missing in {k for k in KNOWN_PARSER_DIVERGENCES if k[0] in pages} - seen:
+        problems.append(f"ไม่เจอแถวของความต่างที่ตั้งใจ {missing}")
+    return problems
+
+def bench_parse(args):
+    names = load_training_names()
+    golden = {"edge_cases": EDGE_CASE_HTML, "no_tbody": NO_TBODY_HTML}
+    for label in ("CFP", "CFR"):
+        golden[f"{label}_training_names"] = make_catalog_html(min(len(names), 500), names=names, label=label)
+    problems = check_parser_equivalence(golden)
+    print(f"\n=== Parser equivalence ({len(golden)} หน้า) ===")
+    if problems:
+        for problem in problems[:20]: print(f"  ❌ {problem}")
+        raise SystemExit(1)
+    print(f"  ✅ lxml ให้ผลตรงกับ bs4 (html.parser) ทุก field ยกเว้นความต่างที่ตั้งใจ {len(KNOWN_PARSER_DIVERGENCES)} จุด"
+          " (HTML ผิดรูป: lxml ตีความแบบเบราว์เซอร์)")
+
+    print(f"\n=== Parser throughput (แถว/วินาที) ===")
+    results = {}
+    for rows in args.rows:
+        page = make_catalog_html(rows, names=names)
+        for backend, parse_rows in scraper.PARSER_BACKENDS.items():
+            start = time.perf_counter()
+            parsed = parse_rows(page, 2024, 1)
+            seconds = time.perf_counter() - start
+            results[f"{backend}_{rows}"] = len(parsed) / seconds
+        print(f"  {rows:>6} แถว: bs4 {results[f'bs4_{rows}']:9.0f} | lxml {results[f'lxml_{rows}']:9.0f}"
+              f" | เร็วขึ้น {results[f'lxml_{rows}'] / results[f'bs4_{rows}']:.1f} เท่า")
+    return results
+
+# --- 8. Benchmark: จัดหมวดหมู่ทีละแถว (ตัวเดิม) vs batch + แคช ---
+def bench_classify(args):
+    classifier = scraper.get_category_classifier()
+    if classifier is None:
+        print("❌ ไม่พบโมเดล (รัน python train_model.py ก่อน)")
+        raise SystemExit(1)
+    names = load_training_names()[:args.names]
+    results = {}
+
+    with timed(results, "per_row"):
+        expected = [str(classifier.predict([name])[0]) for name in names]
+
+    fast_path = scraper.KEYWORD_FAST_PATH
+    scraper.KEYWORD_FAST_PATH = False # เทียบเฉพาะ batch + แคช กับโมเดล (ทางลัด keyword วัดแยกใน `keywords`)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        scraper._category_cache = scraper.CategoryCache(scraper.model_fingerprint(),
+                                                        path=os.path.join(cache_dir, "cache.sqlite"))
+        with timed(results, "batch_cold"):
+            cold = scraper.classify_product_names(names)
+        scraper._category_cache._memory.clear() # จำลองรอบการรันใหม่ (เหลือแต่แคชบนดิสก์)
+        with timed(results, "batch_disk"):
+            scraper.classify_product_names(names)
+        with timed(results, "batch_memory"):
+            scraper.classify_product_names(names)
+        scraper.print_classify_stats()
+        scraper._category_cache = None
+    scraper.KEYWORD_FAST_PATH = fast_path
+
+    same = sum(a == b for a, b in zip(expected, cold))
+    print(f"\n=== Classifier: {len(names)} ชื่อ ===")
+    for name, seconds in results.items():
+        print(f"  {name:<13} {seconds * 1000:9.1f} ms  ({seconds / len(names) * 1e6:8.1f} µs/ชื่อ)")
+    print(f"  ผลตรงกับทีละแถว {same}/{len(names)} ชื่อ")
+    return results
+
+# --- 8.1 Benchmark: ทางลัด keyword vs โมเดลอย่างเดียว (ความแม่นเทียบกับเฉลยใน training_data.csv) ---
+def load_training_rows(path="training_data.csv"):
+    with open(path, encoding="utf-8") as f:
+        return [(row["product_name"], row["correct_category"]) for row in csv.DictReader(f)
+                if row.get("product_name") and row.get("correct_category")]
+
+def keyword_report(title, rows, predict, examples=5):
+    """พิมพ์ความแม่นของโมเดลอย่างเดียว vs ทางลัด keyword + โมเดล บนชุด `rows`"""
+    keys = [scraper.normalize_product_name(name) for name, _ in rows]
+    answers = [category for _, category in rows]
+    start = time.perf_counter()
+    decided = [scraper.KEYWORD_MATCHER.decide(key) for key in keys]
+    fast_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    model_only = [str(category) for category in predict(keys)]
+    model_seconds = time.perf_counter() - start
+    hybrid = [fast or model for fast, model in zip(decided, model_only)]
+    fast_rows = [(fast, answer) for fast, answer in zip(decided, answers) if fast]
+
+    def accuracy(predicted):
+        return sum(p == a for p, a in zip(predicted, answers)) / len(answers) * 100
+
+    print(f"\n=== {title}: {len(rows)} ชื่อ ===")
+    print(f"  ทางลัด keyword ตัดสินได้ {len(fast_rows)} ชื่อ ({len(fast_rows) / len(rows) * 100:.1f}%)"
+          f" ถูก {sum(f == a for f, a in fast_rows) / max(len(fast_rows), 1) * 100:.1f}%"
+          f" | ใช้เวลา {fast_seconds / len(rows) * 1e6:.1f} µs/ชื่อ (โมเดลแบบ batch {model_seconds / len(rows) * 1e6:.1f} µs/ชื่อ)")
+    print(f"  ความแม่นรวม: โมเดลอย่างเดียว {accuracy(model_only):.2f}% | keyword + โมเดล {accuracy(hybrid):.2f}%")
+    changed = [(name, model, fast, answer) for (name, answer), fast, model in zip(rows, decided, model_only)
+               if fast and fast != model]
+    print(f"  ชื่อที่ทางลัดให้ผลต่างจากโมเดล {len(changed)} ชื่อ"
+          f" (ทางลัดถูก {sum(f == a for _, _, f, a in changed)}, โมเดลถูก {sum(m == a for _, m, _, a in changed)})")
+    for name, model, fast, answer in changed[:examples]:
+        print(f"    - {name[:50]} | keyword: {fast} | โมเดล: {model} | เฉลย: {answer}")
+
+def bench_keywords(args):
+    rows = load_training_rows()
+    classifier = scraper.get_category_classifier()
+    if classifier is None:
+        print("❌ ไม่พบโมเดล (รัน python train_model.py ก่อน)")
+        raise SystemExit(1)
+    # โมเดลที่ใช้งานจริงเทรนจากไฟล์นี้ทั้งไฟล์ -> ความแม่นของโมเดลเกินจริง (เห็นข้อสอบมาแล้ว)
+    keyword_report("โมเดลที่ใช้งาน (เทรนจาก training_data.csv ทั้งหมด)", rows, classifier.predict, args.examples)
+
+    # แบ่ง holdout: เทรนโมเดลแบบเดียวกับ train_model.py จาก 80% แล้ววัดกับอีก 20% ที่โมเดลไม่เคยเห็น
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import make_pipeline
+    shuffled = list(rows)
+    random.Random(args.seed).shuffle(shuffled)
+    split = int(len(shuffled) * 0.8)
+    train, holdout = shuffled[:split], shuffled[split:]
+    model = make_pipeline(TfidfVectorizer(analyzer='char', ngram_range=(2, 5)), MultinomialNB())
+    model.fit([name for name, _ in train], [category for _, category in train])
+    keyword_report("Holdout 20% (โมเดลเทรนจากอีก 80%)", holdout, model.predict, args.examples)
+
+# --- 9. Benchmark: เวลา import / RAM ตอนโหลดโมเดล (แบบ mmap vs โหลดเข้า memory ทั้งก้อน) ---
+STARTUP_SCRIPT = """
+import resource, sys, time
+start = time.perf_counter()
+import scraper
+import_seconds = time.perf_counter() - start
+import_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+scraper.MODEL_MMAP_MODE = sys.argv[1] if sys.argv[1] != "none" else None
+start = time.perf_counter()
+# เรียกโมเดลตรง ๆ: ถ้าผ่าน classify_product_names ชื่อที่ keyword ตัดสินได้จะไม่โหลดโมเดลเลย
+classifier = scraper.get_category_classifier()
+if classifier is None:
+    sys.exit(2)
+classifier.predict(["ปูนซีเมนต์ผสม"])
+classify_seconds = time.perf_counter() - start
+pss = 0
+try:
+    with open("/proc/self/smaps_rollup") as f:
+        pss = next(int(line.split()[1]) for line in f if line.startswith("Pss:"))
+except (OSError, StopIteration):
+    pass
+print("RESULT", import_seconds, import_rss, classify_seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, pss, flush=True)
+sys.stdin.read() # รอจนทุก worker โหลดเสร็จ ค่า Pss จะได้นับหน้าที่ใช้ร่วมกันถูกต้อง
+"""
+
+def bench_startup(args):
+    env = dict(os.environ, SUPABASE_URL="", SUPABASE_KEY="") # ต้องทำงานได้โดยไม่มี key
+    print(f"\n=== Startup: {args.workers} worker process ต่อโหมด ===")
+    results = {}
+    for mode in ("r", "none"):
+        with tempfile.TemporaryDirectory() as state_dir:
+            env["TGO_STATE_DIR"] = state_dir
+            procs = [subprocess.Popen([sys.executable, "-c", STARTUP_SCRIPT, mode], stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env, text=True)
+                     for _ in range(args.workers)]
+            rows = []
+            for proc in procs:
+                line = proc.stdout.readline()
+                while line and not line.startswith("RESULT"):
+                    line = proc.stdout.readline()
+                if not line:
+                    raise SystemExit("❌ worker โหลดโมเดลไม่สำเร็จ ผล startup จะไม่ได้วัดเวลาโหลดโมเดล"
+                                     f" (ตรวจว่ามี {scraper.MODEL_PATH} หรือรัน python train_model.py ก่อน)")
+                rows.append([float(x) for x in line.split()[1:]])
+            for proc in procs:
+                proc.communicate("")
+        import_s, import_rss, classify_s, rss, pss = (sum(col) / len(col) for col in zip(*rows))
+        total_pss = sum(row[4] for row in rows)
+        results[f"mmap_{mode}"] = {"import_s": import_s, "import_rss_mib": import_rss / 1024,
+                                   "first_classify_s": classify_s, "rss_mib": rss / 1024,
+                                   "total_pss_mib": total_pss / 1024}
+        print(f"  mmap_mode={mode:<5} import {import_s:.2f}s (RSS {import_rss / 1024:.0f} MiB)"
+              f" | โหลดโมเดล+จัดหมวดแรก {classify_s:.2f}s | RSS {rss / 1024:.0f} MiB/process"
+              f" | Pss รวม {total_pss / 1024:.0f} MiB")
+    return results
+
+# --- 10. Benchmark: ส่งข้อมูลทั้งก้อนแบบเดิม vs ตัวส่งเบื้องหลัง (กับ Supabase stub ที่ช้า + error บางครั้ง) ---
+def make_products(count):
+    page = make_catalog_html(count, names=load_training_names())
+    return scraper.PARSER_BACKENDS["bs4" if scraper.lxml_html is None else "lxml"](page, 2024, 1)
+
+def bench_upload(args):
+    products = make_products(args.rows)
+    batches = [products[i:i + args.batch] for i in range(0, len(products), args.batch)]
+    results = {}
+    print(f"\n=== Upload: {len(products)} แถว ({len(batches)} งาน), stub หน่วง {args.latency}s,"
+          f" error {args.failure_rate:.0%} ===")
+
+    with SupabaseStub(args.latency, args.failure_rate) as stub:
+        scraper._supabase_client = stub.client()
+        with timed(results, "sync"):
+            ok = sum(scraper.upload_to_supabase(batch) for batch in batches)
+        print(f"  sync: ส่งสำเร็จ {ok}/{len(batches)} งาน, แถวใน stub {len(stub.rows)}")
+
+    with SupabaseStub(args.latency, args.failure_rate) as stub, tempfile.TemporaryDirectory() as tmp:
+        scraper._supabase_client = stub.client()
+        dead_letter = os.path.join(tmp, "dead.jsonl")
+        with timed(results, "background"):
+            started = time.perf_counter()
+            uploader = scraper.BackgroundUploader(max_rows=args.chunk_rows, backoff_seconds=0.05,
+                                                  dead_letter_path=dead_letter)
+            for batch in batches:
+                uploader(batch)
+            queued_seconds = time.perf_counter() - started
+            uploader.close()
+        print(f"  background: ส่งงานเข้าคิวหมดใน {queued_seconds:.2f}s"
+              f" (เวลาที่ตัวดึงหน้าต้องรอ), แถวใน stub {len(stub.rows)}, stub ตอบ error {stub.failures} ครั้ง")
+        if uploader.stats["dead_rows"]:
+            stub.failure_rate = 0.0
+            scraper.replay_dead_letters(dead_letter)
+            print(f"  replay dead-letter แล้ว แถวใน stub {len(stub.rows)}")
+        complete = len(stub.rows) == len({p["product_id"] for p in products})
+        print(f"  ข้อมูลครบทุกแถว: {'✅' if complete else '❌'}")
+    scraper._supabase_client = None
+
+    for name, seconds in results.items():
+        print(f"  {name:<12} {seconds:8.2f} s  ({len(products) / seconds:8.0f} แถว/วินาที)")
+    return results
+
+# --- 11. ชุด benchmark รวม (parse -> classify -> upload) เขียนผลเป็น JSON ไว้เทียบข้าม commit ---
+# metric แต่ละตัวเก็บเป็น {"value", "unit", "better": "higher"|"lower"} เพื่อให้ compare รู้ว่าทิศไหนคือช้าลง
+# [ใหม่] metric ที่จับเวลาเก็บ repeat / size (ขนาด input) / spread (ความแกว่งระหว่างรอบ) ไว้ด้วย
+# compare ใช้สามค่านี้ตัดสินว่า metric ไหนเชื่อถือได้พอจะ gate (ค่าที่ไม่ได้จับเวลา เช่น RAM/ขนาดไฟล์ ไม่มี repeat)
+def metric(value, unit, better, repeat=None, size=None, spread=0.0):
+    result = {"value": value, "unit": unit, "better": better}
+    if repeat is not None:
+        result.update(repeat=repeat, size=size, spread=spread)
+    return result
+
+def measure(func, repeat):
+    """เรียก func() `repeat` ครั้ง คืน (เวลามัธยฐาน, spread, ผลลัพธ์ครั้งสุดท้าย)
+    spread = ช่วงควอไทล์ (p75 - p25) / มัธยฐาน ใช้บอกว่าเครื่องแกว่งแค่ไหนระหว่างรอบ"""
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    median = times[len(times) // 2]
+    spread = (times[(3 * len(times)) // 4] - times[len(times) // 4]) / median if median else 0.0
+    return median, spread, result
+
+def median_seconds(func, repeat):
+    """เรียก func() `repeat` ครั้ง คืนเวลามัธยฐาน (ลดผลของ noise จากเครื่อง) และผลลัพธ์ของครั้งสุดท้าย"""
+    median, _, result = measure(func, repeat)
+    return median, result
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def suite_parse(metrics, names, args):
+    for rows in args.rows:
+        page = make_catalog_html(rows, names=names)
+        for backend, parse_rows in scraper.PARSER_BACKENDS.items():
+            if backend == "bs4" and rows > args.bs4_max_rows:
+                continue
+            seconds, spread, parsed = measure(lambda: parse_rows(page, 2024, 1), args.repeat)
+            metrics[f"parse.{backend}.{rows}_rows"] = metric(len(parsed) / seconds, "rows/s", "higher",
+                                                             args.repeat, rows, spread)
+        # ทั้งขั้นตอน (เลือก backend + จัดหมวดหมู่ + กรอง) แคชหมวดหมู่อุ่นแล้ว จะได้วัดเฉพาะงาน parse
+        with contextlib.redirect_stdout(None):
+            scraper.parse_product_data(page, 2024, 1)
+            seconds, spread, parsed = measure(lambda: scraper.parse_product_data(page, 2024, 1), args.repeat)
+        metrics[f"parse_product_data.{rows}_rows"] = metric(len(parsed) / seconds, "rows/s", "higher",
+                                                            args.repeat, rows, spread)
+        print(f"  parse {rows:>6} แถว: " + " | ".join(
+            f"{key.split('.')[-2] if key.startswith('parse.') else 'parse_product_data'} {metrics[key]['value']:9.0f}"
+            for key in metrics if key.endswith(f".{rows}_rows")) + " แถว/วินาที")
+
+    # RAM สูงสุดตอน parse หน้าใหญ่สุด (tracemalloc นับเฉพาะ object ของ Python ไม่รวม buffer ของ libxml2)
+    for backend, parse_rows in scraper.PARSER_BACKENDS.items():
+        rows = max(args.rows) if backend != "bs4" else min(max(args.rows), args.bs4_max_rows)
+        page = make_catalog_html(rows, names=names)
+        tracemalloc.start()
+        parse_rows(page, 2024, 1)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        metrics[f"memory.parse.{backend}.{rows}_rows"] = metric(peak / 2**20, "MiB", "lower")
+        print(f"  RAM สูงสุด {backend} ({rows} แถว): {peak / 2**20:.1f} MiB")
+
+def suite_classify(metrics, names, args):
+    classifier = scraper.get_category_classifier()
+    if classifier is None:
+        print("  ⚠️ ไม่พบโมเดล ข้ามการวัด classifier (รัน python train_model.py ก่อน)")
+        return
+    sample = names[:args.names]
+    seconds, spread, _ = measure(lambda: [classifier.predict([name]) for name in sample], args.repeat)
+    metrics["classify.per_row"] = metric(seconds / len(sample) * 1e6, "µs/row", "lower",
+                                         args.repeat, len(sample), spread)
+    for batch in args.batch_sizes:
+        chunks = [sample[i:i + batch] for i in range(0, len(sample), batch)]
+        seconds, spread, _ = measure(lambda: [classifier.predict(chunk) for chunk in chunks], args.repeat)
+        metrics[f"classify.batch_{batch}"] = metric(seconds / len(sample) * 1e6, "µs/row", "lower",
+                                                    args.repeat, len(sample), spread)
+    print("  classifier: " + " | ".join(f"{key.split('.')[1]} {m['value']:.1f} µs/แถว"
+                                        for key, m in metrics.items() if key.startswith("classify.")))
+
+def suite_upload(metrics, names, args):
+    products = scraper.PARSER_BACKENDS["bs4" if scraper.lxml_html is None else "lxml"](
+        make_catalog_html(args.upload_rows, names=names), 2024, 1)
+    batches = [products[i:i + 250] for i in range(0, len(products), 250)]
+    with SupabaseStub() as stub, tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(None):
+        scraper._supabase_client = stub.client()
+        seconds, spread, _ = measure(lambda: [scraper.upsert_materials(batch) for batch in batches], args.repeat)
+        metrics["upload.sync"] = metric(len(products) / seconds, "rows/s", "higher",
+                                        args.repeat, len(products), spread)
+
+        def background():
+            uploader = scraper.BackgroundUploader(dead_letter_path=os.path.join(tmp, "dead.jsonl"))
+            for batch in batches:
+                uploader(batch)
+            uploader.close()
+        seconds, spread, _ = measure(background, args.repeat)
+        metrics["upload.background"] = metric(len(products) / seconds, "rows/s", "higher",
+                                              args.repeat, len(products), spread)
+    scraper._supabase_client = None
+    print(f"  upload ({len(products)} แถว): sync {metrics['upload.sync']['value']:.0f}"
+          f" | background {metrics['upload.background']['value']:.0f} แถว/วินาที")
+
+def suite_train(metrics, args):
+    """เวลาเทรน + ขนาดไฟล์โมเดล (รัน train_model.py ในโฟลเดอร์ชั่วคราว ไม่ทับโมเดลที่ใช้อยู่)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        os.symlink(os.path.join(here, "training_data.csv"), os.path.join(tmp, "training_data.csv"))
+        for mode, prefix in (("tfidf", "train"), ("hashed", "train.hashed")):
+            output = os.path.join(tmp, f"{mode}.joblib")
+            start = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(here, "train_model.py"), "--mode", mode, "--output", output],
+                           cwd=tmp, check=True, stdout=subprocess.DEVNULL)
+            # เทรนรอบเดียว (repeat=1) จึงแสดงผลอย่างเดียว ไม่ใช้ gate
+            metrics[f"{prefix}.seconds"] = metric(time.perf_counter() - start, "s", "lower", 1, None)
+            metrics[f"{prefix}.model_size"] = metric(os.path.getsize(output) / 2**20, "MiB", "lower")
+            print(f"  train_model.py --mode {mode}: {metrics[f'{prefix}.seconds']['value']:.1f}s,"
+                  f" ไฟล์โมเดล {metrics[f'{prefix}.model_size']['value']:.2f} MiB")
+
+def bench_suite(args):
+    names = load_training_names()
+    metrics = {}
+    print(f"\n=== Benchmark suite (ค่ามัธยฐานจาก {args.repeat} รอบ) ===")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # แคชหมวดหมู่แยกไว้ชั่วคราว ไม่ให้ผลจากการรันจริงมาปน
+        scraper._category_cache = scraper.CategoryCache(scraper.model_fingerprint(),
+                                                        path=os.path.join(cache_dir, "cache.sqlite"))
+        suite_parse(metrics, names, args)
+        scraper._category_cache = None
+    suite_classify(metrics, names, args)
+    suite_upload(metrics, names, args)
+    if not args.skip_train:
+        suite_train(metrics, args)
+
+    result = {"revision": git_revision(), "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": sys.version.split()[0], "repeat": args.repeat, "metrics": metrics}
+    output = args.output or os.path.join(scraper.STATE_DIR, "benchmarks", f"{result['revision']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"บันทึกผลไว้ที่ {output}")
+    return result
+
+# [ใหม่] เกณฑ์ขั้นต่ำของ metric ที่จับเวลาก่อนจะใช้ตัดสิน (รันโค้ดเดิมซ้ำสองครั้ง หน้า 10/100 แถว
+# กับรอบน้อย ๆ แกว่งได้ 14-57% เพราะเวลาต่อรอบสั้นจน timer/GC/scheduler กลบงานจริง)
+GATE_MIN_REPEAT = 5
+GATE_MIN_SIZE = 1000
+GATE_NOISE_FACTOR = 3.0  # threshold ของแต่ละ metric = max(threshold, spread ที่มากกว่าของสองฝั่ง x ค่านี้)
+
+def gate_threshold(old, new, threshold):
+    """threshold ที่ใช้กับ metric นี้ หรือ None ถ้า metric นี้ noise เกินกว่าจะใช้ตัดสิน
+    (รอบน้อยกว่า GATE_MIN_REPEAT หรือ input เล็กกว่า GATE_MIN_SIZE)"""
+    if "repeat" not in new:
+        return threshold  # ค่าที่ไม่ได้จับเวลา (RAM, ขนาดไฟล์) ไม่แกว่ง
+    if min(old.get("repeat") or 0, new["repeat"]) < GATE_MIN_REPEAT:
+        return None
+    if min(old.get("size") or 0, new["size"] or 0) < GATE_MIN_SIZE:
+        return None
+    return max(threshold, GATE_NOISE_FACTOR * max(old.get("spread", 0.0), new.get("spread", 0.0)))
+
+def compare_results(baseline, current, threshold):
+    """คืน [(ชื่อ, ค่าเดิม, ค่าใหม่, สัดส่วนที่แย่ลง, threshold ที่ใช้)] ของ metric ที่แย่ลงเกิน threshold
+    (0.1 = 10%) เฉพาะ metric ที่ผ่านเกณฑ์ gate_threshold"""
+    regressions = []
+    for name, new in current["metrics"].items():
+        old = baseline["metrics"].get(name)
+        if not old or not old["value"] or not new["value"]:
+            continue
+        limit = gate_threshold(old, new, threshold)
+        if limit is None:
+            continue
+        if new["better"] == "higher":
+            worse = old["value"] / new["value"] - 1
+        else:
+            worse = new["value"] / old["value"] - 1
+        if worse > limit:
+            regressions.append((name, old["value"], new["value"], worse, limit))
+    return regressions
+
+def bench_compare(args):
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    print(f"\n=== เทียบ {baseline['revision']} -> {current['revision']} (threshold {args.threshold:.0%}) ===")
+    for name, new in current["metrics"].items():
+        old = baseline["metrics"].get(name)
+        if old and old["value"]:
+            limit = gate_threshold(old, new, args.threshold)
+            note = "ไม่ gate (noise)" if limit is None else f"gate {limit:.0%}"
+            print(f"  {name:<32} {old['value']:12.2f} -> {new['value']:12.2f} {new['unit']:<7}"
+                  f" ({new['value'] / old['value'] - 1:+.0%}) {note}")
+    regressions = compare_results(baseline, current, args.threshold)
+    if regressions:
+        for name, old, new, worse, limit in regressions:
+            print(f"  ❌ {name} แย่ลง {worse:.0%} เกิน {limit:.0%} ({old:.2f} -> {new:.2f})")
+        raise SystemExit(1)
+    print("  ✅ ไม่มี metric ไหนแย่ลงเกิน threshold")
+
+# --- 12. Benchmark: ดึงหน้ารายละเอียดทีละหน้า vs พร้อมกัน (aiohttp) + แคช + retry ---
+def make_detail_html(i):
+    """หน้ารายละเอียดปลอม: ตารางหัวข้อ/ค่า + <dl> (รูปแบบที่ parse_detail_fields อ่าน)"""
+    return f"""<!DOCTYPE html><html><head><meta charset="utf-8"></head><body>
+<table class="detail"><tr><th>เลขทะเบียน :</th><td>TGO-{i:05d}</td></tr>
+<tr><th>วัตถุดิบหลัก</th><td>วัสดุ  {i % 7}</td></tr><tr><td colspan="2">หมายเหตุยาว ๆ</td></tr>
+<tr><th>ที่ตั้งโรงงาน:</th><td>จังหวัด {i % 77}</td></tr></table>
+<dl><dt>ผู้ทวนสอบ</dt><dd>หน่วยงาน {i % 5}</dd><dt>เลขทะเบียน</dt><dd>ซ้ำ (ไม่ใช้)</dd></dl>
+</body></html>"""
+
+def expected_detail_fields(i):
+    return {"เลขทะเบียน": f"TGO-{i:05d}", "วัตถุดิบหลัก": f"วัสดุ {i % 7}", "ที่ตั้งโรงงาน": f"จังหวัด {i % 77}",
+            "ผู้ทวนสอบ": f"หน่วยงาน {i % 5}"}
+
+def bench_detail(args):
+    products = make_products(args.pages)
+    for i, product in enumerate(products):
+        product["detail_page_url"] = f"/detail?id={i}"
+    pages = {f"/detail?id={i}": make_detail_html(i) for i in range(len(products))}
+    results = {}
+    print(f"\n=== หน้ารายละเอียด: {len(products)} หน้า, server หน่วง {args.latency}s ===")
+
+    def check(label):
+        wrong = sum(p["detail_fields"] != expected_detail_fields(i) for i, p in enumerate(products))
+        print(f"  {label}: field ถูกต้อง {len(products) - wrong}/{len(products)} แถว")
+
+    for name, concurrency in (("one_at_a_time", 1), (f"concurrent_{args.concurrency}", args.concurrency)):
+        with CatalogServer(pages, latency=args.latency) as srv, contextlib.redirect_stdout(None):
+            enricher = scraper.DetailEnricher(base_url=srv.base_url, concurrency=concurrency, per_host_rps=0)
+            with timed(results, name):
+                enricher.enrich(products)
+            enricher.close()
+        check(name)
+
+    with CatalogServer(pages, latency=args.latency, failure_rate=args.failure_rate) as srv, \
+            tempfile.TemporaryDirectory() as tmp:
+        cache = scraper.DetailCache(os.path.join(tmp, "details.sqlite"))
+        enricher = scraper.DetailEnricher(base_url=srv.base_url, concurrency=args.concurrency,
+                                          per_host_rps=args.rps, backoff_seconds=0.05, retries=6, cache=cache)
+        with contextlib.redirect_stdout(None), timed(results, f"with_{args.failure_rate:.0%}_errors"):
+            enricher.enrich(products)
+        check(f"server error {args.failure_rate:.0%} (retry {enricher.stats['retries']} ครั้ง)")
+        hits_before = srv.hits
+        with contextlib.redirect_stdout(None), timed(results, "cached"):
+            enricher.enrich(products)
+        print(f"  รอบที่สอง (แคช): ยิง server เพิ่ม {srv.hits - hits_before} ครั้ง")
+        enricher.close()
+
+    for name, seconds in results.items():
+        print(f"  {name:<18} {seconds:7.2f} s  ({len(products) / seconds:8.1f} หน้า/วินาที)")
+    return results
+
+# --- 13. Benchmark: ค้นหาด้วยดัชนี n-gram + จำนวนตามหมวดที่ publish ไว้ vs สแกนทั้งตาราง (แบบ ilike) ---
+def make_published_rows(count, names):
+    rng = random.Random(1)
+    labels = ("CFP", "CFR")
+    categories = sorted(scraper.CATEGORIES_KEYWORDS) + [scraper.DEFAULT_CATEGORY]
+    return [{"product_id": f"TGO-{i:06d}", "label_type": labels[i % 2], "category": rng.choice(categories),
+             "product_name": names[i % len(names)], "company_name": f"บริษัท ตัวอย่าง {rng.randrange(300)} จำกัด"}
+            for i in range(count)]
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def bench_search(args):
+    names = load_training_names()
+    rows = make_published_rows(args.rows, names)
+    rng = random.Random(2)
+    queries = []
+    while len(queries) < args.queries:
+        text = scraper.search_text(rng.choice(rows))
+        length = rng.randint(3, 10)
+        start = rng.randrange(max(1, len(text) - length))
+        query = text[start:start + length].strip()
+        if len(query) >= scraper.SEARCH_NGRAM: queries.append(query)
+    queries += ["ไม่มีสินค้านี้แน่นอน", "xyzxyz"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        stats = scraper.publish_static(rows, tmp)
+        publish_seconds = time.perf_counter() - start
+        print(f"\n=== ค้นหา: {len(rows)} แถว, {len(queries)} คำค้น ===")
+        print(f"  publish {publish_seconds:.2f}s | {stats['ngrams']} n-gram | ไฟล์รวม {stats['bytes'] / 2**20:.2f} MiB")
+
+        # ตัวแทน ilike '%q%' ของ Postgres ที่ไม่มีดัชนี: SQLite สแกนทุกแถวหา substring
+        db = sqlite3.connect(":memory:")
+        db.execute("CREATE TABLE materials (product_id TEXT PRIMARY KEY, label_type TEXT, category TEXT, text TEXT)")
+        db.executemany("INSERT INTO materials VALUES (?, ?, ?, ?)",
+                       [(r["product_id"], r["label_type"], r["category"], scraper.search_text(r)) for r in rows])
+        text_by_id = {r["product_id"]: scraper.search_text(r) for r in rows}
+
+        index = scraper.SearchIndex(tmp)
+        scan_times, index_times, mismatches, cold = [], [], 0, None
+        for query in queries:
+            key = scraper.normalize_product_name(query)
+            start = time.perf_counter()
+            expected = [pid for (pid,) in db.execute(
+                "SELECT product_id FROM materials WHERE instr(text, ?) > 0 ORDER BY product_id", (key,))]
+            scan_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            # ดัชนีให้ผู้สมัคร -> ตรวจกับข้อความจริง (หน้าเว็บตรวจกับแถวที่ดึงด้วย product_id)
+            found = [pid for pid in index.candidates(query) if key in text_by_id[pid]]
+            index_times.append(time.perf_counter() - start)
+            if cold is None: cold = index_times[-1]
+            mismatches += found != expected
+        print(f"  สแกนทั้งตาราง (ilike): p50 {percentile(scan_times, 0.5) * 1000:7.2f} ms"
+              f" | p95 {percentile(scan_times, 0.95) * 1000:7.2f} ms")
+        print(f"  ดัชนี n-gram:          p50 {percentile(index_times, 0.5) * 1000:7.2f} ms"
+              f" | p95 {percentile(index_times, 0.95) * 1000:7.2f} ms (ครั้งแรกรวมโหลด shard {cold * 1000:.1f} ms)")
+        print(f"  ผลลัพธ์ตรงกับการสแกน: {'✅' if not mismatches else f'❌ ต่างกัน {mismatches} คำค้น'}")
+
+        # เมนูหมวดหมู่: select category ทุกแถวของ label แล้วตัดซ้ำ vs อ่านจากจำนวนที่ publish ไว้
+        start = time.perf_counter()
+        for label in ("CFP", "CFR"):
+            scanned = sorted({c for (c,) in db.execute("SELECT category FROM materials WHERE label_type=?", (label,))})
+        scan_menu = time.perf_counter() - start
+        start = time.perf_counter()
+        with open(os.path.join(tmp, "category_counts.json"), encoding="utf-8") as f:
+            counts = json.load(f)
+        for label in ("CFP", "CFR"):
+            published = sorted(c["category"] for c in counts if c["label_type"] == label)
+        published_menu = time.perf_counter() - start
+        print(f"  เมนูหมวดหมู่: select ทุกแถว+ตัดซ้ำ {scan_menu * 1000:.2f} ms | จากไฟล์ publish {published_menu * 1000:.2f} ms"
+              f" ({'✅ ตรงกัน' if scanned == published else '❌ ไม่ตรง'})")
+        if mismatches: raise SystemExit(1)
+
+    # ทั้งขั้นตอนแบบที่รันหลังจบรอบ: อ่านทุกแถวกลับจาก Supabase (stub) ทีละหน้า แล้วเขียนไฟล์
+    with SupabaseStub() as stub, tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(None):
+        stub.rows = {row["product_id"]: row for row in rows}
+        scraper._supabase_client = stub.client()
+        start = time.perf_counter()
+        stats = scraper.run_publish_stage(tmp)
+        seconds = time.perf_counter() - start
+        scraper._supabase_client = None
+    print(f"  run_publish_stage (อ่านจาก Supabase stub {stub.requests} request + เขียนไฟล์): {seconds:.2f}s,"
+          f" {stats['rows']} แถว")
+
+# --- 14. Benchmark: สำเนารูปสินค้า + thumbnail (ดาวน์โหลดทีละรูป vs พร้อมกัน, ตัดรูปซ้ำ, รันซ้ำไม่ดาวน์โหลด) ---
+def make_sample_images(count, size=(800, 600)):
+    """รูปตัวอย่าง `count` แบบ สลับ PNG (โปร่งใส) / JPEG / GIF ขนาดต่างกันเล็กน้อย คืน [(bytes, (w, h))]"""
+    from PIL import Image
+    images = []
+    for i in range(count):
+        width, height = size[0] + 37 * i, size[1] - 23 * i
+        fmt = ("PNG", "JPEG", "GIF")[i % 3]
+        image = Image.new("RGBA" if fmt == "PNG" else "RGB", (width, height), (40 * i % 256, 160, 90, 200))
+        buffer = scraper.io.BytesIO()
+        image.save(buffer, format=fmt)
+        images.append((buffer.getvalue(), (width, height)))
+    return images
+
+def bench_images(args):
+    try:
+        from PIL import Image
+    except ImportError:
+        raise SystemExit("ต้องติดตั้ง Pillow ก่อน (pip install Pillow)")
+    samples = make_sample_images(args.distinct)
+    # หลาย URL ชี้รูปเดียวกัน (โลโก้ฉลากที่ทุกสินค้าใช้ร่วมกัน) + หน้า error ที่ไม่ใช่รูป 1 URL
+    pages = {f"/img/{u}.bin": samples[u % len(samples)][0] for u in range(args.urls)}
+    pages["/img/broken.bin"] = "<html>not an image</html>"
+    products = make_products(args.products)
+    for i, product in enumerate(products):
+        product["image_url"] = "N/A" if i % 10 == 9 else (
+            "/img/broken.bin" if i % 97 == 0 else f"/img/{i % args.urls}.bin")
+    results = {}
+    print(f"\n=== สำเนารูป: {len(products)} รายการ, {args.urls} URL, เนื้อรูปไม่ซ้ำ {len(samples)} แบบ,"
+          f" server หน่วง {args.latency}s ===")
+
+    def check(label, rows):
+        wrong = 0
+        for i, product in enumerate(rows):
+            url = products[i]["image_url"]
+            if url.endswith("broken.bin") or url == "N/A":
+                wrong += product["image_mirror_path"] is not None
+                continue
+            expected = samples[int(url.rsplit("/", 1)[1].split(".")[0]) % len(samples)][1]
+            with Image.open(product["image_thumb_path"]) as thumb:
+                thumb_size = thumb.size
+            wrong += ((product["image_width"], product["image_height"]) != expected
+                      or thumb_size != scraper.THUMBNAIL_SIZE or not os.path.exists(product["image_mirror_path"]))
+        print(f"  {label}: ขนาด/path ถูกต้อง {len(rows) - wrong}/{len(rows)} แถว")
+        return wrong
+
+    wrong = 0
+    cwd = os.getcwd()
+    with CatalogServer(pages, latency=args.latency) as srv:
+        for product in products:
+            if product["image_url"] != "N/A": product["image_url"] = srv.base_url + product["image_url"]
+        for name, workers in (("one_at_a_time", 1), (f"parallel_{args.workers}", args.workers)):
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp) # path ที่บันทึกในแถวเป็น relative จาก root ของเว็บ (เหมือน data/images/...)
+                mirror = scraper.ImageMirror(root="images", index_path="mirror.sqlite", workers=workers, max_rps=0)
+                try:
+                    rows = [dict(p) for p in products]
+                    with contextlib.redirect_stdout(None), timed(results, name):
+                        mirror.mirror(rows)
+                    wrong += check(name, rows)
+                    files = sum(len(f) for _, _, f in os.walk("images/full"))
+                    print(f"    ดาวน์โหลด {mirror.stats['downloaded']} | เนื้อรูปซ้ำ {mirror.stats['deduped']}"
+                          f" | ไฟล์รูปเต็มที่เก็บ {files} | ล้มเหลว {mirror.stats['failed']}")
+                    hits_before = srv.hits
+                    rows = [dict(p) for p in products]
+                    with contextlib.redirect_stdout(None), timed(results, f"{name}_rerun"):
+                        mirror.mirror(rows)
+                    print(f"    รันซ้ำ: ยิง server เพิ่ม {srv.hits - hits_before} ครั้ง"
+                          f" (มีอยู่แล้ว {mirror.stats['already_mirrored']} URL, ที่เหลือคือ URL เสียที่ลองใหม่)")
+                    wrong += check(f"{name} รันซ้ำ", rows)
+                finally:
+                    mirror.close()
+                    os.chdir(cwd)
+
+    for name, seconds in results.items():
+        print(f"  {name:<20} {seconds:7.2f} s")
+    if wrong: raise SystemExit(1)
+    return results
+
+# --- 15. Benchmark: รอจนจำนวนแถวนิ่ง vs sleep 5 วินาที + ทะเบียนไตรมาสว่าง (รันซ้ำหลายรอบ) ---
+class GrowingTableDriver:
+    """แทน WebDriver: ตารางค่อย ๆ เพิ่มแถวทีละ `step` ทุก `interval` วินาที จนครบ `rows` แถว"""
+    def __init__(self, rows, step=10, interval=0.2):
+        self.rows, self.step, self.interval = rows, step, interval
+        self.started = time.monotonic()
+
+    def execute_script(self, script):
+        batches = int((time.monotonic() - self.started) / self.interval) + 1
+        return min(self.rows, batches * self.step)
+
+def bench_waits(args):
+    print(f"\n=== รอตารางโหลด: แถวเพิ่มทีละ 10 ทุก {args.row_interval}s ===")
+    for rows in args.rows:
+        driver = GrowingTableDriver(rows, interval=args.row_interval)
+        start = time.perf_counter()
+        got = scraper.wait_for_stable_rows(driver)
+        seconds = time.perf_counter() - start
+        print(f"  {rows:>4} แถว: รอจนนิ่ง {seconds:5.2f}s ได้ {got} แถว {'✅' if got == rows else '❌ ขาดแถว'}"
+              f" | แบบเดิม sleep {scraper.PAGE_SETTLE_MAX_SECONDS}s")
+        if got != rows: raise SystemExit(1)
+
+    tasks = scraper.build_period_tasks(args.start_year, args.end_year)
+    pages = make_period_pages(tasks, rows=args.page_rows, empty_every=3)
+    print(f"\n=== ทะเบียนไตรมาสว่าง: {len(tasks)} งาน (ว่าง 1 ใน 3), server หน่วง {args.latency}s/หน้า ===")
+    with CatalogServer(pages, latency=args.latency) as srv, tempfile.TemporaryDirectory() as tmp:
+        registry = scraper.EmptyPeriodRegistry(os.path.join(tmp, "empty.sqlite"))
+        baseline = None
+        for run in range(1, args.runs + 1):
+            hits_before = srv.hits
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(None):
+                summary, _ = scraper.run_period_tasks(tasks, http_only_fetch, workers=1, max_rps=0, upload=None,
+                                                      base_url=srv.base_url, empty_periods=registry)
+            seconds = time.perf_counter() - start
+            baseline = baseline or summary["products"]
+            print(f"  รอบที่ {run}: {seconds:5.2f}s | ยิง server {srv.hits - hits_before} ครั้ง"
+                  f" | ข้ามไตรมาสว่าง {summary['known_empty']} | ได้ {summary['products']} แถว"
+                  f" {'✅' if summary['products'] == baseline else '❌ ขาดแถว'}")
+            if summary["products"] != baseline: raise SystemExit(1)
+        print(f"  ยืนยันแล้วว่าว่าง {registry.count_confirmed()} ไตรมาส"
+              f" | timeout HTTP ที่เรียนรู้: {scraper.LATENCY.timeout('http', scraper.HTTP_TIMEOUT_SECONDS, minimum=10):.0f}s"
+              f" (เดิม {scraper.HTTP_TIMEOUT_SECONDS}s)")
+
+# --- 16. Benchmark: snapshot Parquet (ครบทุกแถว, ใช้ partition เดิมเมื่อหน้าไม่เปลี่ยน, diff, query เฉพาะคอลัมน์) ---
+def bench_snapshot(args):
+    try:
+        scraper._import_pyarrow()
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    tasks = scraper.build_period_tasks(args.start_year, args.end_year)
+    pages = make_period_pages(tasks, rows=args.rows)
+    with_data = [t for t in tasks if period_path(t) in pages]
+    problems = []
+    print(f"\n=== Snapshot: {len(tasks)} งาน ({len(with_data)} งานมีข้อมูล x {args.rows} แถว) รัน 3 รอบ ===")
+    with tempfile.TemporaryDirectory() as tmp, CatalogServer(pages) as srv:
+        root = os.path.join(tmp, "snapshots")
+        manifest = scraper.ScrapeManifest(os.path.join(tmp, "manifest.sqlite"))
+        metas = []
+        for run in range(3):
+            expected = len(with_data) * args.rows
+            if run == 2:
+                # รอบที่ 3: งานแรกมีสินค้าเพิ่ม 5 แถว, งานที่สองหายไป 3 แถว, งานที่สามค่าคาร์บอนแถวแรกเปลี่ยน
+                for task, rows in ((with_data[0], args.rows + 5), (with_data[1], args.rows - 3)):
+                    pages[period_path(task)] = make_catalog_html(rows, label=task["label"], year=task["year"],
+                                                                 quarter=task["quarter"])
+                edit = period_path(with_data[2])
+                pages[edit] = pages[edit].replace("<span>7.25 <i>", "<span>9.99 <i>", 1)
+                expected += 5 - 3
+            run_id, _ = manifest.start_run()
+            writer = scraper.SnapshotWriter(f"run-{run_id:05d}", root=root, run_id=run_id)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(None):
+                scraper.run_period_tasks(tasks, http_only_fetch, max_rps=0, upload=CountingUpload(),
+                                         base_url=srv.base_url, manifest=manifest, run_id=run_id, snapshot=writer)
+            manifest.finish_run(run_id)
+            meta = writer.finish()
+            metas.append(meta)
+            stored = scraper.load_snapshot(meta["snapshot_id"], columns=["product_id"], root=root).num_rows
+            print(f"  รอบที่ {run + 1}: {time.perf_counter() - start:5.2f}s | snapshot {stored} แถว (ควรได้ {expected})"
+                  f" | ใช้ partition รอบก่อน {meta['carried_forward']}/{meta['partitions']} | {meta['bytes'] / 1024:.0f} KiB")
+            if stored != expected: problems.append(f"รอบที่ {run + 1} ได้ {stored} แถว ควรได้ {expected}")
+
+        diff = scraper.diff_snapshots(metas[1]["snapshot_id"], metas[2]["snapshot_id"], root=root)
+        changed = {pid: sorted(c) for pid, c in diff["changed"].items()}
+        print(f"  diff รอบ 2 -> 3: เพิ่ม {len(diff['added'])} | หายไป {len(diff['removed'])} | เปลี่ยน {changed}")
+        if (len(diff["added"]), len(diff["removed"]), list(changed.values())) != (5, 3, [["carbon_value"]]):
+            problems.append("diff ไม่ตรงกับที่แก้หน้า (ควรได้ เพิ่ม 5 / หาย 3 / carbon_value เปลี่ยน 1)")
+        schema = scraper.load_snapshot(root=root, columns=["carbon_value", "cert_start_date"]).schema
+        print(f"  ชนิดคอลัมน์: carbon_value={schema.field('carbon_value').type},"
+              f" cert_start_date={schema.field('cert_start_date').type}")
+
+    # query: อ่านเฉพาะคอลัมน์/partition ที่ต้องการ เทียบกับโหลดทั้งตาราง (แทนการดึง materials ทั้งหมดมาเป็น JSON)
+    page = make_catalog_html(args.query_rows, names=load_training_names())
+    base_rows = scraper.PARSER_BACKENDS["lxml" if scraper.lxml_html is not None else "bs4"](page, 2024, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = scraper.SnapshotWriter("big", root=tmp)
+        all_rows = []
+        for year in range(2557, 2567):
+            for quarter in range(1, 5):
+                for label in ("CFP", "CFR"):
+                    rows = [dict(r, product_id=f"{label}-{year}{quarter}-{i}") for i, r in enumerate(base_rows)]
+                    writer.write_partition(label, year, quarter, rows)
+                    all_rows += [dict(r, label=label, year=year, quarter=quarter) for r in rows]
+        writer.finish()
+        json_path = os.path.join(tmp, "materials.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(all_rows, f, ensure_ascii=False)
+
+        def scan_json():
+            with open(json_path, encoding="utf-8") as f:
+                rows = json.load(f)
+            return [r["carbon_value"] for r in rows if r["label"] == "CFP" and r["year"] == 2566]
+
+        def query_snapshot():
+            return scraper.load_snapshot("big", root=tmp, columns=["carbon_value"], labels=["CFP"],
+                                         years=[2566]).column("carbon_value").to_pylist()
+
+        json_seconds, scanned = median_seconds(scan_json, args.repeat)
+        snapshot_seconds, queried = median_seconds(query_snapshot, args.repeat)
+        if sorted(scanned) != sorted(queried): problems.append("query snapshot ได้ผลไม่ตรงกับการสแกน JSON")
+        print(f"  {len(all_rows)} แถว: JSON {os.path.getsize(json_path) / 2**20:.1f} MiB"
+              f" | Parquet {writer.stats['bytes'] / 2**20:.1f} MiB ({writer.stats['partitions']} partition)")
+        print(f"  carbon_value ของ CFP ปี 2566 ({len(queried)} แถว): โหลดทั้งตาราง {json_seconds * 1000:7.1f} ms"
+              f" | snapshot (คอลัมน์+partition) {snapshot_seconds * 1000:7.1f} ms")
+
+    for problem in problems: print(f"  ❌ {problem}")
+    if problems: raise SystemExit(1)
+    print("  ✅ snapshot ครบทุกแถวและ diff ตรงกับที่แก้")
+
+# --- 17. Benchmark: ส่งทีละไตรมาส vs ดัชนีสินค้าทั้งรอบ (สินค้าเดิมโผล่ซ้ำหลายไตรมาส) + ID สำรองที่คงที่ ---
+def make_repeating_pages(tasks, rows):
+    """
+    ทุกไตรมาสของ label เดียวกันมีสินค้าชุดเดิม (ID เดิม) แต่ชื่อบริษัทบอกไตรมาส
+    และไตรมาสสุดท้ายไม่มีรูป (ต้องได้ image_url จากไตรมาสก่อนหน้า ไม่ใช่ 'N/A')
+    """
+    last = {}
+    for task in tasks:
+        last[task["label"]] = task
+    pages = {}
+    for task in tasks:
+        page = make_catalog_html(rows, label=task["label"])
+        page = page.replace("บริษัท ตัวอย่าง", f"บริษัท ปี{task['year']}Q{task['quarter']}")
+        if task is last[task["label"]]:
+            page = re.sub(r'<img src="[^"]*">', "<p>ไม่มีรูป</p>", page)
+        pages[period_path(task)] = page
+    return pages, last
+
+def bench_dedupe(args):
+    tasks = scraper.build_period_tasks(args.start_year, args.end_year)
+    pages, last = make_repeating_pages(tasks, args.rows)
+    problems = []
+    print(f"\n=== ดัชนีสินค้าทั้งรอบ: {len(tasks)} งาน, ทุกงานมีสินค้าชุดเดิม {args.rows} รายการต่อ label ===")
+    uploads = {}
+    with CatalogServer(pages, latency=args.latency) as srv, contextlib.redirect_stdout(None):
+        for name in ("per_period", "product_index"):
+            upload = uploads[name] = CountingUpload()
+            index = scraper.ProductIndex() if name == "product_index" else None
+            scraper.run_period_tasks(tasks, http_only_fetch, workers=args.workers, max_rps=0, upload=upload,
+                                     base_url=srv.base_url, product_index=index)
+            if index is not None: index.flush(upload)
+    for name, upload in uploads.items():
+        print(f"  {name:<14} upsert {upload.rows:6d} แถว ใน {upload.calls:3d} ครั้ง -> ในตาราง {len(upload.table)} รายการ")
+    print(f"  ตัด upsert ซ้ำได้ {uploads['per_period'].rows - uploads['product_index'].rows} แถว")
+
+    final = uploads["product_index"].table
+    if final.keys() != uploads["per_period"].table.keys():
+        problems.append("ชุด product_id ไม่ตรงกับการส่งทีละไตรมาส")
+    for pid, row in final.items():
+        task = last[row["label_type"]]
+        if not row["company_name"].startswith(f"บริษัท ปี{task['year']}Q{task['quarter']}"):
+            problems.append(f"{pid}: company_name ไม่ได้มาจากไตรมาสล่าสุด ({row['company_name']})")
+        if row["image_url"] == "N/A":
+            problems.append(f"{pid}: image_url ว่างจากไตรมาสล่าสุดไปทับค่าเดิม")
+    print(f"  ค่าล่าสุดชนะ + field ว่างไม่ทับค่าเดิม: {'✅' if not problems else '❌'}"
+          f" (ส่งทีละไตรมาส: image_url เป็น 'N/A'"
+          f" {sum(r['image_url'] == 'N/A' for r in uploads['per_period'].table.values())} รายการ)")
+
+    # รันซ้ำแบบ incremental (มี manifest): ทุกไตรมาสเหมือนเดิม ยกเว้นไตรมาสสุดท้าย (ไม่มีรูป) ที่สินค้าแรกเปลี่ยนชื่อบริษัท
+    # หน้าที่ไม่เปลี่ยนต้องยังเข้าดัชนี ไม่งั้น 'N/A' ของไตรมาสสุดท้ายจะทับ image_url ที่ส่งไปแล้วในรอบแรก
+    table, sent = CountingUpload(), []
+    with tempfile.TemporaryDirectory() as tmp, CatalogServer(dict(pages), latency=args.latency) as srv, \
+            contextlib.redirect_stdout(None):
+        manifest = scraper.ScrapeManifest(os.path.join(tmp, "manifest.sqlite"))
+        for run in (1, 2):
+            if run == 2:
+                for task in last.values():
+                    path = period_path(task)
+                    srv.pages[path] = srv.pages[path].replace("บริษัท ปี", "บริษัท (ใหม่) ปี", 1)
+            run_id, _ = manifest.start_run()
+            before = table.rows
+            index = scraper.ProductIndex()
+            scraper.run_period_tasks(tasks, http_only_fetch, workers=args.workers, max_rps=0, upload=table,
+                                     base_url=srv.base_url, manifest=manifest, run_id=run_id, product_index=index)
+            index.flush(table, manifest=manifest)
+            manifest.finish_run(run_id)
+            sent.append(table.rows - before)
+    incremental_problems = [f"{pid}: image_url ถูกทับเป็น 'N/A' ในรอบที่สอง"
+                            for pid, row in table.table.items() if row["image_url"] == "N/A"]
+    renamed = sum(row["company_name"].startswith("บริษัท (ใหม่)") for row in table.table.values())
+    if renamed != len(last):
+        incremental_problems.append(f"สินค้าที่เปลี่ยนในรอบที่สอง ขึ้นตาราง {renamed}/{len(last)} รายการ")
+    print(f"  รันซ้ำ incremental: รอบแรกส่ง {sent[0]} แถว | รอบที่สองส่ง {sent[1]} แถว (เปลี่ยนจริง {len(last)})"
+          f" | image_url ไม่ถูกทับ: {'✅' if not incremental_problems else '❌'}")
+    problems += incremental_problems
+
+    # แถวที่ไม่มีหัวการ์ด: ID ต้องเหมือนเดิมแม้ลำดับแถวเปลี่ยน
+    rows = [re.sub(r"<span>TGO[^<]*</span>", "<span> </span>", make_catalog_row(i, name))
+            for i, name in enumerate(load_training_names()[:args.rows])]
+    wrap = '<html><body><table class="catalog-table"><tbody>{}</tbody></table></body></html>'
+    parse = scraper.PARSER_BACKENDS["lxml" if scraper.lxml_html is not None else "bs4"]
+    forward = {p["product_name"]: p["product_id"] for p in parse(wrap.format("".join(rows)), 2567, 1)}
+    backward = {p["product_name"]: p["product_id"] for p in parse(wrap.format("".join(reversed(rows))), 2567, 1)}
+    same = forward == backward and len(set(forward.values())) == len(forward)
+    print(f"  ID สำรองของแถวไม่มีหัวการ์ด ({len(forward)} แถว) คงเดิมเมื่อสลับลำดับแถว: {'✅' if same else '❌'}"
+          f" เช่น {next(iter(forward.values()))}")
+    if not same: problems.append("ID สำรองเปลี่ยนตามลำดับแถว")
+
+    for problem in problems[:10]: print(f"  ❌ {problem}")
+    if problems: raise SystemExit(1)
+
+# --- 18. ตรวจ: หน้าที่ server ไม่บอก charset ใน Content-Type ต้องยังอ่านภาษาไทยถูก ---
+def bench_encoding(args):
+    page = make_catalog_html(args.rows, names=load_training_names())
+    parse = scraper.PARSER_BACKENDS["lxml" if scraper.lxml_html is not None else "bs4"]
+    expected = [p["product_name"] for p in parse(page, 2024, 1)]
+    cases = (("header มี charset", "text/html; charset=utf-8", page),
+             ("header ไม่มี charset + <meta charset>", "text/html", page),
+             ("ไม่มี charset ทั้ง header และ meta", "text/html", page.replace('<meta charset="utf-8">', '')))
+    failed = 0
+    print(f"\n=== Encoding: หน้า {args.rows} แถว ===")
+    for label, content_type, html in cases:
+        with CatalogServer({"/catalog": html}, content_type=content_type) as srv, contextlib.redirect_stdout(None):
+            status, fetched = scraper.fetch_tgo_data_with_http(srv.base_url + "/catalog")
+            empty_status, _ = scraper.fetch_tgo_data_with_http(srv.base_url + "/missing")
+        names = [p["product_name"] for p in parse(fetched, 2024, 1)] if fetched else []
+        ok = status == "table" and names == expected and empty_status == "empty"
+        failed += not ok
+        print(f"  {label:<38} หน้า: {status:<5} | ชื่อไทยตรง {sum(a == b for a, b in zip(names, expected))}/{len(expected)}"
+              f" | หน้าไม่พบข้อมูล: {empty_status} {'✅' if ok else '❌'}")
+    if failed: raise SystemExit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ของ scraper.py")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("browser", help="เทียบเวลาเปิด Chrome ใหม่ทุกหน้า กับ BrowserPool")
+    p.add_argument("--pages", type=int, default=6)
+    p.set_defaults(func=bench_browser)
+
+    p = sub.add_parser("schedule", help="เทียบตัวจัดคิวงานแบบ 1 worker กับหลาย worker")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--start-year", type=int, default=2022)
+    p.add_argument("--end-year", type=int, default=2024)
+    p.add_argument("--rows", type=int, default=20)
+    p.add_argument("--latency", type=float, default=0.3)
+    p.add_argument("--max-rps", type=float, default=50)
+    p.set_defaults(func=bench_schedule)
+
+    p = sub.add_parser("cache", help="เทียบการดึงหน้าจริงกับการแยกข้อมูลใหม่จากแคช (--from-cache)")
+    p.add_argument("--start-year", type=int, default=2010)
+    p.add_argument("--end-year", type=int, default=2025)
+    p.add_argument("--rows", type=int, default=50)
+    p.add_argument("--latency", type=float, default=0.5)
+    p.set_defaults(func=bench_cache)
+
+    p = sub.add_parser("incremental", help="เทียบการรันครั้งแรกกับรันซ้ำแบบ incremental")
+    p.add_argument("--start-year", type=int, default=2010)
+    p.add_argument("--end-year", type=int, default=2025)
+    p.add_argument("--rows", type=int, default=50)
+    p.add_argument("--latency", type=float, default=0.0)
+    p.set_defaults(func=bench_incremental)
+
+    p = sub.add_parser("parse", help="ตรวจ lxml parser ให้ตรงกับตัวเดิม แล้ววัดจำนวนแถว/วินาที")
+    p.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    p.set_defaults(func=bench_parse)
+
+    p = sub.add_parser("classify", help="เทียบการจัดหมวดหมู่ทีละแถวกับแบบ batch + แคช")
+    p.add_argument("--names", type=int, default=2000)
+    p.set_defaults(func=bench_classify)
+
+    p = sub.add_parser("keywords", help="วัดสัดส่วน/ความแม่นของทางลัด keyword เทียบกับโมเดลอย่างเดียว")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--examples", type=int, default=5, help="จำนวนตัวอย่างชื่อที่ทางลัดให้ผลต่างจากโมเดล")
+    p.set_defaults(func=bench_keywords)
+
+    p = sub.add_parser("startup", help="วัดเวลา import และ RAM ตอนโหลดโมเดล (mmap vs ไม่ mmap)")
+    p.add_argument("--workers", type=int, default=4)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("upload", help="เทียบการส่งแบบเดิมกับตัวส่งเบื้องหลัง (Supabase stub)")
+    p.add_argument("--rows", type=int, default=5000)
+    p.add_argument("--batch", type=int, default=250, help="จำนวนแถวต่องาน (ต่อไตรมาส)")
+    p.add_argument("--chunk-rows", type=int, default=scraper.UPLOAD_CHUNK_ROWS)
+    p.add_argument("--latency", type=float, default=0.05)
+    p.add_argument("--failure-rate", type=float, default=0.2)
+    p.set_defaults(func=bench_upload)
+
+    p = sub.add_parser("detail", help="เทียบการดึงหน้ารายละเอียดทีละหน้ากับแบบพร้อมกัน (aiohttp)")
+    p.add_argument("--pages", type=int, default=200)
+    p.add_argument("--latency", type=float, default=0.1)
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--rps", type=float, default=0, help="จำกัดหน้า/วินาทีต่อ host ในรอบที่มี error (0 = ไม่จำกัด)")
+    p.add_argument("--failure-rate", type=float, default=0.3)
+    p.set_defaults(func=bench_detail)
+
+    p = sub.add_parser("search", help="เทียบการค้นหาด้วยดัชนี n-gram ที่ publish ไว้ กับการสแกนทั้งตาราง")
+    p.add_argument("--rows", type=int, default=20000)
+    p.add_argument("--queries", type=int, default=200)
+    p.set_defaults(func=bench_search)
+
+    p = sub.add_parser("images", help="เทียบการสำเนารูปทีละรูปกับแบบพร้อมกัน + ตรวจการตัดรูปซ้ำ/ข้ามรูปที่มีแล้ว")
+    p.add_argument("--products", type=int, default=1000)
+    p.add_argument("--urls", type=int, default=120, help="จำนวน URL รูปที่ไม่ซ้ำ")
+    p.add_argument("--distinct", type=int, default=12, help="จำนวนเนื้อรูปที่ไม่ซ้ำ (URL หลายอันได้รูปเดียวกัน)")
+    p.add_argument("--latency", type=float, default=0.05)
+    p.add_argument("--workers", type=int, default=8)
+    p.set_defaults(func=bench_images)
+
+    p = sub.add_parser("waits", help="วัดการรอจนจำนวนแถวนิ่ง (แทน sleep 5s) และการข้ามไตรมาสว่างเมื่อรันซ้ำ")
+    p.add_argument("--rows", type=int, nargs="+", default=[10, 50, 200])
+    p.add_argument("--row-interval", type=float, default=0.2, help="แถวชุดใหม่โผล่ทุกกี่วินาที")
+    p.add_argument("--start-year", type=int, default=2018)
+    p.add_argument("--end-year", type=int, default=2021)
+    p.add_argument("--page-rows", type=int, default=20)
+    p.add_argument("--latency", type=float, default=0.1)
+    p.add_argument("--runs", type=int, default=3)
+    p.set_defaults(func=bench_waits)
+
+    p = sub.add_parser("snapshot", help="ตรวจ snapshot Parquet (ครบ/ใช้ partition เดิม/diff) และวัดเวลา query")
+    p.add_argument("--start-year", type=int, default=2019)
+    p.add_argument("--end-year", type=int, default=2021)
+    p.add_argument("--rows", type=int, default=20)
+    p.add_argument("--query-rows", type=int, default=300, help="แถวต่อ partition ในชุดที่ใช้วัด query")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_snapshot)
+
+    p = sub.add_parser("encoding", help="ตรวจว่าหน้าที่ไม่บอก charset ใน Content-Type ยังได้ชื่อภาษาไทยถูก")
+    p.add_argument("--rows", type=int, default=50)
+    p.set_defaults(func=bench_encoding)
+
+    p = sub.add_parser("dedupe", help="เทียบจำนวน upsert ของการส่งทีละไตรมาสกับดัชนีสินค้าทั้งรอบ")
+    p.add_argument("--start-year", type=int, default=2019)
+    p.add_argument("--end-year", type=int, default=2021)
+    p.add_argument("--rows", type=int, default=50)
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--latency", type=float, default=0.0)
+    p.set_defaults(func=bench_dedupe)
+
+    p = sub.add_parser("suite", help="วัด parse/classify/upload/train ทั้งชุด แล้วบันทึกผลเป็น JSON")
+    p.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    p.add_argument("--bs4-max-rows", type=int, default=1000,
+                   help="หน้าที่ใหญ่กว่านี้ไม่วัด bs4 (ตัวเดิมช้าแบบไม่เป็นเชิงเส้น 10k แถวใช้หลายนาที)")
+    p.add_argument("--names", type=int, default=1000, help="จำนวนชื่อที่ใช้วัด classifier")
+    p.add_argument("--batch-sizes", type=int, nargs="+", default=[32, 256])
+    p.add_argument("--upload-rows", type=int, default=2000)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--skip-train", action="store_true", help="ไม่วัดเวลาเทรนโมเดล")
+    p.add_argument("--output", default=None, help="ไฟล์ผลลัพธ์ (ค่าเริ่มต้น .tgo_state/benchmarks/<commit>.json)")
+    p.set_defaults(func=bench_suite)
+
+    p = sub.add_parser("compare", help="เทียบผล suite สองไฟล์ (exit 1 ถ้ามี metric แย่ลงเกิน threshold)")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.add_argument("--threshold", type=float, default=0.10)
+    p.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
 import warnings
 import time
 from selenium import webdriver
@@ -16,6 +17,25 @@ from selenium.common.exceptions import TimeoutException, NoSuchElementException,
 import json
 import re
 import joblib # เพิ่ม import นี้
+try:
+    from lxml import etree, html as lxml_html # parser ที่เร็วกว่า (ถ้าไม่มีจะใช้ BeautifulSoup แทน)
+except ImportError:
+    etree = lxml_html = None
+import argparse
+import asyncio
+import datetime
+import gzip
+import hashlib
+import io
+import shutil
+import sqlite3
+import queue
+import random
+import threading
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
 
 # --- 1. การตั้งค่าเริ่มต้น ---
 load_dotenv()
@@ -23,28 +43,155 @@ SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 warnings.filterwarnings('ignore', message='Unverified HTTPS request')
 BASE_URL = "https://thaicarbonlabel.tgo.or.th/"
+MODEL_PATH = 'category_model.joblib'
+
+# --- 1.1 [ใหม่] วัดเวลาแต่ละขั้นตอน (tracing) ---
+class Tracer:
+    """
+    เก็บเวลาแต่ละขั้นตอน (span) และตัวนับ (counter) แบบเบา ๆ ใช้ได้จากหลาย thread
+    - ถ้าเปิด `open_events(path)` ทุก span/counter จะถูกเขียนเป็น JSON lines ทันที
+    - summary() สรุป p50/p95 ต่อขั้นตอน, จำนวนแถว/วินาที, ขนาดหน้าที่ดึงมา
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = None
+        self.durations = defaultdict(list)
+        self.counters = defaultdict(float)
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+
+    def open_events(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._events = open(path, 'a', encoding='utf-8')
+
+    def close(self):
+        with self._lock:
+            if self._events:
+                self._events.close()
+                self._events = None
+
+    def _emit(self, event):
+        if self._events is None: return
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._events: self._events.write(line + "\n")
+
+    @contextmanager
+    def span(self, name, **attrs):
+        start = time.perf_counter()
+        error = None
+        try:
+            yield attrs # ผู้เรียกเติม attribute เพิ่มระหว่าง span ได้ เช่น attrs["rows"] = 10
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.durations[name].append(duration)
+            event = {"type": "span", "name": name, "ts": time.time(), "duration": round(duration, 6),
+                     "thread": threading.current_thread().name, **attrs}
+            if error: event["error"] = error
+            self._emit(event)
+
+    def count(self, name, value=1, **attrs):
+        with self._lock:
+            self.counters[name] += value
+        self._emit({"type": "counter", "name": name, "ts": time.time(), "value": value, **attrs})
+
+    @staticmethod
+    def _percentile(sorted_values, pct):
+        if not sorted_values: return 0.0
+        index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+        return sorted_values[index]
+
+    def summary(self):
+        wall = time.perf_counter() - self._started
+        with self._lock:
+            stages = {}
+            for name, values in sorted(self.durations.items()):
+                values = sorted(values)
+                stages[name] = {"count": len(values), "total_s": round(sum(values), 3),
+                                "p50_s": round(self._percentile(values, 50), 4),
+                                "p95_s": round(self._percentile(values, 95), 4),
+                                "max_s": round(values[-1], 4)}
+            counters = dict(self.counters)
+        return {"started_at": self.started_at, "wall_s": round(wall, 3), "stages": stages, "counters": counters,
+                "rows_per_s": round(counters.get("rows_parsed", 0) / wall, 1) if wall else 0.0,
+                "bytes_fetched": int(counters.get("bytes_fetched", 0))}
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"\n=== เวลาแต่ละขั้นตอน (รวม {summary['wall_s']:.1f}s, {summary['rows_per_s']} แถว/วินาที,"
+              f" ดึงมา {summary['bytes_fetched'] / 1024 / 1024:.1f} MiB) ===")
+        for name, stage in summary["stages"].items():
+            print(f"  {name:<22} x{stage['count']:<5} รวม {stage['total_s']:8.2f}s"
+                  f" | p50 {stage['p50_s']:7.3f}s | p95 {stage['p95_s']:7.3f}s")
+        return summary
+
+def write_run_report(path, **sections):
+    """เขียนสรุปการรัน (summary ของ TRACER + ส่วนอื่น ๆ เช่น ผลงาน/แคช) เป็น JSON"""
+    report = {**TRACER.summary(), **sections}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    return report
+
+TRACER = Tracer()
+DEBUG_ROWS = True # พิมพ์ carbon ของทุกแถว ([DEBUG]) ปิดได้ด้วย --quiet
 
 # --- 2. เชื่อมต่อ SUPABASE ---
-try:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    print("✅ เชื่อมต่อ Supabase สำเร็จ!")
-except Exception as e:
-    print(f"❌ เชื่อมต่อ Supabase ไม่สำเร็จ: {e}")
-    exit()
-# ... connect Supabase (ส่วนที่ 2) ...
-print("✅ เชื่อมต่อ Supabase สำเร็จ!")
-
-# --- [ใหม่] โหลดโมเดล AI ที่เราสร้างไว้ ---
-try:
-    print("🧠 กำลังโหลดโมเดล AI สำหรับจัดหมวดหมู่...")
-    category_classifier = joblib.load('category_model.joblib')
-    print("✅ โหลดโมเดล AI สำเร็จ!")
-except FileNotFoundError:
-    print("⚠️ ไม่พบไฟล์ 'category_model.joblib', จะใช้หมวดหมู่ 'อื่นๆ' แทน")
-    category_classifier = None
-except Exception as e:
-    print(f"❌ เกิดข้อผิดพลาดในการโหลดโมเดล AI: {e}")
-    category_classifier = None
+# 🎯 [แก้ไข] ไม่เชื่อมต่อ/ไม่โหลดโมเดลตอน import แล้ว (import เร็ว, ใช้ parser ใน test/benchmark/worker ได้
+# โดยไม่ต้องมี key ของ Supabase) -> สร้างตอนเรียกใช้ครั้งแรกผ่าน get_supabase_client() / get_category_classifier()
+_supabase_client = None
+_supabase_lock = threading.Lock()
+
+def get_supabase_client():
+    """คืน Supabase client (สร้างครั้งแรกที่เรียก) ถ้าเชื่อมต่อไม่ได้จะ raise ออกไป"""
+    global _supabase_client
+    with _supabase_lock:
+        if _supabase_client is None:
+            from supabase import create_client # import ตรงนี้เพราะ library ค่อนข้างหนัก
+            try:
+                _supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+                print("✅ เชื่อมต่อ Supabase สำเร็จ!")
+            except Exception as e:
+                print(f"❌ เชื่อมต่อ Supabase ไม่สำเร็จ: {e}")
+                raise
+    return _supabase_client
+
+# --- [ใหม่] โหลดโมเดล AI ที่เราสร้างไว้ (ตอนใช้ครั้งแรก) ---
+# mmap_mode='r': array ของโมเดลถูก map จากไฟล์ตรง ๆ แทนการ copy เข้า memory
+# worker หลาย process จึงใช้หน้า memory ชุดเดียวกัน (page cache ของ OS) ไม่ต้องโหลดคนละก้อน
+MODEL_MMAP_MODE = 'r'
+_category_classifier = None
+_classifier_loaded = False
+_classifier_lock = threading.Lock()
+
+def describe_model(path=MODEL_PATH):
+    """ข้อความสั้น ๆ จากไฟล์ข้อมูลประกอบโมเดล (.meta.json ที่ train_model.py เขียนไว้) ถ้ามี"""
+    try:
+        with open(os.path.splitext(path)[0] + '.meta.json', encoding='utf-8') as f:
+            meta = json.load(f)
+        return f" ({meta['mode']} v{meta['version']}, เทรน {meta['trained_rows']} รายการ เมื่อ {meta['trained_at']})"
+    except (OSError, ValueError, KeyError):
+        return ""
+
+def get_category_classifier():
+    """คืนโมเดลจัดหมวดหมู่ หรือ None ถ้าไม่มีไฟล์/โหลดไม่ได้ (จะใช้หมวด 'อื่นๆ' แทน)"""
+    global _category_classifier, _classifier_loaded
+    with _classifier_lock:
+        if not _classifier_loaded:
+            _classifier_loaded = True
+            try:
+                print("🧠 กำลังโหลดโมเดล AI สำหรับจัดหมวดหมู่...")
+                _category_classifier = joblib.load(MODEL_PATH, mmap_mode=MODEL_MMAP_MODE)
+                print(f"✅ โหลดโมเดล AI สำเร็จ!{describe_model()}")
+            except FileNotFoundError:
+                print(f"⚠️ ไม่พบไฟล์ '{MODEL_PATH}', จะใช้หมวดหมู่ 'อื่นๆ' แทน")
+            except Exception as e:
+                print(f"❌ เกิดข้อผิดพลาดในการโหลดโมเดล AI: {e}")
+    return _category_classifier
 
 # --- 3. ฟังก์ชันแปลงวันที่ ---
 def convert_be_to_iso(be_date_str):
@@ -60,77 +207,636 @@ def convert_be_to_iso(be_date_str):
         return None
 
 # --- 4. ฟังก์ชันดึงข้อมูล (Selenium + รอ ตาราง หรือ ไม่พบข้อมูล/รายการ) ---
-def fetch_tgo_data_with_selenium(url_to_fetch):
+PAGE_TIMEOUT_SECONDS = 180 # 3 นาทีต่อหน้า (เพดาน: เวลารอจริงปรับตามประวัติใน LATENCY)
+PAGE_SETTLE_MAX_SECONDS = 5 # เดิม sleep 5 วินาทีทุกหน้า ตอนนี้เป็นเวลารอสูงสุดจนจำนวนแถวนิ่ง
+PAGE_SETTLE_QUIET_SECONDS = 1.0 # จำนวนแถวไม่เปลี่ยนติดต่อกันนานเท่านี้ = ตารางโหลดครบแล้ว
+ROW_COUNT_SCRIPT = ("var body = document.querySelector('table.catalog-table > tbody');"
+                    " return body ? body.querySelectorAll(':scope > tr').length : 0;")
+
+# --- 4.0 [ใหม่] เวลารอ (timeout) ปรับตามเวลาที่เคยใช้จริง ---
+LATENCY_MIN_SAMPLES = 10
+LATENCY_TIMEOUT_FACTOR = 4.0 # timeout = p95 x 4 (ไม่ต่ำกว่า minimum และไม่เกินค่าเดิม)
+
+class LatencyHistory:
     """
-    ใช้ Selenium เพื่อโหลด URL ที่ระบุ และรอ table หรือ no results (Timeout 3 นาที)
+    เก็บเวลาที่ใช้จริงล่าสุดของแต่ละขั้น (เช่น "http", "browser.ready") แล้วคำนวณ timeout จากประวัติ
+    - ตัวอย่างยังน้อยกว่า LATENCY_MIN_SAMPLES -> ใช้ค่าเดิม (default)
+    - timeout ครั้งหนึ่ง -> ครั้งถัดไปของขั้นนั้นรอนานขึ้นเท่าตัว (จนถึง default) สำเร็จเมื่อไหร่ค่อยกลับมาปกติ
+    - load()/save() เก็บประวัติเป็น JSON ใน STATE_DIR ให้รอบถัดไปเริ่มจากค่าที่เรียนรู้แล้ว
     """
+    def __init__(self, max_samples=200):
+        self.max_samples = max_samples
+        self.path = None
+        self._samples = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self._penalty = defaultdict(lambda: 1.0)
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        self.path = path
+        try:
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for kind, values in saved.items():
+                self._samples[kind].extend(float(v) for v in values)
+
+    def save(self):
+        if not self.path: return
+        with self._lock:
+            data = {kind: [round(v, 3) for v in values] for kind, values in self._samples.items()}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def record(self, kind, seconds):
+        with self._lock:
+            self._samples[kind].append(seconds)
+            self._penalty.pop(kind, None)
+
+    def record_timeout(self, kind):
+        with self._lock:
+            self._penalty[kind] *= 2
+
+    def timeout(self, kind, default, minimum):
+        """timeout (วินาที) ของขั้น `kind`: p95 x LATENCY_TIMEOUT_FACTOR อยู่ในช่วง [minimum, default]"""
+        with self._lock:
+            values = sorted(self._samples.get(kind, ()))
+            penalty = self._penalty.get(kind, 1.0)
+        if len(values) < LATENCY_MIN_SAMPLES:
+            return default
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        return min(default, max(minimum, p95 * LATENCY_TIMEOUT_FACTOR) * penalty)
+
+LATENCY = LatencyHistory()
+
+_chromedriver_path = None
+_chromedriver_lock = threading.Lock()
+
+def resolve_chromedriver_path():
+    """
+    หา path ของ chromedriver แค่ครั้งเดียวต่อ process
+    (ChromeDriverManager().install() ต้องเช็คเวอร์ชัน/ดาวน์โหลด ทำทุกหน้าจะเสียเวลาฟรี)
+    """
+    global _chromedriver_path
+    with _chromedriver_lock:
+        if _chromedriver_path is None:
+            _chromedriver_path = ChromeDriverManager().install()
+    return _chromedriver_path
+
+def start_chrome_driver(headless=False):
     options = webdriver.ChromeOptions()
-    # options.add_argument('--headless') # รันแบบเห็นหน้าต่าง
+    if headless:
+        options.add_argument('--headless=new')
     options.add_argument('--disable-gpu')
     options.add_argument('window-size=1280x720')
     options.add_argument("--log-level=3")
-    driver = None
-    try:
-        print("     กำลังเปิดเบราว์เซอร์ (Selenium)...") # เพิ่มเว้นวรรค
-        service = Service(ChromeDriverManager().install())
+    with TRACER.span("browser.start"):
+        service = Service(resolve_chromedriver_path())
         driver = webdriver.Chrome(service=service, options=options)
-        driver.set_page_load_timeout(180) # 3 นาทีต่อหน้า
-        driver.implicitly_wait(5)
+    driver.set_page_load_timeout(PAGE_TIMEOUT_SECONDS)
+    driver.implicitly_wait(5)
+    return driver
+
+class BrowserPool:
+    """
+    Pool ของ Chrome ที่เปิดค้างไว้ใช้ซ้ำ แทนการเปิด/ปิดเบราว์เซอร์ใหม่ทุกหน้า
+    - เปิด driver ตอนยืมครั้งแรก (lazy) และไม่เกิน `size` ตัวพร้อมกัน
+    - เช็คว่า driver ยังตอบสนองก่อนให้ยืมทุกครั้ง ถ้าตายแล้วจะเปิดตัวใหม่แทน
+    - ปิดแล้วเปิดใหม่ (recycle) เมื่อใช้ครบ `max_pages_per_driver` หน้า เพื่อกัน memory บวม
+    """
+    def __init__(self, size=1, max_pages_per_driver=25, headless=True):
+        self.size = size
+        self.max_pages_per_driver = max_pages_per_driver
+        self.headless = headless
+        self._idle = queue.LifoQueue()
+        self._slots = threading.Semaphore(size)
+        self._pages_used = {} # id(driver) -> จำนวนหน้าที่โหลดไปแล้ว
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"started": 0, "recycled": 0, "crashed": 0, "leases": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _start_driver(self):
+        print("     กำลังเปิดเบราว์เซอร์ (Selenium) เข้า pool...")
+        driver = start_chrome_driver(headless=self.headless)
+        with self._lock:
+            self._pages_used[id(driver)] = 0
+            self.stats["started"] += 1
+        return driver
+
+    def _quit_driver(self, driver):
+        with self._lock:
+            self._pages_used.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_alive(driver):
+        try:
+            driver.execute_script('return 1;')
+            return True
+        except Exception:
+            return False
+
+    def _acquire(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                return self._start_driver()
+            if self._is_alive(driver):
+                return driver
+            print("     ⚠️ เบราว์เซอร์ใน pool ไม่ตอบสนอง, เปิดตัวใหม่แทน...")
+            with self._lock:
+                self.stats["crashed"] += 1
+            self._quit_driver(driver)
 
-        print(f"     กำลังเข้าไปที่: {url_to_fetch}")
+    def _release(self, driver):
+        with self._lock:
+            self._pages_used[id(driver)] = self._pages_used.get(id(driver), 0) + 1
+            pages_used = self._pages_used[id(driver)]
+        if self._closed:
+            self._quit_driver(driver)
+        elif not self._is_alive(driver):
+            with self._lock:
+                self.stats["crashed"] += 1
+            self._quit_driver(driver)
+        elif pages_used >= self.max_pages_per_driver:
+            with self._lock:
+                self.stats["recycled"] += 1
+            self._quit_driver(driver)
+        else:
+            self._idle.put(driver)
+
+    @contextmanager
+    def lease(self):
+        """ยืม driver 1 ตัวไปใช้โหลด 1 หน้า (ใช้กับ `with`)"""
+        if self._closed:
+            raise RuntimeError("BrowserPool ถูกปิดไปแล้ว")
+        self._slots.acquire()
+        driver = None
+        try:
+            driver = self._acquire()
+            with self._lock:
+                self.stats["leases"] += 1
+            yield driver
+        finally:
+            if driver is not None:
+                self._release(driver)
+            self._slots.release()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit_driver(driver)
+        print(f"     ปิด browser pool แล้ว (เปิดทั้งหมด {self.stats['started']} ครั้ง, "
+              f"ใช้ซ้ำ {self.stats['leases']} หน้า, recycle {self.stats['recycled']}, พัง {self.stats['crashed']})")
+
+def _load_period_page(driver, url_to_fetch):
+    """
+    โหลด URL ด้วย driver ที่มีอยู่แล้ว แล้วรอ table หรือ no results
+    คืน HTML ถ้าเจอตาราง, คืน None ถ้าเจอข้อความไม่พบข้อมูล (Timeout จะ raise ออกไป)
+    """
+    print(f"     กำลังเข้าไปที่: {url_to_fetch}")
+    with TRACER.span("browser.get"):
         driver.get(url_to_fetch)
 
-        print("     รอให้หน้าเว็บโหลด...")
-        wait = WebDriverWait(driver, 180) # 3 นาทีต่อหน้า
+    timeout = LATENCY.timeout("browser.ready", PAGE_TIMEOUT_SECONDS, minimum=30)
+    print(f"     รอให้หน้าเว็บโหลด (สูงสุด {timeout:.0f} วินาที)...")
+    wait = WebDriverWait(driver, timeout)
 
-        table_selector = (By.CLASS_NAME, 'catalog-table')
-        
-        # --- 🎯 [แก้ไข] ---
-        # เปลี่ยนเป็น XPATH เพื่อให้รองรับการตรวจสอบข้อความได้หลายแบบ
-        # (ตรวจสอบ class 'alert-warning' หรือ ข้อความ 'ไม่พบข้อมูล' หรือ ข้อความ 'ไม่พบรายการ')
-        no_results_selector = (By.XPATH, "//*[contains(@class, 'alert-warning') or contains(text(), 'ไม่พบข้อมูล') or contains(text(), 'ไม่พบรายการ')]")
-        # --- 🎯 [สิ้นสุดการแก้ไข] ---
-
-        # [แก้ไข] อัปเดต Log ให้สื่อความหมาย
-        print(f"     รอให้ '{table_selector[1]}' หรือ 'ข้อความไม่พบข้อมูล/รายการ' ปรากฏ...")
-
-        element_found = wait.until(
-            EC.any_of(
-                EC.presence_of_element_located(table_selector),
-                EC.presence_of_element_located(no_results_selector) # <-- ใช้ตัวเลือกใหม่
+    table_selector = (By.CLASS_NAME, 'catalog-table')
+    
+    # --- 🎯 [แก้ไข] ---
+    # เปลี่ยนเป็น XPATH เพื่อให้รองรับการตรวจสอบข้อความได้หลายแบบ
+    # (ตรวจสอบ class 'alert-warning' หรือ ข้อความ 'ไม่พบข้อมูล' หรือ ข้อความ 'ไม่พบรายการ')
+    no_results_selector = (By.XPATH, "//*[contains(@class, 'alert-warning') or contains(text(), 'ไม่พบข้อมูล') or contains(text(), 'ไม่พบรายการ')]")
+    # --- 🎯 [สิ้นสุดการแก้ไข] ---
+
+    # [แก้ไข] อัปเดต Log ให้สื่อความหมาย
+    print(f"     รอให้ '{table_selector[1]}' หรือ 'ข้อความไม่พบข้อมูล/รายการ' ปรากฏ...")
+
+    start = time.perf_counter()
+    try:
+        with TRACER.span("browser.wait"):
+            wait.until(
+                EC.any_of(
+                    EC.presence_of_element_located(table_selector),
+                    EC.presence_of_element_located(no_results_selector) # <-- ใช้ตัวเลือกใหม่
+                )
             )
-        )
+    except TimeoutException:
+        LATENCY.record_timeout("browser.ready")
+        raise
+    LATENCY.record("browser.ready", time.perf_counter() - start)
 
-        try:
-            driver.find_element(*table_selector) # ลองหาตาราง
-            print("     -> พบตารางข้อมูล!")
-            print("     รอเพิ่มเติม 5 วินาที...")
-            time.sleep(5)
-            print("     ✅ ตารางโหลดสำเร็จ! กำลังดึงโค้ด HTML...")
-            return driver.page_source
-        except NoSuchElementException:
-            # [แก้ไข] อัปเดต Log 
-            print("     -> ไม่พบตาราง (เจอข้อความ 'ไม่พบข้อมูล' หรือ 'ไม่พบรายการ')")
-            return None # คืนค่า None ถ้าไม่มีข้อมูล
+    try:
+        driver.find_element(*table_selector) # ลองหาตาราง
+        print("     -> พบตารางข้อมูล! รอจนจำนวนแถวนิ่ง...")
+        with TRACER.span("browser.settle") as span_attrs:
+            rows = wait_for_stable_rows(driver)
+            span_attrs["rows"] = rows
+        print(f"     ✅ ตารางโหลดสำเร็จ ({rows} แถว)! กำลังดึงโค้ด HTML...")
+        page_source = driver.page_source
+        TRACER.count("bytes_fetched", len(page_source.encode('utf-8')), source="browser")
+        return page_source
+    except NoSuchElementException:
+        # [แก้ไข] อัปเดต Log 
+        print("     -> ไม่พบตาราง (เจอข้อความ 'ไม่พบข้อมูล' หรือ 'ไม่พบรายการ')")
+        return None # คืนค่า None ถ้าไม่มีข้อมูล
+
+def wait_for_stable_rows(driver, max_wait=PAGE_SETTLE_MAX_SECONDS, quiet_seconds=PAGE_SETTLE_QUIET_SECONDS,
+                         poll_seconds=0.25):
+    """
+    รอจนจำนวนแถวในตาราง catalog ไม่เปลี่ยนติดต่อกัน `quiet_seconds` (แทนการ sleep 5 วินาทีทุกหน้า)
+    รอไม่เกิน `max_wait` วินาที (เท่ากับของเดิม) คืนจำนวนแถวล่าสุด
+    """
+    start = time.monotonic()
+    last_count, stable_since = None, start
+    while True:
+        count = driver.execute_script(ROW_COUNT_SCRIPT)
+        now = time.monotonic()
+        if count != last_count:
+            last_count, stable_since = count, now
+        elif count and now - stable_since >= quiet_seconds:
+            return count
+        if now - start >= max_wait:
+            return count
+        time.sleep(poll_seconds)
+
+def _report_timeout(driver):
+    current_state = "unknown"
+    try:
+        if driver: current_state = driver.execute_script('return document.readyState;')
+    except: pass
+    if current_state != 'complete':
+        print(f"     ❌ เกิดข้อผิดพลาด: Timeout! หน้าเว็บโหลดไม่เสร็จ (State: {current_state}) ภายในเวลาที่กำหนด")
+    else:
+        print(f"     ❌ เกิดข้อผิดพลาด: Timeout! ไม่พบทั้งตารางและข้อความ 'ไม่พบข้อมูล/รายการ' ภายในเวลาที่กำหนด")
+
+def fetch_tgo_data_with_selenium(url_to_fetch, pool=None, raise_on_error=False):
+    """
+    ใช้ Selenium เพื่อโหลด URL ที่ระบุ และรอ table หรือ no results (Timeout ตาม LATENCY สูงสุด 3 นาที)
+    ถ้าส่ง `pool` (BrowserPool) มา จะยืมเบราว์เซอร์จาก pool แทนการเปิดใหม่ทุกครั้ง
+    ถ้า `raise_on_error=True` จะ raise Timeout/Error ออกไป (ให้ตัวจัดคิวงาน retry ได้)
+    แทนการคืน None ซึ่งแยกไม่ออกกับหน้า 'ไม่พบข้อมูล'
+    """
+    driver = None
+    try:
+        if pool is not None:
+            with TRACER.span("fetch.browser"), pool.lease() as leased_driver:
+                try:
+                    return _load_period_page(leased_driver, url_to_fetch)
+                except TimeoutException:
+                    _report_timeout(leased_driver)
+                    if raise_on_error: raise
+                    return None
+
+        print("     กำลังเปิดเบราว์เซอร์ (Selenium)...") # เพิ่มเว้นวรรค
+        with TRACER.span("fetch.browser"):
+            driver = start_chrome_driver()
+            return _load_period_page(driver, url_to_fetch)
 
     except TimeoutException:
-         current_state = "unknown"
-         try:
-             if driver: current_state = driver.execute_script('return document.readyState;')
-         except: pass
-         if current_state != 'complete':
-             print(f"     ❌ เกิดข้อผิดพลาด: Timeout! หน้าเว็บโหลดไม่เสร็จ (State: {current_state}) ภายใน 3 นาที")
-         else:
-             print(f"     ❌ เกิดข้อผิดพลาด: Timeout! ไม่พบทั้งตารางและข้อความ 'ไม่พบข้อมูล/รายการ' ภายใน 3 นาที")
-         return None
+        if pool is None: _report_timeout(driver)
+        if raise_on_error: raise
+        return None
     except Exception as e:
         print(f"     ❌ เกิดข้อผิดพลาดระหว่างการทำงานของ Selenium: {e}")
+        if raise_on_error: raise
         return None
     finally:
         if driver:
             print("     ปิดเบราว์เซอร์...")
             driver.quit()
 
+# --- 4.1 [ใหม่] ดึงหน้าด้วย HTTP ตรง ๆ ก่อน (ใช้ Selenium เฉพาะตอนจำเป็น) ---
+NO_RESULTS_MARKERS = ('ไม่พบข้อมูล', 'ไม่พบรายการ')
+HTTP_TIMEOUT_SECONDS = 60
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+# ตัวนับว่าแต่ละหน้าได้มาจากทางไหน (ไว้ดูว่าประหยัดเวลาเบราว์เซอร์ไปได้เท่าไหร่)
+FETCH_STATS = {"http_table": 0, "http_empty": 0, "http_error": 0,
+               "browser_fallback": 0, "browser_pages": 0, "http_seconds": 0.0, "browser_seconds": 0.0}
+_fetch_stats_lock = threading.Lock()
+
+def _count_fetch(key, seconds_key=None, seconds=0.0):
+    with _fetch_stats_lock:
+        FETCH_STATS[key] += 1
+        if seconds_key: FETCH_STATS[seconds_key] += seconds
+
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml",
+    "Accept-Encoding": "gzip, deflate",
+    "Accept-Language": "th,en;q=0.8",
+}
+
+def get_http_session(pool_size=10):
+    """
+    requests.Session ตัวเดียวใช้ร่วมกันทั้ง process (keep-alive + gzip + retry อัตโนมัติ)
+    `pool_size` ควรเท่ากับจำนวน worker เพื่อไม่ให้ต้องรอ connection กัน
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            retry = Retry(total=3, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=("GET",))
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(HTTP_HEADERS)
+            session.verify = False # ใบรับรองของเว็บ TGO ไม่ครบ chain (จึงมี filter 'Unverified HTTPS request' ด้านบน)
+            _http_session = session
+    return _http_session
+
+def decode_response_html(resp):
+    """
+    แปลง response เป็นข้อความ: charset ใน Content-Type -> <meta charset> ในหน้า -> UTF-8
+    (ถ้า header ไม่บอก charset requests จะเดาเป็น ISO-8859-1 ทำให้ภาษาไทยเพี้ยนทั้งหน้า)
+    """
+    if 'charset' in resp.headers.get('Content-Type', '').lower():
+        return resp.text
+    match = META_CHARSET_RE.search(resp.content[:4096])
+    encoding = match.group(1).decode('ascii') if match else 'utf-8'
+    try:
+        return resp.content.decode(encoding, errors='replace')
+    except LookupError: # charset ใน meta ที่ Python ไม่รู้จัก
+        return resp.content.decode('utf-8', errors='replace')
+
+def fetch_tgo_data_with_http(url_to_fetch, session=None):
+    """
+    GET หน้าตรง ๆ ไม่ผ่านเบราว์เซอร์ คืน (status, html)
+    - ('table', html) ถ้าใน response มี 'catalog-table' แล้ว
+    - ('empty', None) ถ้าเจอข้อความ 'ไม่พบข้อมูล/รายการ'
+    - ('unknown', html) ถ้าไม่เจอทั้งคู่ (หน้าน่าจะโหลดข้อมูลด้วย JavaScript)
+    """
+    session = session or get_http_session()
+    start = time.perf_counter()
+    with TRACER.span("fetch.http"):
+        try:
+            resp = session.get(url_to_fetch, timeout=LATENCY.timeout("http", HTTP_TIMEOUT_SECONDS, minimum=10))
+        except requests.Timeout:
+            LATENCY.record_timeout("http")
+            raise
+        resp.raise_for_status()
+    LATENCY.record("http", time.perf_counter() - start)
+    TRACER.count("bytes_fetched", len(resp.content), source="http")
+    html = decode_response_html(resp)
+    if 'catalog-table' in html:
+        return 'table', html
+    if any(marker in html for marker in NO_RESULTS_MARKERS):
+        return 'empty', None
+    return 'unknown', html
+
+def fetch_period_html(url_to_fetch, pool=None, mode="auto", raise_on_error=False):
+    """
+    ดึงหน้าตาม `mode`
+    - "auto": ลอง HTTP ก่อน ถ้าไม่เจอทั้งตารางและข้อความไม่พบข้อมูล ค่อยเปิดเบราว์เซอร์
+    - "http": ใช้ HTTP อย่างเดียว
+    - "browser": ใช้ Selenium อย่างเดียว (แบบเดิม)
+    """
+    if mode in ("auto", "http"):
+        start = time.perf_counter()
+        try:
+            status, html = fetch_tgo_data_with_http(url_to_fetch)
+        except requests.RequestException as e:
+            _count_fetch("http_error", "http_seconds", time.perf_counter() - start)
+            print(f"     ⚠️ ดึงหน้าด้วย HTTP ไม่สำเร็จ: {e}")
+            if mode == "http":
+                if raise_on_error: raise
+                return None
+        else:
+            elapsed = time.perf_counter() - start
+            if status == 'table':
+                _count_fetch("http_table", "http_seconds", elapsed)
+                print(f"     -> พบตารางข้อมูลจาก HTTP โดยตรง ({elapsed:.1f}s)")
+                return html
+            if status == 'empty':
+                _count_fetch("http_empty", "http_seconds", elapsed)
+                print("     -> ไม่พบตาราง (HTTP เจอข้อความ 'ไม่พบข้อมูล' หรือ 'ไม่พบรายการ')")
+                return None
+            _count_fetch("http_error" if mode == "http" else "browser_fallback", "http_seconds", elapsed)
+            if mode == "http":
+                print("     ⚠️ HTTP ไม่เจอทั้งตารางและข้อความไม่พบข้อมูล (โหมด http จะไม่เปิดเบราว์เซอร์)")
+                if raise_on_error: raise RuntimeError("ไม่พบ 'catalog-table' ใน response")
+                return None
+            print("     -> HTTP ไม่เจอทั้งตารางและข้อความไม่พบข้อมูล, เปลี่ยนไปใช้เบราว์เซอร์...")
+
+    start = time.perf_counter()
+    try:
+        return fetch_tgo_data_with_selenium(url_to_fetch, pool=pool, raise_on_error=raise_on_error)
+    finally:
+        _count_fetch("browser_pages", "browser_seconds", time.perf_counter() - start)
+
+def print_fetch_stats():
+    s = FETCH_STATS
+    print(f"ที่มาของหน้า: HTTP เจอตาราง {s['http_table']} | HTTP ไม่พบข้อมูล {s['http_empty']}"
+          f" | ใช้เบราว์เซอร์ {s['browser_pages']} (ส่งต่อจาก HTTP {s['browser_fallback']}) | HTTP error {s['http_error']}")
+    print(f"  เวลา HTTP รวม {s['http_seconds']:.1f}s | เวลาเบราว์เซอร์รวม {s['browser_seconds']:.1f}s")
+
+# --- 4.2 [ใหม่] แคช HTML ลงดิสก์ (บีบอัด + ตั้งชื่อไฟล์ตาม hash ของเนื้อหา) ---
+STATE_DIR = os.environ.get("TGO_STATE_DIR", ".tgo_state") # โฟลเดอร์เก็บไฟล์สถานะทั้งหมดของ scraper
+CURRENT_QUARTER_TTL_SECONDS = 6 * 3600 # หน้าของไตรมาสปัจจุบันยังเปลี่ยนได้ จึงเก็บไว้แค่ 6 ชั่วโมง
+
+def current_year_quarter(today=None):
+    today = today or datetime.date.today()
+    return today.year, (today.month - 1) // 3 + 1
+
+def is_closed_period(year, quarter, today=None):
+    """ไตรมาสที่ผ่านไปแล้ว (ข้อมูลแทบไม่เปลี่ยน) -> True"""
+    return (year, quarter) < current_year_quarter(today)
+
+def period_end_timestamp(year, quarter):
+    """เวลา (epoch) ที่ไตรมาสปิด = เที่ยงคืนวันแรกของไตรมาสถัดไป (เวลาเครื่อง เหมือน current_year_quarter)"""
+    year, month = (year + 1, 1) if quarter == 4 else (year, 3 * quarter + 1)
+    return time.mktime(datetime.date(year, month, 1).timetuple())
+
+class HtmlCache:
+    """
+    เก็บ HTML ของแต่ละงาน (section, ปี, ไตรมาส) ไว้ในดิสก์
+    - เนื้อหาเก็บเป็น objects/<2 ตัวแรกของ sha256>/<sha256>.html.gz (หน้าเหมือนกันเก็บไฟล์เดียว)
+    - index.sqlite จับคู่ (section, ปี, ไตรมาส) -> sha256 + เวลาที่ดึงมา
+    - หน้าที่ดึงหลังไตรมาสปิดแล้วไม่หมดอายุ, นอกนั้น (รวมหน้าที่ดึงไว้ตอนไตรมาสยังไม่ปิด) หมดอายุตาม `current_ttl`
+    """
+    def __init__(self, root=None, current_ttl=CURRENT_QUARTER_TTL_SECONDS):
+        self.root = root or os.path.join(STATE_DIR, "html_cache")
+        self.current_ttl = current_ttl
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.root, "index.sqlite"), check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS pages (
+            section TEXT, year INTEGER, quarter INTEGER, sha256 TEXT, size INTEGER, fetched_at REAL,
+            PRIMARY KEY (section, year, quarter))""")
+        self._db.commit()
+
+    def _object_path(self, sha256):
+        return os.path.join(self.root, "objects", sha256[:2], f"{sha256}.html.gz")
+
+    def is_fresh(self, year, quarter, fetched_at, now=None):
+        # [แก้ไข] ดูเวลาที่ดึงด้วย: หน้าที่ดึงกลางไตรมาสอาจขาดแถวที่เพิ่มช่วงท้ายไตรมาส จึงยังไม่ถือว่าถาวร
+        if is_closed_period(year, quarter) and fetched_at >= period_end_timestamp(year, quarter): return True
+        return (now or time.time()) - fetched_at < self.current_ttl
+
+    def put(self, section, year, quarter, html):
+        data = html.encode('utf-8')
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self._object_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+                f.write(data)
+            os.replace(tmp_path, path) # เขียนเสร็จค่อยเปลี่ยนชื่อ กันไฟล์ครึ่ง ๆ กลาง ๆ ถ้าโปรแกรมตาย
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                             (section, year, quarter, sha256, len(data), time.time()))
+            self._db.commit()
+        return sha256
+
+    def get(self, section, year, quarter, allow_stale=False):
+        """คืน HTML ถ้ามีในแคชและยังไม่หมดอายุ (allow_stale=True = เอาทุกอันที่มี) ไม่งั้นคืน None"""
+        with self._lock:
+            row = self._db.execute("SELECT sha256, fetched_at FROM pages WHERE section=? AND year=? AND quarter=?",
+                                   (section, year, quarter)).fetchone()
+        html = None
+        if row and (allow_stale or self.is_fresh(year, quarter, row[1])):
+            try:
+                with gzip.open(self._object_path(row[0]), 'rb') as f:
+                    html = f.read().decode('utf-8')
+            except (OSError, EOFError):
+                html = None
+        with self._lock:
+            if html is None: self.misses += 1
+            else: self.hits += 1
+        return html
+
+    def prune(self):
+        """ลบ entry ที่หมดอายุ แล้วลบไฟล์ที่ไม่มี entry ไหนอ้างถึงแล้ว คืน (จำนวน entry, จำนวนไฟล์) ที่ลบ"""
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute("SELECT section, year, quarter, fetched_at FROM pages").fetchall()
+            expired = [r[:3] for r in rows if not self.is_fresh(r[1], r[2], r[3], now)]
+            self._db.executemany("DELETE FROM pages WHERE section=? AND year=? AND quarter=?", expired)
+            self._db.commit()
+            referenced = {r[0] for r in self._db.execute("SELECT sha256 FROM pages")}
+        removed_files = 0
+        objects_dir = os.path.join(self.root, "objects")
+        for dirpath, _, filenames in os.walk(objects_dir):
+            for filename in filenames:
+                if filename.split('.')[0] not in referenced:
+                    os.remove(os.path.join(dirpath, filename))
+                    removed_files += 1
+        return len(expired), removed_files
+
+# --- 4.3 [ใหม่] Manifest สำหรับรันแบบ incremental (ข้ามงานที่ไม่เปลี่ยน + ทำต่อจากจุดที่ค้าง) ---
+def page_content_hash(html):
+    """hash เฉพาะส่วนตาราง catalog (ส่วนหัว/ท้ายหน้าอาจมีค่าที่เปลี่ยนทุกครั้งที่โหลด)"""
+    start, end = html.find('catalog-table'), html.rfind('</table>')
+    fragment = html[start:end] if 0 <= start < end else html
+    return hashlib.sha256(fragment.encode('utf-8')).hexdigest()
+
+def product_record_hash(product):
+    return hashlib.sha1(json.dumps(product, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+class ScrapeManifest:
+    """
+    บันทึกสถานะการรันลง SQLite
+    - runs: รอบการรัน ถ้ารอบล่าสุดยังไม่จบ (โปรแกรมตาย) รอบถัดไปจะทำต่อจากรอบนั้น
+    - periods: hash ของหน้าแต่ละงาน + รอบล่าสุดที่ทำเสร็จ
+    - products: hash ของ dict สินค้าแต่ละ product_id ที่ส่งขึ้น Supabase สำเร็จแล้ว
+    """
+    def __init__(self, path=None):
+        path = path or os.path.join(STATE_DIR, "manifest.sqlite")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT, started_at REAL, finished_at REAL);
+            CREATE TABLE IF NOT EXISTS periods (
+                section TEXT, year INTEGER, quarter INTEGER, content_hash TEXT, product_count INTEGER,
+                run_id INTEGER, finished_at REAL, PRIMARY KEY (section, year, quarter));
+            CREATE TABLE IF NOT EXISTS products (product_id TEXT PRIMARY KEY, record_hash TEXT, updated_at REAL);
+        """)
+        self._db.commit()
+
+    def start_run(self, resume=True):
+        """คืน (run_id, resumed) ถ้ารอบก่อนหน้ายังไม่จบและ resume=True จะใช้ run_id เดิม"""
+        with self._lock:
+            row = self._db.execute("SELECT run_id, finished_at FROM runs ORDER BY run_id DESC LIMIT 1").fetchone()
+            if resume and row and row[1] is None:
+                return row[0], True
+            cur = self._db.execute("INSERT INTO runs (started_at) VALUES (?)", (time.time(),))
+            self._db.commit()
+            return cur.lastrowid, False
+
+    def finish_run(self, run_id):
+        with self._lock:
+            self._db.execute("UPDATE runs SET finished_at=? WHERE run_id=?", (time.time(), run_id))
+            self._db.commit()
+
+    def is_done_in_run(self, run_id, section, year, quarter):
+        with self._lock:
+            row = self._db.execute("SELECT run_id FROM periods WHERE section=? AND year=? AND quarter=?",
+                                   (section, year, quarter)).fetchone()
+        return bool(row) and row[0] == run_id
+
+    def period_hash(self, section, year, quarter):
+        with self._lock:
+            row = self._db.execute("SELECT content_hash FROM periods WHERE section=? AND year=? AND quarter=?",
+                                   (section, year, quarter)).fetchone()
+        return row[0] if row else None
+
+    def mark_period_done(self, run_id, section, year, quarter, content_hash, product_count):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO periods VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (section, year, quarter, content_hash, product_count, run_id, time.time()))
+            self._db.commit()
+
+    def split_changed(self, products):
+        """แยกสินค้าเป็น (ใหม่/เปลี่ยน, ไม่เปลี่ยน) เทียบกับ hash ที่ส่งสำเร็จครั้งล่าสุด"""
+        hashes = {p["product_id"]: product_record_hash(p) for p in products}
+        known = {}
+        ids = list(hashes)
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                known.update(self._db.execute(
+                    f"SELECT product_id, record_hash FROM products WHERE product_id IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall())
+        changed = [p for p in products if known.get(p["product_id"]) != hashes[p["product_id"]]]
+        unchanged = [p for p in products if known.get(p["product_id"]) == hashes[p["product_id"]]]
+        return changed, unchanged
+
+    def commit_products(self, products):
+        """เรียกหลังส่งขึ้น Supabase สำเร็จเท่านั้น (ถ้าส่งไม่สำเร็จ รอบหน้าจะส่งใหม่)"""
+        now = time.time()
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO products VALUES (?, ?, ?)",
+                                 [(p["product_id"], product_record_hash(p), now) for p in products])
+            self._db.commit()
+
 # --- 5. [แก้ไข] Dictionary คำสำคัญ (แบบจัดลำดับความสำคัญ) ---
 CATEGORIES_KEYWORDS = {
     # 🎯 หมวดหลัก (คำเฉพาะ จะถูกให้คะแนนสูง)
@@ -177,33 +883,286 @@ CATEGORIES_KEYWORDS = {
         "secondary": ['ผนัง', 'ฝ้า', 'ปูพื้น', 'บุผนัง'] # คำกว้างๆ ที่อาจซ้ำกับหมวดอื่น
     }
 }
+# --- 5.1 [ใหม่] จัดหมวดหมู่แบบ batch + แคชผลลัพธ์ (ชื่อเดิมไม่ต้องถามโมเดลซ้ำ) ---
+DEFAULT_CATEGORY = "อื่นๆ"
+
+def normalize_product_name(product_name):
+    """key ของแคช/ทางลัด keyword: ตัดช่องว่างซ้ำ + ตัวพิมพ์เล็ก (ไม่ใช้เป็น input ของโมเดล: ช่องว่างเปลี่ยน n-gram)"""
+    return " ".join(product_name.split()).lower()
+
+CATEGORY_CACHE_VERSION = 2 # v2: predict() ได้ชื่อเดิม ไม่ใช่ key ที่ normalize แล้ว (ผลใน v1 อาจต่างจากถามทีละชื่อ)
+
+def model_fingerprint(path=MODEL_PATH):
+    """hash ของไฟล์โมเดล: เทรนโมเดลใหม่ -> fingerprint เปลี่ยน -> แคชเก่าใช้ไม่ได้โดยอัตโนมัติ"""
+    digest = hashlib.sha256(f"category-cache-v{CATEGORY_CACHE_VERSION}".encode())
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+class CategoryCache:
+    """
+    แคช (ชื่อสินค้า -> หมวดหมู่) 2 ชั้น
+    - ใน memory แบบ LRU (ไม่เกิน `max_entries` ชื่อ)
+    - ใน SQLite (ข้ามรอบการรันได้) แยกตาม fingerprint ของโมเดล
+    """
+    def __init__(self, fingerprint, path=None, max_entries=50000):
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        path = path or os.path.join(STATE_DIR, "category_cache.sqlite")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS categories (
+            fingerprint TEXT, name_key TEXT, category TEXT, PRIMARY KEY (fingerprint, name_key))""")
+        self._db.commit()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _remember(self, key, category):
+        self._memory[key] = category
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                    self.stats["memory_hits"] += 1
+                else:
+                    missing.append(key)
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT name_key, category FROM categories WHERE fingerprint=? AND name_key IN ({','.join('?' * len(chunk))})",
+                    [self.fingerprint] + chunk).fetchall()
+                for key, category in rows:
+                    found[key] = category
+                    self._remember(key, category)
+            self.stats["disk_hits"] += len(found) - (len(keys) - len(missing))
+            self.stats["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, categories):
+        with self._lock:
+            for key, category in categories.items():
+                self._remember(key, category)
+            self._db.executemany("INSERT OR REPLACE INTO categories VALUES (?, ?, ?)",
+                                 [(self.fingerprint, key, category) for key, category in categories.items()])
+            self._db.commit()
+
+_category_cache = None
+_category_cache_lock = threading.Lock()
+CLASSIFY_STATS = {"names": 0, "unique": 0, "fast_path": 0, "predict_calls": 0, "predicted": 0, "seconds": 0.0}
+
+def get_category_cache():
+    global _category_cache
+    with _category_cache_lock:
+        if _category_cache is None and get_category_classifier() is not None:
+            try:
+                _category_cache = CategoryCache(model_fingerprint())
+            except OSError as e:
+                print(f"   ⚠️ เปิดแคชหมวดหมู่ไม่ได้ (จะถามโมเดลทุกชื่อ): {e}")
+    return _category_cache
+
+def classify_product_names(product_names):
+    """
+    จัดหมวดหมู่ทั้ง list ในครั้งเดียว: ชื่อที่ keyword ตัดสินได้ชัดเจนใช้ทางลัดเลย (ไม่ต้องโหลดโมเดล)
+    ที่เหลือดูแคชก่อน แล้วส่งเฉพาะชื่อที่ไม่เคยเห็นเข้า predict() รอบเดียว
+    predict() ได้ชื่อเดิมตามที่ส่งมา (ผลเท่ากับถามทีละชื่อแบบเดิม) ส่วน normalize_product_name ใช้เป็น key แคชเท่านั้น
+    ชื่อที่ต่างกันแค่ช่องว่าง/ตัวพิมพ์จึงใช้ผลของชื่อแรกที่เคยทำนายร่วมกัน
+    คืน list หมวดหมู่ตามลำดับเดิม (ไม่มีชื่อ/ไม่มีโมเดล = 'อื่นๆ')
+    """
+    with TRACER.span("classify", names=len(product_names)):
+        return _classify_product_names(product_names)
+
+def _classify_product_names(product_names):
+    start = time.perf_counter()
+    keys = [normalize_product_name(name) if name else None for name in product_names]
+    originals = {}  # key -> ชื่อเดิมตัวแรกที่ได้ key นี้ (ส่งเข้าโมเดลแทน key)
+    for key, name in zip(keys, product_names):
+        if key: originals.setdefault(key, name)
+    unique_keys = list(originals)
+    categories = {}
+    if KEYWORD_FAST_PATH:
+        for key in unique_keys:
+            category = KEYWORD_MATCHER.decide(key)
+            if category: categories[key] = category
+    fast_path = len(categories)
+    remaining = [key for key in unique_keys if key not in categories]
+    classifier = get_category_classifier() if remaining else None
+    if classifier is not None:
+        cache = get_category_cache()
+        if cache is not None:
+            categories.update(cache.get_many(remaining))
+        to_predict = [key for key in remaining if key not in categories]
+        if to_predict:
+            try:
+                predictions = classifier.predict([originals[key] for key in to_predict])
+                predicted = {key: str(category) for key, category in zip(to_predict, predictions)}
+                categories.update(predicted)
+                if cache is not None: cache.put_many(predicted)
+                with _category_cache_lock:
+                    CLASSIFY_STATS["predict_calls"] += 1
+                    CLASSIFY_STATS["predicted"] += len(to_predict)
+            except Exception as e:
+                print(f"   - ⚠️ เกิด Error ตอนใช้ AI (จะใช้ 'อื่นๆ'): {e}")
+    with _category_cache_lock:
+        CLASSIFY_STATS["names"] += len(product_names)
+        CLASSIFY_STATS["unique"] += len(unique_keys)
+        CLASSIFY_STATS["fast_path"] += fast_path
+        CLASSIFY_STATS["seconds"] += time.perf_counter() - start
+    return [categories.get(key, DEFAULT_CATEGORY) if key else DEFAULT_CATEGORY for key in keys]
+
+def print_classify_stats():
+    s = CLASSIFY_STATS
+    line = f"จัดหมวดหมู่ {s['names']} ชื่อ ใน {s['seconds']:.2f}s (เรียก predict {s['predict_calls']} ครั้ง, {s['predicted']} ชื่อ)"
+    if s["unique"]:
+        line += f" | ทางลัด keyword {s['fast_path']}/{s['unique']} ชื่อ ({s['fast_path'] / s['unique'] * 100:.1f}%)"
+    if _category_cache is not None:
+        c = _category_cache.stats
+        lookups = c["memory_hits"] + c["disk_hits"] + c["misses"]
+        hit_rate = (c["memory_hits"] + c["disk_hits"]) / lookups * 100 if lookups else 0.0
+        line += f" | แคช hit {hit_rate:.1f}% (memory {c['memory_hits']}, disk {c['disk_hits']}, miss {c['misses']})"
+    print(line)
+
+# --- 5.2 [ใหม่] ทางลัดจาก Keyword (ชื่อที่ keyword ตัดสินได้ชัด ไม่ต้องถามโมเดล) ---
+# ปิดได้ด้วย TGO_KEYWORD_FAST_PATH=0 (ให้โมเดลตัดสินทุกชื่อเหมือนเดิม)
+KEYWORD_FAST_PATH = os.environ.get("TGO_KEYWORD_FAST_PATH", "1") != "0"
+
+class KeywordMatcher:
+    """
+    รวม keyword ทุกหมวดใน CATEGORIES_KEYWORDS เป็น automaton เดียว (Aho-Corasick)
+    อ่านชื่อสินค้ารอบเดียวก็เจอ keyword ทุกคำ รวมคำที่ซ้อนกันด้วย (เช่น 'กาวซีเมนต์' เจอทั้ง 'กาวซีเมนต์', 'กาว', 'ซีเมนต์')
+    - คะแนนหมวด = priority คำละ `priority_weight` + secondary คำละ `secondary_weight`
+    - decide() คืนหมวดเมื่อคะแนนสูงสุดถึง priority_weight และมากกว่าหมวดที่สอง `margin` เท่า
+      นอกนั้น (ไม่เจอ keyword / ก้ำกึ่ง) คืน None ให้โมเดลตัดสิน
+    """
+    def __init__(self, keywords, priority_weight=3, secondary_weight=1, margin=2.0):
+        self.priority_weight = priority_weight
+        self.margin = margin
+        self._goto = [{}]
+        self._output = [[]]
+        for category, groups in keywords.items():
+            for kind, weight in (("priority", priority_weight), ("secondary", secondary_weight)):
+                for word in groups.get(kind, []):
+                    self._add(word.lower(), (category, weight))
+        self._fail = [0] * len(self._goto)
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, child in self._goto[state].items():
+                pending.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0) if state else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def _add(self, word, hit):
+        state = 0
+        for char in word:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].append(hit)
+
+    def scores(self, text):
+        """{หมวด: คะแนน} ของ keyword ทุกคำที่เจอใน text (ต้อง lower() มาแล้ว)"""
+        scores = defaultdict(int)
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for category, weight in output[state]:
+                scores[category] += weight
+        return scores
+
+    def decide(self, text):
+        scores = self.scores(text)
+        if not scores:
+            return None
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best, best_score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0
+        if best_score >= self.priority_weight and best_score > runner_up and best_score >= self.margin * runner_up:
+            return best
+        return None
+
+KEYWORD_MATCHER = KeywordMatcher(CATEGORIES_KEYWORDS)
+
 # --- 6. ฟังก์ชันแยกข้อมูล ([แก้ไข] ใช้โมเดล AI แทน Keyword) ---
-def parse_product_data(html_content, year_be, quarter): # เพิ่ม quarter สำหรับ Debug
-    if not html_content: return []
-    print(f"   กำลังแยกข้อมูล (Parsing) ปี {year_be} ไตรมาส {quarter} แบบการ์ด...")
-    # ... (โค้ด BeautifulSoup, ค้นหา main_table, product_rows เหมือนเดิม) ...
+# 🎯 [ใหม่] เลือก parser ได้ 2 แบบ (ผลลัพธ์ต้องเหมือนกันทุก field)
+#   - "bs4":  BeautifulSoup + html.parser (ตัวเดิม ใช้เป็นตัวอ้างอิง)
+#   - "lxml": lxml + XPath ที่ compile ไว้ + ดึง label/value จากข้อความรอบเดียว (เร็วกว่าหลายเท่า)
+PARSER_BACKEND = os.environ.get("TGO_PARSER_BACKEND", "lxml" if lxml_html is not None else "bs4")
+
+# [แก้ไข] แถวที่ไม่มีหัวการ์ด (ไม่มี ID จริง) เดิมใช้ CFP_Y{ปี}Q{ไตรมาส}_R{ลำดับแถว} ซึ่งเปลี่ยนทุกครั้งที่ลำดับแถวขยับ
+# (เกิดแถวผีซ้ำใน Supabase) ตอนนี้ใช้ hash ของเนื้อหาแทน: แถวเดิมได้ ID เดิมเสมอ ไม่ว่าจะอยู่แถวไหน/ไตรมาสไหน
+FALLBACK_PRODUCT_ID = "CFP_FALLBACK" # ค่าชั่วคราวระหว่าง parse (มีคำว่า CFP จึงได้ label_type = CFP เหมือนเดิม)
+FALLBACK_ID_FIELDS = ("label_type", "product_name", "company_name", "functional_unit", "scope",
+                      "carbon_value", "carbon_unit", "cert_start_date", "cert_end_date")
+
+def stable_fallback_id(product):
+    key = json.dumps([" ".join(str(product.get(name) or "").split()) for name in FALLBACK_ID_FIELDS], ensure_ascii=False)
+    return f"CFP_H{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}"
+
+def _make_product(product_id, label_logo_type, product_name, functional_unit, scope, company_name,
+                  contact_person, phone, email, image_url, detail_page_url, carbon_value, carbon_unit,
+                  cert_start_date_iso, cert_end_date_iso):
+    product = {
+        "product_id": product_id, "label_type": label_logo_type,
+        "product_name": product_name, "category": "อื่นๆ", # 🎯 Category จาก AI จะเติมทีหลังใน parse_product_data
+        "functional_unit": functional_unit, "scope": scope,
+        "company_name": company_name, "contact_person": contact_person,
+        "phone": phone, "email": email, "image_url": image_url,
+        "detail_page_url": detail_page_url,
+        "carbon_value": carbon_value, "carbon_unit": carbon_unit,
+        "cert_start_date": cert_start_date_iso, "cert_end_date": cert_end_date_iso,
+    }
+    if product_id == FALLBACK_PRODUCT_ID:
+        product["product_id"] = stable_fallback_id(product)
+    return product
+
+def _label_type_from_id(product_id):
+    if "CFR" in product_id: return "CFR"
+    if "CFP" in product_id: return "CFP"
+    return "UNKNOWN"
+
+def _parse_rows_bs4(html_content, year_be, quarter, classify_names=None):
+    """`classify_names` (list) ถ้าส่งมา จะเติมชื่อจาก <h1> ของแต่ละแถว (None ถ้าไม่มี) ใช้จัดหมวดหมู่แบบเดิม
+    (ชื่อที่เติมจาก text node ใน col_l ไม่ได้ถามโมเดล -> 'อื่นๆ')"""
     soup = BeautifulSoup(html_content, 'html.parser')
     all_products = []
     main_table = soup.find('table', class_='catalog-table') 
     if not main_table:
-        print(f"   ⚠️ ไม่พบตารางหลัก 'catalog-table' ในปี {year_be}/Q{quarter}!")
+        print(f"   ⚠️ ไม่พบตารางหลัก 'catalog-table' ในปี {year_be}/Q{quarter}!")
         return []
-    product_rows = main_table.find('tbody').find_all('tr', recursive=False)
+    # [แก้ไข] ไม่มี <tbody> -> ใช้ tr ที่อยู่ใต้ตารางโดยตรง (เบราว์เซอร์เติม tbody ให้เอง แต่ HTML ดิบอาจไม่มี)
+    tbody = main_table.find('tbody')
+    product_rows = (tbody or main_table).find_all('tr', recursive=False)
     if not product_rows:
-        print(f"   ⚠️ พบตารางหลัก แต่ไม่พบแถว (tr) โดยตรงในปี {year_be}/Q{quarter}!")
+        print(f"   ⚠️ พบตารางหลัก แต่ไม่พบแถว (tr) โดยตรงในปี {year_be}/Q{quarter}!")
         return []
 
-    processed_count = 0
     for i, row in enumerate(product_rows):
         # ... (โค้ดตั้งค่าตัวแปรเริ่มต้นเหมือนเดิม) ...
         table = row.find('table', class_='catalog-template')
         if not table: continue
         
-        product_id = f"CFP_Y{year_be}Q{quarter}_R{i+1}"; 
+        product_id = FALLBACK_PRODUCT_ID; # ไม่มีหัวการ์ด -> _make_product สร้าง ID จากเนื้อหาแทน
         label_logo_type = "UNKNOWN"; product_name = None; functional_unit = None; scope = None; company_name = None; contact_person = None; phone = None; email = None; image_url = 'N/A'; detail_page_url = None; 
         carbon_value = None; carbon_unit = None; 
         cert_start_date_iso = None; cert_end_date_iso = None
-        category = "อื่นๆ" # 🎯 เริ่มต้นเป็น "อื่นๆ"
 
         try:
             # ... (โค้ดดึง ID, ดึง H1 (product_name) เหมือนเดิม) ...
@@ -219,29 +1178,7 @@ def parse_product_data(html_content, year_be, quarter): # เพิ่ม quarte
             
             name_tag = table.find('h1')
             if name_tag: product_name = name_tag.text.strip()
-            
-            # --- 🎯 [แก้ไข] ตรรกะการจัดหมวดหมู่ (ใช้ AI) ---
-            if product_name and category_classifier: # 1. เช็คว่ามีชื่อ และ โหลดโมเดลสำเร็จ
-                try:
-                    # 2. "ถาม" โมเดล AI (ส่งชื่อผลิตภัณฑ์ไป 1 ชื่อ)
-                    # 💡 หมายเหตุ: ต้องส่งเป็น list [product_name]
-                    predicted_category_list = category_classifier.predict([product_name])
-                    
-                    # 3. รับ "คำตอบ" (จะได้คำตอบกลับมา 1 อัน)
-                    if predicted_category_list:
-                        category = predicted_category_list[0]
-                except Exception as e:
-                    print(f"   - ⚠️ เกิด Error ตอนใช้ AI (จะใช้ 'อื่นๆ'): {e}")
-                    category = "อื่นๆ"
-            
-            # ⛔ [ลบออก] เราไม่ต้องใช้ตรรกะ Scoring (วิธีที่ 1) อีกต่อไป
-            # if product_name:
-            #    product_name_lower = product_name.lower()
-            #    ... (ลบส่วนนี้ทิ้ง) ...
-            # --- 🎯 [สิ้นสุดการแก้ไข] ---
-
-
-            # ... (โค้ดส่วนที่เหลือ (col_r, col_l, H4, Regex, product_data) ทั้งหมดเหมือนเดิม) ...
+            h1_name = product_name
             
             col_r = table.find('td', class_='catalog-col-r')
             if col_r:
@@ -305,135 +1242,1672 @@ def parse_product_data(html_content, year_be, quarter): # เพิ่ม quarte
                 if date_match:
                     cert_start_date_iso = convert_be_to_iso(date_match.group(2)); cert_end_date_iso = convert_be_to_iso(date_match.group(3))
             
-            product_data = {
-                "product_id": product_id, "label_type": label_logo_type,
-                "product_name": product_name, "category": category, # 🎯 นี่คือ Category ที่มาจาก AI
-                "functional_unit": functional_unit, "scope": scope,
-                "company_name": company_name, "contact_person": contact_person,
-                "phone": phone, "email": email, "image_url": image_url,
-                "detail_page_url": detail_page_url,
-                "carbon_value": carbon_value, "carbon_unit": carbon_unit,
-                "cert_start_date": cert_start_date_iso, "cert_end_date": cert_end_date_iso,
-            }
-            all_products.append(product_data)
-            processed_count += 1
+            all_products.append(_make_product(
+                product_id, label_logo_type, product_name, functional_unit, scope, company_name,
+                contact_person, phone, email, image_url, detail_page_url, carbon_value, carbon_unit,
+                cert_start_date_iso, cert_end_date_iso))
+            if classify_names is not None: classify_names.append(h1_name)
         except Exception as e:
-            # print(f"   - ข้ามแถวที่ {i+1} เพราะ Error: {e} (ID: {product_id})")
+            # print(f"   - ข้ามแถวที่ {i+1} เพราะ Error: {e} (ID: {product_id})")
             continue
     return all_products
 
+# --- 6.1 [ใหม่] parser แบบ lxml ---
+# regex ของแต่ละ field (compile ครั้งเดียว) ตรงกับ re.search ใน _parse_rows_bs4 ทุกตัว
+_FIELD_PATTERNS = {
+    "functional_unit": re.compile(r"หน่วยการทำงาน:\s*(.+)"),
+    "scope": re.compile(r"ขอบเขต:\s*(.+)"),
+    "contact_person": re.compile(r"ติดต่อ\s*(.+)"),
+    "phone": re.compile(r"โทรศัพท์\s*([^#\n]+)(?:#(\d+))?"),
+    "email": re.compile(r"อีเมล์\s*(.+)"),
+    "carbon": re.compile(r"(คาร์บอนฟุตพริ้นท์|Carbon Footprint|ลดการปล่อย)[^:]*:\s*([\d,.-]+)\s*(.*)"),
+    "date": re.compile(r"(วันรับรอง|Date of Approval)[^:]*:\s*(\d{1,2}/\d{1,2}/\d{4})\s*-\s*(\d{1,2}/\d{1,2}/\d{4})"),
+}
+_LABEL_TO_FIELD = {
+    "หน่วยการทำงาน:": "functional_unit", "ขอบเขต:": "scope", "ติดต่อ": "contact_person",
+    "โทรศัพท์": "phone", "อีเมล์": "email",
+    "คาร์บอนฟุตพริ้นท์": "carbon", "Carbon Footprint": "carbon", "ลดการปล่อย": "carbon",
+    "วันรับรอง": "date", "Date of Approval": "date",
+}
+# หา "ตำแหน่ง label" ทุกตัวในรอบเดียว แล้วค่อย match regex ของ field นั้นตรงตำแหน่งนั้น
+# (ผลเท่ากับ re.search ทีละตัว เพราะ match ซ้ายสุดของแต่ละ regex ต้องเริ่มที่ label ของมันเสมอ)
+_LABEL_SCAN = re.compile("|".join(re.escape(label) for label in _LABEL_TO_FIELD))
+
+def _scan_labeled_fields(text):
+    """คืน {field: match} ของ match แรก (ซ้ายสุด) ของแต่ละ field"""
+    found = {}
+    for label_match in _LABEL_SCAN.finditer(text):
+        field = _LABEL_TO_FIELD[label_match.group()]
+        if field in found: continue
+        field_match = _FIELD_PATTERNS[field].match(text, label_match.start())
+        if field_match:
+            found[field] = field_match
+            if len(found) == len(_FIELD_PATTERNS): break
+    return found
+
+if lxml_html is not None:
+    def _class_xpath(path, tag, css_class):
+        return etree.XPath(f"{path}{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {css_class} ')]")
+
+    _XP_MAIN_TABLE = _class_xpath("//", "table", "catalog-table")
+    _XP_TEMPLATE = _class_xpath(".//", "table", "catalog-template")
+    _XP_HEADER = _class_xpath(".//", "th", "catalog-header")
+    _XP_COL_R = _class_xpath(".//", "td", "catalog-col-r")
+    _XP_COL_L = _class_xpath(".//", "td", "catalog-col-l")
+    _XP_QRCODE = _class_xpath(".//", "div", "catalog-qrcode")
+    _LXML_PARSER = etree.HTMLParser(encoding='utf-8')
+
+def _first(nodes):
+    return nodes[0] if nodes else None
+
+def _lxml_text(el):
+    """เหมือน bs4 `.text` (ต่อข้อความทุก node ข้างใน ไม่รวม comment)"""
+    return "".join(_lxml_strings(el))
+
+def _lxml_strings(el, include_tail=False):
+    """ไล่ข้อความตามลำดับเอกสารแบบเดียวกับ bs4 get_text (ข้าม comment/script/style แต่เก็บ tail ของมัน)"""
+    if isinstance(el.tag, str) and el.tag not in ('script', 'style'):
+        if el.text: yield el.text
+        for child in el:
+            yield from _lxml_strings(child, include_tail=True)
+    if include_tail and el.tail: yield el.tail
+
+def _lxml_direct_strings(el):
+    """เหมือน bs4 find_all(string=True, recursive=False) / .contents ที่เป็น str (รวม comment)"""
+    strings = [el.text] if el.text else []
+    for child in el:
+        if not isinstance(child.tag, str) and child.tag is etree.Comment and child.text:
+            strings.append(child.text)
+        if child.tail: strings.append(child.tail)
+    return strings
+
+def _parse_rows_lxml(html_content, year_be, quarter, classify_names=None):
+    # ให้ผลเหมือน _parse_rows_bs4 (html.parser) ทุก field ยกเว้น HTML ผิดรูปที่ libxml2 ปิดแท็กให้แบบเบราว์เซอร์
+    # เช่น <p>x <h4>..</h4> y</p> -> ' y' เป็น text node ตรงของ col_l (ดู KNOWN_PARSER_DIVERGENCES ใน benchmark.py)
+    root = etree.fromstring(html_content.encode('utf-8'), _LXML_PARSER)
+    main_table = _first(_XP_MAIN_TABLE(root)) if root is not None else None
+    if main_table is None:
+        print(f"   ⚠️ ไม่พบตารางหลัก 'catalog-table' ในปี {year_be}/Q{quarter}!")
+        return []
+    tbody = main_table.find('.//tbody')
+    product_rows = (tbody if tbody is not None else main_table).findall('tr')
+    if not product_rows:
+        print(f"   ⚠️ พบตารางหลัก แต่ไม่พบแถว (tr) โดยตรงในปี {year_be}/Q{quarter}!")
+        return []
+
+    all_products = []
+    for i, row in enumerate(product_rows):
+        table = _first(_XP_TEMPLATE(row))
+        if table is None: continue
+
+        product_id = FALLBACK_PRODUCT_ID
+        product_name = functional_unit = scope = company_name = contact_person = phone = email = None
+        image_url = 'N/A'; detail_page_url = None
+        carbon_value = None; carbon_unit = None
+        cert_start_date_iso = None; cert_end_date_iso = None
+
+        # แถวที่โครงสร้างไม่ครบ (เช่น ไม่มี th.catalog-header) จะถูกข้าม เหมือน try/except ของตัวเดิม
+        header = _first(_XP_HEADER(table))
+        if header is None: continue
+        header_span = header.find('.//span')
+        header_text = _lxml_text(header_span).strip() if header_span is not None else ""
+        if header_text: product_id = header_text
+        label_logo_type = _label_type_from_id(product_id)
+
+        name_tag = table.find('.//h1')
+        if name_tag is not None: product_name = _lxml_text(name_tag).strip()
+        h1_name = product_name
+
+        col_r = _first(_XP_COL_R(table))
+        if col_r is not None:
+            img_tag = col_r.find('.//img')
+            if img_tag is None and col_r.find('.//p') is None: continue
+            img_src = img_tag.get('src') if img_tag is not None else None
+            if img_src:
+                image_url = img_src if img_src.startswith('http') else BASE_URL + img_src.lstrip('/')
+            qr_div = _first(_XP_QRCODE(col_r))
+            if qr_div is not None:
+                qr_link = qr_div.find('.//a')
+                if qr_link is not None and qr_link.get('href'): detail_page_url = qr_link.get('href')
+
+        col_l = _first(_XP_COL_L(table))
+        if col_l is not None:
+            if not product_name:
+                direct_strings = _lxml_direct_strings(col_l)
+                if direct_strings: product_name = direct_strings[0].strip()
+
+            carbon_h4 = col_l.find('.//h4')
+            carbon_span = carbon_h4.find('.//span') if carbon_h4 is not None else None
+            carbon_unit_tag = carbon_span.find('.//i') if carbon_span is not None else None
+            if carbon_unit_tag is not None:
+                carbon_unit = _lxml_text(carbon_unit_tag).strip()
+                value_text_nodes = _lxml_direct_strings(carbon_span)
+                if value_text_nodes:
+                    carbon_value_str = value_text_nodes[0].strip().replace(',', '')
+                    if carbon_value_str and carbon_value_str != '-':
+                        try: carbon_value = float(carbon_value_str)
+                        except ValueError: pass
+
+            full_text_col_l = "\n".join(s for s in (t.strip() for t in _lxml_strings(col_l)) if s)
+            fields = _scan_labeled_fields(full_text_col_l)
+
+            if "functional_unit" in fields: functional_unit = fields["functional_unit"].group(1).strip()
+            if "scope" in fields: scope = fields["scope"].group(1).strip()
+            strong_tag = col_l.find('.//strong')
+            if strong_tag is not None: company_name = _lxml_text(strong_tag).strip()
+            if "contact_person" in fields: contact_person = fields["contact_person"].group(1).strip()
+            if "phone" in fields:
+                phone = fields["phone"].group(1).strip()
+                if fields["phone"].group(2): phone += f" #{fields['phone'].group(2).strip()}"
+            if "email" in fields: email = fields["email"].group(1).strip()
+
+            if carbon_value is None and "carbon" in fields:
+                carbon_match = fields["carbon"]
+                carbon_value_str = carbon_match.group(2).replace(',', '')
+                if not carbon_unit:
+                    carbon_unit = carbon_match.group(3).strip()
+                if carbon_value_str and carbon_value_str != '-':
+                    try: carbon_value = float(carbon_value_str)
+                    except ValueError: pass
+
+            if "date" in fields:
+                cert_start_date_iso = convert_be_to_iso(fields["date"].group(2))
+                cert_end_date_iso = convert_be_to_iso(fields["date"].group(3))
+
+        all_products.append(_make_product(
+            product_id, label_logo_type, product_name, functional_unit, scope, company_name,
+            contact_person, phone, email, image_url, detail_page_url, carbon_value, carbon_unit,
+            cert_start_date_iso, cert_end_date_iso))
+        if classify_names is not None: classify_names.append(h1_name)
+    return all_products
+
+PARSER_BACKENDS = {"bs4": _parse_rows_bs4, "lxml": _parse_rows_lxml}
+
+def parse_product_data(html_content, year_be, quarter, backend=None): # เพิ่ม quarter สำหรับ Debug
+    if not html_content: return []
+    backend = backend or PARSER_BACKEND
+    if backend == "lxml" and lxml_html is None:
+        backend = "bs4"
+    print(f"   กำลังแยกข้อมูล (Parsing) ปี {year_be} ไตรมาส {quarter} แบบการ์ด ({backend})...")
+    with TRACER.span("parse", backend=backend, year=year_be, quarter=quarter) as span_attrs:
+        classify_names = []
+        all_products = PARSER_BACKENDS[backend](html_content, year_be, quarter, classify_names=classify_names)
+        span_attrs["rows"] = len(all_products)
+    TRACER.count("rows_parsed", len(all_products))
+    # 🎯 [แก้ไข] ถามโมเดล AI ครั้งเดียวต่อหน้า (แทนทีละแถว) ผ่านแคช
+    # ใช้เฉพาะชื่อจาก <h1> เหมือนเดิม (แถวที่ได้ชื่อจาก text node ใน col_l = 'อื่นๆ')
+    categories = classify_product_names(classify_names)
+    for product_data, category in zip(all_products, categories):
+        product_data["category"] = category # 🎯 นี่คือ Category ที่มาจาก AI
+    return all_products
+
+# --- 6.2 [ใหม่] ดึงหน้ารายละเอียด (detail_page_url) พร้อมกันหลายหน้า แล้วเติม field เพิ่ม (--enrich-details) ---
+# ได้ field เพิ่มใน product["detail_fields"] = {ชื่อหัวข้อ: ค่า} (ตาราง materials ต้องมีคอลัมน์ jsonb ชื่อนี้)
+DETAIL_CONCURRENCY = 8 # จำนวน request ที่ค้างพร้อมกันได้สูงสุด (รวมทุก worker)
+DETAIL_RPS_PER_HOST = 2.0 # request ต่อวินาทีต่อ host
+DETAIL_CACHE_TTL_SECONDS = 30 * 24 * 3600
+DETAIL_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+def _clean_label(text):
+    return " ".join(text.split()).rstrip(':：').strip()
+
+def parse_detail_fields(html_content):
+    """
+    ดึงคู่ หัวข้อ/ค่า จากหน้ารายละเอียด: แถวตารางที่มี 2 ช่อง (th/td) และ <dt>/<dd>
+    หัวข้อซ้ำใช้ค่าแรก, ค่าว่างไม่เก็บ
+    """
+    fields = {}
+    if not html_content: return fields
+    soup = BeautifulSoup(html_content, 'lxml' if lxml_html is not None else 'html.parser')
+    pairs = []
+    for row in soup.find_all('tr'):
+        cells = row.find_all(['th', 'td'], recursive=False)
+        if len(cells) == 2:
+            pairs.append((cells[0].get_text(" ", strip=True), cells[1].get_text(" ", strip=True)))
+    for term in soup.find_all('dt'):
+        definition = term.find_next_sibling('dd')
+        if definition is not None:
+            pairs.append((term.get_text(" ", strip=True), definition.get_text(" ", strip=True)))
+    for label, value in pairs:
+        label, value = _clean_label(label), " ".join(value.split())
+        if label and value and label not in fields:
+            fields[label] = value
+    return fields
+
+class DetailCache:
+    """แคชหน้ารายละเอียดตาม URL (SQLite + gzip) หมดอายุตาม `ttl` วินาที"""
+    def __init__(self, path=None, ttl=DETAIL_CACHE_TTL_SECONDS):
+        path = path or os.path.join(STATE_DIR, "detail_cache.sqlite")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS details (url TEXT PRIMARY KEY, html BLOB, fetched_at REAL)")
+        self._db.commit()
+
+    def get(self, url, allow_stale=False):
+        with self._lock:
+            row = self._db.execute("SELECT html, fetched_at FROM details WHERE url=?", (url,)).fetchone()
+        if row and (allow_stale or time.time() - row[1] < self.ttl):
+            return gzip.decompress(row[0]).decode('utf-8')
+        return None
+
+    def put(self, url, html_content):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO details VALUES (?, ?, ?)",
+                             (url, gzip.compress(html_content.encode('utf-8'), compresslevel=6), time.time()))
+            self._db.commit()
+
+class DetailEnricher:
+    """
+    ดึงหน้ารายละเอียดของสินค้าทั้งหน้าพร้อมกันด้วย aiohttp
+    - event loop + ClientSession ตัวเดียวใน thread แยก (ใช้ connection ซ้ำข้ามทุกงาน/ทุก worker)
+    - จำกัด request ที่ค้างพร้อมกัน (`concurrency`) และความถี่ต่อ host (`per_host_rps`)
+    - retry แบบ exponential backoff เมื่อ timeout/connection error/429/5xx, หน้าที่ดึงได้เก็บลง DetailCache
+    ใช้: enricher.enrich(products) (แก้ dict เดิมโดยเติม "detail_fields") และเรียก close() ตอนจบ
+    """
+    def __init__(self, base_url=BASE_URL, concurrency=DETAIL_CONCURRENCY, per_host_rps=DETAIL_RPS_PER_HOST,
+                 retries=3, timeout_seconds=30, backoff_seconds=1.0, cache=None):
+        # import ตอนสร้างเท่านั้น aiohttp ใช้เวลา import ~0.15s ซึ่งรอบที่ไม่ได้ใช้ --enrich-details ไม่ควรต้องจ่าย
+        try:
+            import aiohttp
+        except ImportError:
+            raise RuntimeError("ต้องติดตั้ง aiohttp ก่อนใช้ --enrich-details (pip install aiohttp)") from None
+        self._aiohttp = aiohttp
+        self.base_url = base_url.rstrip('/') + '/'
+        self.concurrency = concurrency
+        self.per_host_rps = per_host_rps
+        self.retries = retries
+        self.timeout_seconds = timeout_seconds
+        self.backoff_seconds = backoff_seconds
+        self.cache = cache
+        self.stats = {"urls": 0, "cache_hits": 0, "fetched": 0, "not_found": 0, "failed": 0, "retries": 0,
+                      "bytes": 0, "seconds": 0.0}
+        self._stats_lock = threading.Lock()
+        self._host_limiters = {}
+        self._session = None
+        self._semaphore = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="detail-fetcher", daemon=True)
+        self._thread.start()
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _limiter(self, host):
+        # เรียกใน event loop thread เท่านั้น จึงไม่ต้องล็อก
+        if host not in self._host_limiters:
+            self._host_limiters[host] = RateLimiter(self.per_host_rps)
+        return self._host_limiters[host]
+
+    async def _fetch_one(self, url):
+        aiohttp = self._aiohttp
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency, ssl=False), # เหตุผลเดียวกับ session.verify=False
+                timeout=aiohttp.ClientTimeout(total=self.timeout_seconds), headers=HTTP_HEADERS)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = self._limiter(urlsplit(url).netloc)
+        for attempt in range(self.retries + 1):
+            delay = limiter.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                async with self._semaphore:
+                    with TRACER.span("fetch.detail"):
+                        async with self._session.get(url) as response:
+                            if response.status == 404:
+                                self._count("not_found")
+                                return None
+                            if response.status not in DETAIL_RETRY_STATUSES:
+                                response.raise_for_status()
+                                html_content = await response.text(errors='replace')
+                                self._count("fetched")
+                                self._count("bytes", len(html_content))
+                                return html_content
+                            error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+                if isinstance(e, aiohttp.ClientResponseError) and e.status not in DETAIL_RETRY_STATUSES:
+                    break
+            if attempt < self.retries:
+                self._count("retries")
+                await asyncio.sleep(self.backoff_seconds * (2 ** attempt) * random.uniform(0.5, 1.5))
+        print(f"     -> ⚠️ ดึงหน้ารายละเอียดไม่สำเร็จ {url}: {error}")
+        self._count("failed")
+        return None
+
+    async def _fetch_all(self, urls):
+        return await asyncio.gather(*(self._fetch_one(url) for url in urls))
+
+    def fetch_pages(self, urls):
+        """คืน {url: html หรือ None} ใช้แคชก่อน ที่เหลือดึงพร้อมกัน (หน้าที่ดึงไม่สำเร็จใช้แคชเก่าถ้ามี)"""
+        pages = {}
+        to_fetch = []
+        for url in urls:
+            html_content = self.cache.get(url) if self.cache is not None else None
+            if html_content is not None: pages[url] = html_content
+            else: to_fetch.append(url)
+        self._count("urls", len(urls))
+        self._count("cache_hits", len(pages))
+        if to_fetch:
+            fetched = asyncio.run_coroutine_threadsafe(self._fetch_all(to_fetch), self._loop).result()
+            for url, html_content in zip(to_fetch, fetched):
+                if html_content is not None and self.cache is not None:
+                    self.cache.put(url, html_content)
+                elif html_content is None and self.cache is not None:
+                    html_content = self.cache.get(url, allow_stale=True)
+                pages[url] = html_content
+        return pages
+
+    def enrich(self, products):
+        """เติม product["detail_fields"] ให้ทุกแถว (ไม่มีลิงก์/ดึงไม่ได้ = None) คืน list เดิม"""
+        start = time.perf_counter()
+        urls = {}
+        for product in products:
+            href = product.get("detail_page_url")
+            if href: urls[id(product)] = urljoin(self.base_url, href)
+        unique_urls = list(dict.fromkeys(urls.values()))
+        print(f"     -> ดึงหน้ารายละเอียด {len(unique_urls)} หน้า (พร้อมกันสูงสุด {self.concurrency})...")
+        pages = self.fetch_pages(unique_urls)
+        parsed = {url: parse_detail_fields(html_content) if html_content else None for url, html_content in pages.items()}
+        for product in products:
+            url = urls.get(id(product))
+            product["detail_fields"] = parsed.get(url) if url else None
+        self._count("seconds", time.perf_counter() - start)
+        return products
+
+    def close(self):
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+def print_detail_stats(enricher):
+    s = enricher.stats
+    print(f"หน้ารายละเอียด: {s['urls']} หน้า | แคช {s['cache_hits']} | ดึงใหม่ {s['fetched']} | ไม่พบ {s['not_found']}"
+          f" | ล้มเหลว {s['failed']} (retry {s['retries']} ครั้ง) | {s['seconds']:.1f}s")
+
+# --- 6.3 [ใหม่] สำเนารูปสินค้า + thumbnail ขนาดคงที่ (--mirror-images) ---
+# ได้ field เพิ่ม: image_mirror_path, image_thumb_path (path ที่หน้าเว็บใช้ได้ตรง ๆ), image_width, image_height
+# (ตาราง materials ต้องมีคอลัมน์ชื่อเหล่านี้) รูปเดียวกันหลาย URL (เช่นโลโก้ฉลาก) เก็บไฟล์เดียวตาม sha256
+IMAGE_MIRROR_WORKERS = 8
+IMAGE_MIRROR_RPS = 4.0 # รูปต่อวินาที (รวมทุก thread)
+THUMBNAIL_SIZE = (320, 320)
+IMAGE_MAX_BYTES = 20 * 1024 * 1024
+IMAGE_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp", "BMP": ".bmp", "TIFF": ".tif"}
+
+def _write_bytes_atomic(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{threading.get_ident()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def make_thumbnail(image, size=THUMBNAIL_SIZE):
+    """ย่อรูปให้อยู่ในกรอบ `size` (คงสัดส่วน) แล้วเติมขอบโปร่งใสให้ได้ขนาดพอดี คืน bytes แบบ WebP"""
+    from PIL import Image, ImageOps
+    image = ImageOps.exif_transpose(image).convert("RGBA")
+    thumb = ImageOps.pad(image, size, method=Image.Resampling.LANCZOS, color=(255, 255, 255, 0))
+    buffer = io.BytesIO()
+    thumb.save(buffer, format="WEBP", quality=80, method=4)
+    return buffer.getvalue()
+
+class ImageMirror:
+    """
+    ดาวน์โหลด image_url ของสินค้าพร้อมกันหลาย thread (session เดียวกับตอนดึงหน้า + RateLimiter รวม)
+    - เก็บรูปเต็มที่ <root>/full/<sha[:2]>/<sha256>.<ext> และ thumbnail ที่ <root>/thumb/<sha[:2]>/<sha256>_<WxH>.webp
+    - ดัชนี SQLite: URL -> sha256 (URL ที่เคยสำเนาแล้วและไฟล์ยังอยู่ จะไม่ดาวน์โหลดซ้ำ)
+      และ sha256 -> ขนาดรูป (URL ใหม่ที่ได้เนื้อรูปซ้ำกับที่มีอยู่ ไม่เขียนไฟล์/ไม่ทำ thumbnail ซ้ำ)
+    ใช้: mirror.mirror(products) (แก้ dict เดิม) และเรียก close() ตอนจบ
+    """
+    def __init__(self, root=None, index_path=None, workers=IMAGE_MIRROR_WORKERS, max_rps=IMAGE_MIRROR_RPS,
+                 thumb_size=THUMBNAIL_SIZE, url_prefix=None, session=None):
+        # import ตอนสร้างเท่านั้น รอบที่ไม่ได้ใช้ --mirror-images ไม่ต้องโหลด Pillow
+        try:
+            from PIL import Image
+        except ImportError:
+            raise RuntimeError("ต้องติดตั้ง Pillow ก่อนใช้ --mirror-images (pip install Pillow)") from None
+        self._Image = Image
+        self.root = root or os.path.join(PUBLISH_DIR, "images")
+        # path ที่บันทึกในแถวสินค้า (ค่าเริ่มต้น = root แบบ relative เช่น data/images/... ให้ index.html เปิดได้ตรง ๆ)
+        self.url_prefix = (url_prefix or self.root).replace(os.sep, '/').rstrip('/')
+        self.thumb_size = tuple(thumb_size)
+        self.session = session
+        self.rate_limiter = RateLimiter(max_rps)
+        self.stats = {"urls": 0, "already_mirrored": 0, "downloaded": 0, "deduped": 0, "failed": 0,
+                      "bytes": 0, "seconds": 0.0}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="image-mirror")
+        index_path = index_path or os.path.join(STATE_DIR, "image_mirror.sqlite")
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(index_path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, fetched_at REAL);
+            CREATE TABLE IF NOT EXISTS images (sha256 TEXT PRIMARY KEY, ext TEXT, width INTEGER, height INTEGER,
+                                               bytes INTEGER);
+        """)
+        self._db.commit()
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _relative_paths(self, sha, ext):
+        full = f"full/{sha[:2]}/{sha}{ext}"
+        thumb = f"thumb/{sha[:2]}/{sha}_{self.thumb_size[0]}x{self.thumb_size[1]}.webp"
+        return full, thumb
+
+    def _record(self, sha, ext, width, height):
+        """คืน record ถ้าไฟล์รูปเต็มและ thumbnail ขนาดปัจจุบันยังอยู่ครบ (ไม่งั้น None)"""
+        full, thumb = self._relative_paths(sha, ext)
+        if not (os.path.exists(os.path.join(self.root, full)) and os.path.exists(os.path.join(self.root, thumb))):
+            return None
+        return {"image_mirror_path": f"{self.url_prefix}/{full}", "image_thumb_path": f"{self.url_prefix}/{thumb}",
+                "image_width": width, "image_height": height}
+
+    def _lookup_sha(self, sha):
+        with self._lock:
+            row = self._db.execute("SELECT ext, width, height FROM images WHERE sha256=?", (sha,)).fetchone()
+        return self._record(sha, *row) if row else None
+
+    def lookup(self, url):
+        """record ของ URL ที่เคยสำเนาแล้ว (None ถ้ายังไม่เคยหรือไฟล์หาย)"""
+        with self._lock:
+            row = self._db.execute("SELECT sha256 FROM urls WHERE url=?", (url,)).fetchone()
+        return self._lookup_sha(row[0]) if row else None
+
+    def _remember(self, url, sha, image_row=None):
+        with self._lock:
+            if image_row is not None:
+                self._db.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?)", (sha, *image_row))
+            self._db.execute("INSERT OR REPLACE INTO urls VALUES (?, ?, ?)", (url, sha, time.time()))
+            self._db.commit()
+
+    def _download(self, url):
+        session = self.session or get_http_session()
+        self.rate_limiter.wait()
+        with TRACER.span("fetch.image"):
+            resp = session.get(url, timeout=HTTP_TIMEOUT_SECONDS)
+            resp.raise_for_status()
+        data = resp.content
+        if len(data) > IMAGE_MAX_BYTES:
+            raise ValueError(f"รูปใหญ่เกิน {IMAGE_MAX_BYTES} bytes")
+        self._count("downloaded")
+        self._count("bytes", len(data))
+        sha = hashlib.sha256(data).hexdigest()
+        record = self._lookup_sha(sha)
+        if record is not None:
+            self._count("deduped")
+            self._remember(url, sha)
+            return record
+        with TRACER.span("image.thumbnail"):
+            image = self._Image.open(io.BytesIO(data))
+            image.load() # ตรวจว่าเป็นรูปจริง (หน้า error ที่เป็น HTML จะ raise ตรงนี้)
+            ext = IMAGE_EXTENSIONS.get(image.format)
+            if ext is None:
+                raise ValueError(f"ไม่รองรับรูปแบบ {image.format}")
+            width, height = image.size
+            thumb_bytes = make_thumbnail(image, self.thumb_size)
+        full, thumb = self._relative_paths(sha, ext)
+        _write_bytes_atomic(os.path.join(self.root, full), data)
+        _write_bytes_atomic(os.path.join(self.root, thumb), thumb_bytes)
+        self._remember(url, sha, (ext, width, height, len(data)))
+        return self._record(sha, ext, width, height)
+
+    def _safe_download(self, url):
+        try:
+            return self._download(url)
+        except Exception as e:
+            print(f"     -> ⚠️ สำเนารูปไม่สำเร็จ {url}: {e}")
+            self._count("failed")
+            return None
+
+    def mirror_urls(self, urls):
+        """คืน {url: record หรือ None} URL ที่สำเนาไว้แล้วไม่ดาวน์โหลดซ้ำ ที่เหลือดาวน์โหลดพร้อมกัน"""
+        records = {}
+        to_fetch = []
+        for url in urls:
+            record = self.lookup(url)
+            if record is not None: records[url] = record
+            else: to_fetch.append(url)
+        self._count("urls", len(urls))
+        self._count("already_mirrored", len(records))
+        for url, record in zip(to_fetch, self._pool.map(self._safe_download, to_fetch)):
+            records[url] = record
+        return records
+
+    def mirror(self, products):
+        """เติม image_mirror_path/image_thumb_path/image_width/image_height ให้ทุกแถว (ไม่มีรูป/สำเนาไม่ได้ = None)"""
+        start = time.perf_counter()
+        unique_urls = list(dict.fromkeys(
+            p["image_url"] for p in products if str(p.get("image_url", "")).startswith(("http://", "https://"))))
+        print(f"     -> สำเนารูป {len(unique_urls)} URL (จาก {len(products)} รายการ)...")
+        records = self.mirror_urls(unique_urls)
+        empty = {"image_mirror_path": None, "image_thumb_path": None, "image_width": None, "image_height": None}
+        for product in products:
+            product.update(records.get(product.get("image_url")) or empty)
+        self._count("seconds", time.perf_counter() - start)
+        return products
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        with self._lock:
+            self._db.close()
+
+def print_image_stats(mirror):
+    s = mirror.stats
+    print(f"สำเนารูป: {s['urls']} URL | มีอยู่แล้ว {s['already_mirrored']} | ดาวน์โหลด {s['downloaded']}"
+          f" (เนื้อรูปซ้ำ {s['deduped']}) | ล้มเหลว {s['failed']} | {s['bytes'] / 1024:.0f} KiB | {s['seconds']:.1f}s")
+
 # --- 7. ฟังก์ชันส่งข้อมูลเข้า Supabase ---
-def upload_to_supabase(products_list):
+def upsert_materials(rows):
+    """upsert 1 ก้อนเข้าตาราง materials (raise ถ้าไม่สำเร็จ)"""
+    with TRACER.span("upload", rows=len(rows)):
+        get_supabase_client().table('materials').upsert(
+            rows,
+            on_conflict='product_id',
+        ).execute()
+    TRACER.count("rows_uploaded", len(rows))
+
+def upload_to_supabase(products_list, on_success=None):
+    """ส่งแบบเดิม (ทั้ง list ในครั้งเดียว รอจนเสร็จ) เรียก `on_success()` เมื่อส่งสำเร็จ"""
     if not products_list:
         print("   -> ไม่มีข้อมูลให้ส่ง")
+        if on_success: on_success()
         return True
     print(f"   -> กำลังส่ง {len(products_list)} รายการเข้า Supabase...")
     try:
-        data, count = supabase.table('materials').upsert(
-            products_list,
-            on_conflict='product_id',
-        ).execute()
+        upsert_materials(products_list)
         print("   -> ✅ ส่งข้อมูลสำเร็จ!")
+        if on_success: on_success()
         return True
     except Exception as e:
         print(f"   -> ❌ เกิดข้อผิดพลาดตอนส่งข้อมูลเข้า Supabase: {e}")
         return False
 
-# --- 8. ส่วนโปรแกรมหลัก (แบบวนลูป ปี -> ไตรมาส -> ประเภท + [แก้ไข] จัดระเบียบ print) ---
-if __name__ == "__main__":
-    start_year_be = 2010 # 🎯 ปี พ.ศ. เริ่มต้น (CFP เริ่ม 2010)
-    end_year_be = 2025  # ปี พ.ศ. สิ้นสุด
+# --- 7.1 [ใหม่] ส่งข้อมูลเบื้องหลัง (แบ่งก้อน + retry + เก็บก้อนที่ส่งไม่ได้ไว้ส่งใหม่) ---
+UPLOAD_CHUNK_ROWS = 500
+UPLOAD_CHUNK_BYTES = 1_000_000 # ~1 MB ต่อ request
+DEAD_LETTER_PATH = os.path.join(STATE_DIR, "upload_dead_letter.jsonl")
 
-    total_products_scraped_all_periods = 0
-    processed_tasks = 0
+def chunk_rows(rows, max_rows=UPLOAD_CHUNK_ROWS, max_bytes=UPLOAD_CHUNK_BYTES):
+    """แบ่ง rows เป็นก้อนที่ไม่เกิน `max_rows` แถว และไม่เกิน `max_bytes` (ขนาด JSON โดยประมาณ)"""
+    chunk, chunk_bytes = [], 0
+    for row in rows:
+        row_bytes = len(json.dumps(row, ensure_ascii=False, default=str).encode('utf-8'))
+        if chunk and (len(chunk) >= max_rows or chunk_bytes + row_bytes > max_bytes):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append(row)
+        chunk_bytes += row_bytes
+    if chunk:
+        yield chunk
 
-    print(f"=== เริ่มกระบวนการดึงข้อมูล CFP (2010+) และ CFR (2014+) ... ===")
+_STOP = object()
 
-    # 🎯 กำหนดประเภทที่จะดึงข้อมูล
-    scrape_types = [
-        {"label": "CFP", "section": "_SBPRODUCTS"},
-        {"label": "CFR", "section": "_SBREDUCTION"}
-    ]
+class BackgroundUploader:
+    """
+    ตัวส่งข้อมูลที่ทำงานใน thread แยก (ดึงหน้าถัดไปได้เลยไม่ต้องรอ upsert)
+    - รับงานผ่าน queue ที่จำกัดขนาด (`max_pending`) ถ้าส่งไม่ทันคนที่ submit จะรอ (ไม่กิน RAM ไม่จำกัด)
+    - แบ่งแถวเป็นก้อนตาม chunk_rows() แล้ว retry แบบ exponential backoff
+    - ก้อนที่ retry ครบแล้วยังไม่ผ่าน จะถูกเขียนลง dead-letter (JSON lines) ไว้ส่งใหม่ด้วย replay_dead_letters()
+    - เรียก close() ตอนจบโปรแกรมเพื่อส่งที่ค้างให้หมด
+    ใช้แทน upload_to_supabase ได้เลย: uploader(rows, on_success=...) คืน True เมื่อรับงานเข้าคิวแล้ว
+    """
+    def __init__(self, upsert=upsert_materials, max_pending=8, max_rows=UPLOAD_CHUNK_ROWS,
+                 max_bytes=UPLOAD_CHUNK_BYTES, max_retries=5, backoff_seconds=1.0, max_backoff_seconds=30.0,
+                 dead_letter_path=DEAD_LETTER_PATH):
+        self.upsert = upsert
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.dead_letter_path = dead_letter_path
+        self.stats = {"rows_sent": 0, "chunks_sent": 0, "retries": 0, "dead_chunks": 0, "dead_rows": 0,
+                      "seconds": 0.0}
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="supabase-uploader", daemon=True)
+        self._thread.start()
 
-    for year_be in range(start_year_be, end_year_be + 1): # ลูปนี้เริ่มที่ 2010
-        print(f"\n--- กำลังประมวลผลปี พ.ศ. {year_be} ---")
-        
-        # 🎯 วนลูปไตรมาส 1 ถึง 4
-        for quarter in range(1, 5):
-            print(f"  --- ไตรมาส {quarter} ---")
+    def __call__(self, rows, on_success=None):
+        if rows:
+            self._queue.put((list(rows), on_success))
+        elif on_success:
+            on_success()
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP: return
+                rows, on_success = item
+                all_sent = True
+                for chunk in chunk_rows(rows, self.max_rows, self.max_bytes):
+                    if not self._send_with_retry(chunk):
+                        all_sent = False
+                if all_sent and on_success:
+                    on_success()
+            except Exception as e:
+                print(f"   -> ❌ ตัวส่งข้อมูลเบื้องหลังเกิดข้อผิดพลาด: {e}")
+            finally:
+                self._queue.task_done()
 
-            # 🎯 วนลูปตามประเภท (CFP ก่อน แล้ว CFR)
+    def _send_with_retry(self, chunk):
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.upsert(chunk)
+                self.stats["rows_sent"] += len(chunk)
+                self.stats["chunks_sent"] += 1
+                self.stats["seconds"] += time.perf_counter() - start
+                return True
+            except Exception as e:
+                last_error = e
+                if attempt < self.max_retries:
+                    self.stats["retries"] += 1
+                    delay = min(self.max_backoff_seconds, self.backoff_seconds * (2 ** attempt))
+                    time.sleep(delay * random.uniform(0.5, 1.0)) # jitter กันหลาย process ยิงพร้อมกัน
+        self.stats["seconds"] += time.perf_counter() - start
+        print(f"   -> ❌ ส่ง {len(chunk)} รายการเข้า Supabase ไม่สำเร็จหลังลอง {self.max_retries + 1} ครั้ง"
+              f" ({last_error}), เก็บลง {self.dead_letter_path}")
+        self._write_dead_letter(chunk, last_error)
+        return False
+
+    def _write_dead_letter(self, chunk, error):
+        self.stats["dead_chunks"] += 1
+        self.stats["dead_rows"] += len(chunk)
+        os.makedirs(os.path.dirname(self.dead_letter_path) or ".", exist_ok=True)
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"failed_at": time.time(), "error": str(error), "rows": chunk},
+                               ensure_ascii=False, default=str) + "\n")
+
+    def flush(self):
+        """รอจนทุกงานในคิวส่งเสร็จ (หรือลง dead-letter)"""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+        s = self.stats
+        print(f"ส่งเข้า Supabase {s['rows_sent']} รายการ ({s['chunks_sent']} ก้อน, retry {s['retries']} ครั้ง,"
+              f" {s['seconds']:.1f}s)" + (f" | ❌ dead-letter {s['dead_rows']} รายการ" if s["dead_rows"] else ""))
+
+def replay_dead_letters(path=DEAD_LETTER_PATH, upsert=upsert_materials):
+    """ส่งก้อนที่ค้างใน dead-letter ใหม่ ก้อนที่ยังไม่ผ่านจะถูกเขียนกลับลงไฟล์ คืน (ก้อนที่ผ่าน, ก้อนที่ยังค้าง)"""
+    if not os.path.exists(path):
+        print("   -> ไม่มีข้อมูลค้างใน dead-letter")
+        return 0, 0
+    with open(path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    still_failing = []
+    for entry in entries:
+        try:
+            upsert(entry["rows"])
+        except Exception as e:
+            entry.update(failed_at=time.time(), error=str(e))
+            still_failing.append(entry)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in still_failing:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+    os.replace(tmp_path, path)
+    replayed = len(entries) - len(still_failing)
+    print(f"   -> ส่งข้อมูลค้างจาก dead-letter สำเร็จ {replayed} ก้อน, ยังค้าง {len(still_failing)} ก้อน")
+    return replayed, len(still_failing)
+
+# --- 8. [ใหม่] ตัวจัดคิวงาน (ปี x ไตรมาส x ประเภท) แบบขนาน + จำกัดความถี่การยิงเว็บ ---
+# 🎯 กำหนดประเภทที่จะดึงข้อมูล
+SCRAPE_TYPES = [
+    {"label": "CFP", "section": "_SBPRODUCTS"},
+    {"label": "CFR", "section": "_SBREDUCTION"}
+]
+
+def build_period_url(section, year_be, quarter, base_url=BASE_URL):
+    # สร้าง URL ที่ถูกต้อง (CFP หรือ CFR)
+    return f'{base_url.rstrip("/")}/index.php?lang=TH&mod=WTJGMFlXeHZadz09&action=Y0c5emRBPT0&section={section}&industry=3&style=_ROW&sorting=_ASC&year={year_be}&quarter={quarter}'
+
+def build_period_tasks(start_year_be, end_year_be, scrape_types=SCRAPE_TYPES):
+    """สร้างรายการงานทั้งหมด เรียงแบบเดียวกับลูปเดิม (ปี -> ไตรมาส -> ประเภท)"""
+    tasks = []
+    for year_be in range(start_year_be, end_year_be + 1):
+        for quarter in range(1, 5):
             for scrape_type in scrape_types:
-                
-                label = scrape_type["label"]
-                section = scrape_type["section"]
+                tasks.append({"label": scrape_type["label"], "section": scrape_type["section"],
+                              "year": year_be, "quarter": quarter})
+    return tasks
 
-                # --- 🎯 [แก้ไข] ตรรกะการข้าม + จัดระเบียบ print ---
-                
-                # ข้ามเฉพาะ CFR ถ้ายีงไม่ถึงปี 2014
-                if label == "CFR" and year_be < 2014:
-                    # [ใหม่] แสดงผลแบบกระชับเมื่อข้าม
-                    print(f"    [ประเภท: {label}] ⚠️ ข้ามปี {year_be} (CFR เริ่ม 2014)") 
-                    processed_tasks += 1 
-                    continue # ข้ามไปงานถัดไป
-                
-                # [ใหม่] ย้าย print นี้มาไว้ตรงนี้ (จะทำงานเฉพาะเมื่อ "ไม่ข้าม")
-                print(f"\n    --- [ประเภท: {label}] ---") 
-                # --- 🎯 [สิ้นสุดการแก้ไข] ---
-
-                # สร้าง URL ที่ถูกต้อง (CFP หรือ CFR)
-                period_url = f'https://thaicarbonlabel.tgo.or.th/index.php?lang=TH&mod=WTJGMFlXeHZadz09&action=Y0c5emRBPT0&section={section}&industry=3&style=_ROW&sorting=_ASC&year={year_be}&quarter={quarter}'
-                                    
-                html = fetch_tgo_data_with_selenium(period_url) 
-
-                if html:
-                    # ใช้ Parser แบบการ์ด (ตัวเดิม)
-                    products_this_period = parse_product_data(html, year_be, quarter)
-
-                    if products_this_period:
-                        initial_count = len(products_this_period)
-
-                        # --- 🎯 [เพิ่มเพื่อ DEBUG] ---
-                        # ลองพิมพ์ค่า carbon_value ของทุกรายการที่ดึงได้ในรอบนี้
-                        print(f"   [DEBUG] ตรวจสอบ {initial_count} รายการที่ดึงได้ (ก่อนกรอง ID ซ้ำ):")
-                        for p in products_this_period:
-                            print(f"     - ID: {p.get('product_id')}, Carbon: {p.get('carbon_value')}, Unit: {p.get('carbon_unit')}")
-                        print("   [DEBUG] สิ้นสุดการตรวจสอบ")
-                        # --- 🎯 [สิ้นสุด DEBUG] ---
-
-                        # กรอง ID ซ้ำ (ตรรกะเดิม)
-                        unique_products_dict = {}
-                        
-
-                        for product in products_this_period:
-                            pid = product.get('product_id', f"TEMP_Y{year_be}Q{quarter}_{len(unique_products_dict)}")
-                            if pid != "ID_NOT_FOUND" and pid not in unique_products_dict:
-                                unique_products_dict[pid] = product
-                        unique_products_this_period = list(unique_products_dict.values())
-                        filtered_count = len(unique_products_this_period)
-
-                        if filtered_count < initial_count:
-                            print(f"   ⚠️ [{label}] กรอง ID ซ้ำแล้ว เหลือ {filtered_count} รายการในไตรมาสนี้")
-
-                        print(f"   ✅ [{label}] แยกข้อมูลปี {year_be}/Q{quarter} สำเร็จ! ได้ {filtered_count} รายการ (หลังกรอง ID ซ้ำ)")
-                        total_products_scraped_all_periods += filtered_count
-
-                        if not upload_to_supabase(unique_products_this_period):
-                            print(f"   ❌ [{label}] ไม่สามารถส่งข้อมูลของปี {year_be}/Q{quarter} เข้า Supabase ได้, ข้าม...")
-                    else:
-                        print(f"   ⚠️ [{label}] ไม่พบข้อมูลผลิตภัณฑ์ในปี {year_be}/Q{quarter} (Parser ไม่เจอข้อมูล)")
-                else:
-                    print(f"   ⚠️ [{label}] ไม่มีข้อมูล หรือ ไม่สามารถดึง HTML ของปี {year_be}/Q{quarter} ได้, ข้าม...")
+def should_skip_task(task):
+    # ข้ามเฉพาะ CFR ถ้ายีงไม่ถึงปี 2014
+    if task["label"] == "CFR" and task["year"] < 2014:
+        return "CFR เริ่ม 2014"
+    return None
+
+# [ใหม่] ทะเบียนไตรมาสที่ยืนยันแล้วว่าไม่มีข้อมูล (ไม่ต้องยิงเว็บถามซ้ำทุกรอบ)
+EMPTY_CONFIRMATIONS = 2 # เจอ 'ไม่พบข้อมูล' กี่ครั้งจึงถือว่ายืนยันแล้ว
+EMPTY_RECHECK_DAYS = 30 # ยืนยันแล้วจะกลับไปเช็คใหม่ทุก ๆ เท่านี้วัน (ยืนยันซ้ำได้ห่างขึ้นเป็น 2 และ 4 เท่า)
+
+class EmptyPeriodRegistry:
+    """
+    จำไตรมาส (section, ปี, ไตรมาส) ที่เว็บตอบว่าไม่พบข้อมูล ลง SQLite
+    - ข้ามเฉพาะไตรมาสที่ปิดแล้ว และเจอว่างติดกันอย่างน้อย EMPTY_CONFIRMATIONS ครั้ง
+    - เช็คซ้ำเมื่อครบ `recheck_days` (ห่างขึ้นตามจำนวนครั้งที่ยืนยัน) ถ้าเจอข้อมูลเมื่อไหร่จะลบออกทันที
+    """
+    def __init__(self, path=None, recheck_days=EMPTY_RECHECK_DAYS, confirmations=EMPTY_CONFIRMATIONS):
+        path = path or os.path.join(STATE_DIR, "empty_periods.sqlite")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.recheck_seconds = recheck_days * 86400
+        self.confirmations = confirmations
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS empty_periods (
+            section TEXT, year INTEGER, quarter INTEGER, confirmations INTEGER, first_seen REAL, last_checked REAL,
+            PRIMARY KEY (section, year, quarter))""")
+        self._db.commit()
+
+    def should_skip(self, section, year, quarter, now=None):
+        if not is_closed_period(year, quarter): return False
+        with self._lock:
+            row = self._db.execute("SELECT confirmations, last_checked FROM empty_periods"
+                                   " WHERE section=? AND year=? AND quarter=?", (section, year, quarter)).fetchone()
+        if not row or row[0] < self.confirmations: return False
+        interval = self.recheck_seconds * 2 ** min(row[0] - self.confirmations, 2)
+        return (now or time.time()) - row[1] < interval
+
+    def mark_empty(self, section, year, quarter):
+        now = time.time()
+        with self._lock:
+            self._db.execute("""INSERT INTO empty_periods VALUES (?, ?, ?, 1, ?, ?)
+                ON CONFLICT (section, year, quarter) DO UPDATE
+                SET confirmations = confirmations + 1, last_checked = excluded.last_checked""",
+                             (section, year, quarter, now, now))
+            self._db.commit()
+
+    def mark_found(self, section, year, quarter):
+        with self._lock:
+            self._db.execute("DELETE FROM empty_periods WHERE section=? AND year=? AND quarter=?",
+                             (section, year, quarter))
+            self._db.commit()
+
+    def count_confirmed(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM empty_periods WHERE confirmations >= ?",
+                                    (self.confirmations,)).fetchone()[0]
+
+class RateLimiter:
+    """
+    จำกัดจำนวน request ต่อวินาที "รวมทุก worker" (เพื่อความสุภาพกับเว็บ TGO)
+    แต่ละ worker เรียก wait() ก่อนยิงหน้า ระบบจะเว้นระยะให้ห่างกันอย่างน้อย 1/rate วินาที
+    """
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second and rate_per_second > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """จองช่องถัดไป คืนจำนวนวินาทีที่ต้องรอ (ใช้กับ asyncio.sleep ได้)"""
+        if not self.interval: return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        return slot - now
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+def dedupe_products(products, year_be, quarter):
+    # กรอง ID ซ้ำ (ตรรกะเดิม)
+    unique_products_dict = {}
+    for product in products:
+        pid = product.get('product_id', f"TEMP_Y{year_be}Q{quarter}_{len(unique_products_dict)}")
+        if pid != "ID_NOT_FOUND" and pid not in unique_products_dict:
+            unique_products_dict[pid] = product
+    return list(unique_products_dict.values())
+
+# [ใหม่] ดัชนีสินค้าทั้งรอบ: รวมสินค้าซ้ำข้ามไตรมาสแล้วส่งขึ้น Supabase ครั้งเดียวตอนจบรอบ (เปิดด้วย --dedupe-run)
+def _is_blank(value):
+    return value is None or value == "" or value == "N/A"
+
+class ProductIndex:
+    """
+    รวมสินค้าจากทุกไตรมาสของรอบนี้ตาม product_id (เดิมกรองซ้ำแค่ในไตรมาสเดียว จึง upsert ตัวเดิมซ้ำทุกไตรมาสที่เจอ)
+    - นโยบายรวม: ทีละ field ใช้ค่าจากไตรมาสล่าสุด (ปี, ไตรมาส, section) ที่ค่าไม่ว่าง (None/""/"N/A" ไม่ทับค่าที่มีอยู่)
+      ไตรมาสเดียวกันซ้ำ = ตัวแรกชนะ (เหมือน dedupe_products) ผลลัพธ์จึงไม่ขึ้นกับลำดับที่ worker ทำเสร็จ
+    - flush(): ส่งแถวสุดท้ายของแต่ละสินค้าครั้งเดียว แล้วค่อยเรียก on_flushed ของทุกไตรมาส (mark done ใน manifest)
+    """
+    def __init__(self):
+        self._records = {} # product_id -> dict
+        self._field_periods = {} # product_id -> {field: period_key ของค่าที่ใช้อยู่}
+        self._on_flushed = []
+        self._lock = threading.Lock()
+        self.stats = {"periods": 0, "rows_in": 0, "products": 0, "merged": 0, "unchanged": 0, "uploaded": 0}
+
+    def add(self, period_key, products, on_flushed=None):
+        with self._lock:
+            self.stats["periods"] += 1
+            self.stats["rows_in"] += len(products)
+            if on_flushed: self._on_flushed.append(on_flushed)
+            for product in products:
+                pid = product["product_id"]
+                record = self._records.get(pid)
+                if record is None:
+                    self._records[pid] = dict(product)
+                    self._field_periods[pid] = {k: period_key for k, v in product.items() if not _is_blank(v)}
+                    continue
+                self.stats["merged"] += 1
+                periods = self._field_periods[pid]
+                for field, value in product.items():
+                    if _is_blank(value):
+                        record.setdefault(field, value)
+                    elif field not in periods or period_key > periods[field]:
+                        record[field] = value
+                        periods[field] = period_key
+            self.stats["products"] = len(self._records)
+
+    def records(self):
+        with self._lock:
+            return [dict(self._records[pid]) for pid in sorted(self._records)]
+
+    def flush(self, upload, manifest=None, max_rows=UPLOAD_CHUNK_ROWS):
+        """
+        ส่งแถวสุดท้าย (เฉพาะที่ใหม่/เปลี่ยนเมื่อมี manifest) เป็นก้อน ๆ ผ่าน `upload(rows, on_success)`
+        เมื่อทุกก้อนส่งสำเร็จจึงเรียก on_flushed ของทุกไตรมาส คืน True ถ้าส่งครบ (ตัวส่งเบื้องหลัง = เข้าคิวครบ)
+        """
+        rows = self.records()
+        to_upload = rows
+        if manifest is not None:
+            to_upload, unchanged = manifest.split_changed(rows)
+            self.stats["unchanged"] = len(unchanged)
+        self.stats["uploaded"] = len(to_upload)
+        print(f"\n=== ส่งข้อมูลทั้งรอบ: {self.stats['rows_in']} แถวจาก {self.stats['periods']} ไตรมาส"
+              f" -> สินค้าไม่ซ้ำ {self.stats['products']} รายการ (ตัด upsert ซ้ำข้ามไตรมาส {self.stats['merged']} แถว)"
+              f" | ไม่เปลี่ยน {self.stats['unchanged']} | ส่งจริง {len(to_upload)} ===")
+        chunks = list(chunk_rows(to_upload, max_rows=max_rows))
+        remaining = [len(chunks)]
+        done_lock = threading.Lock()
+
+        def on_all_uploaded():
+            for callback in self._on_flushed: callback()
 
-                processed_tasks += 1
-                if html: 
-                    print(f"   --- สิ้นสุด {label} ปี {year_be}/Q{quarter}, หยุดพัก 3 วินาที ---") 
-                    time.sleep(3) 
+        def on_chunk_uploaded(chunk):
+            if manifest is not None: manifest.commit_products(chunk)
+            with done_lock:
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+            if finished: on_all_uploaded()
 
-            # 🎯 [ลบออก] บรรทัด "สิ้นสุดไตรมาส" ถูกลบออกจากตรงนี้
+        if not chunks:
+            on_all_uploaded()
+            return True
+        ok = True
+        for chunk in chunks:
+            ok = upload(chunk, on_success=lambda chunk=chunk: on_chunk_uploaded(chunk)) and ok
+        return ok
 
-        print(f"--- สิ้นสุดปี {year_be} ---")
+def _new_task_result(task):
+    return {"task": task, "status": None, "products": 0, "attempts": 0, "uploaded": True,
+            "from_cache": False, "rows_changed": 0, "rows_unchanged": 0}
 
+def process_period_task(task, fetch_html, upload=upload_to_supabase, base_url=BASE_URL,
+                        rate_limiter=None, retries=2, retry_delay=5, cache=None,
+                        manifest=None, run_id=None, check_period_hash=True, enricher=None,
+                        image_mirror=None, empty_periods=None, snapshot=None, product_index=None):
+    """
+    ทำงาน 1 ชิ้น: ดึง HTML -> แยกข้อมูล -> กรอง ID ซ้ำ -> ส่งเข้า Supabase
+    `fetch_html(url)` ต้องคืน HTML หรือ None (ไม่พบข้อมูล) และ raise เมื่อดึงไม่สำเร็จ (จะ retry ให้)
+    ถ้ามี `cache` (HtmlCache) จะใช้ HTML จากแคชก่อน, ถ้า `fetch_html` เป็น None คือโหมดออฟไลน์ (แคชอย่างเดียว)
+    ถ้ามี `manifest` (ScrapeManifest) จะข้ามงานที่ทำเสร็จแล้วในรอบ `run_id`, ข้ามหน้าที่ hash ไม่เปลี่ยน
+    (เมื่อ `check_period_hash`) และส่งเข้า Supabase เฉพาะแถวที่ใหม่/เปลี่ยน
+    ถ้ามี `enricher` (DetailEnricher) จะดึงหน้ารายละเอียดของทุกแถวมาเติม field ก่อนส่ง
+    ถ้ามี `image_mirror` (ImageMirror) จะสำเนารูปสินค้า + ทำ thumbnail แล้วเติม path/ขนาดรูปก่อนส่ง
+    ถ้ามี `empty_periods` (EmptyPeriodRegistry) จะข้ามไตรมาสที่ยืนยันแล้วว่าว่าง และบันทึกผลว่าง/ไม่ว่างของรอบนี้
+    ถ้ามี `snapshot` (SnapshotWriter) จะเขียนแถวของงานนี้ลง snapshot (หน้าไม่เปลี่ยนใช้ partition ของรอบก่อน)
+    ถ้ามี `product_index` (ProductIndex) จะไม่ส่งเอง แต่ใส่แถวเข้าดัชนีทั้งรอบ (ส่ง + mark done ตอน flush() จบรอบ)
+    คืน dict ผลลัพธ์ที่มี status: skipped / resumed / known_empty / empty / not_cached / unchanged / ok /
+    no_products / failed
+    """
+    label, year_be, quarter, section = task["label"], task["year"], task["quarter"], task["section"]
+    result = _new_task_result(task)
+
+    skip_reason = should_skip_task(task)
+    if skip_reason:
+        # [ใหม่] แสดงผลแบบกระชับเมื่อข้าม
+        print(f"    [ประเภท: {label}] ⚠️ ข้ามปี {year_be} ({skip_reason})")
+        result["status"] = "skipped"
+        return result
+
+    if manifest is not None and manifest.is_done_in_run(run_id, section, year_be, quarter):
+        print(f"    [ประเภท: {label}] ⏭️ ปี {year_be}/Q{quarter} ทำเสร็จแล้วในรอบ #{run_id} (ทำต่อจากที่ค้าง)")
+        result["status"] = "resumed"
+        return result
+
+    if empty_periods is not None and empty_periods.should_skip(section, year_be, quarter):
+        print(f"    [ประเภท: {label}] ⏭️ ปี {year_be}/Q{quarter} ยืนยันแล้วว่าไม่มีข้อมูล (ยังไม่ถึงรอบเช็คใหม่)")
+        result["status"] = "known_empty"
+        if manifest is not None: manifest.mark_period_done(run_id, section, year_be, quarter, None, 0)
+        return result
+
+    print(f"\n    --- [ประเภท: {label}] ปี {year_be}/Q{quarter} ---")
+    period_url = build_period_url(task["section"], year_be, quarter, base_url)
+
+    html = None
+    if cache is not None:
+        html = cache.get(task["section"], year_be, quarter, allow_stale=fetch_html is None)
+        if html is not None:
+            print(f"     -> ใช้ HTML จากแคช (ไม่ต้องยิงเว็บ)")
+            result["from_cache"] = True
+        elif fetch_html is None:
+            print(f"   ⚠️ [{label}] ไม่มี HTML ของปี {year_be}/Q{quarter} ในแคช, ข้าม...")
+            result["status"] = "not_cached"
+            return result
+
+    while html is None:
+        result["attempts"] += 1
+        if rate_limiter: rate_limiter.wait()
+        try:
+            html = fetch_html(period_url)
+            if html and cache is not None:
+                cache.put(task["section"], year_be, quarter, html)
+            break
+        except Exception as e:
+            if result["attempts"] > retries:
+                print(f"   ❌ [{label}] ดึง {year_be}/Q{quarter} ไม่สำเร็จหลังลอง {result['attempts']} ครั้ง: {e}")
+                result["status"] = "failed"
+                return result
+            print(f"   🔁 [{label}] ดึง {year_be}/Q{quarter} ไม่สำเร็จ ({e}), ลองใหม่ครั้งที่ {result['attempts']}...")
+            time.sleep(retry_delay * result["attempts"])
+
+    if not html:
+        print(f"   ⚠️ [{label}] ไม่มีข้อมูล หรือ ไม่สามารถดึง HTML ของปี {year_be}/Q{quarter} ได้, ข้าม...")
+        result["status"] = "empty"
+        if empty_periods is not None: empty_periods.mark_empty(section, year_be, quarter)
+        if manifest is not None: manifest.mark_period_done(run_id, section, year_be, quarter, None, 0)
+        return result
+    if empty_periods is not None and not result["from_cache"]:
+        empty_periods.mark_found(section, year_be, quarter)
+
+    content_hash = page_content_hash(html)
+    if manifest is not None and check_period_hash and manifest.period_hash(section, year_be, quarter) == content_hash:
+        print(f"   ⏭️ [{label}] หน้าปี {year_be}/Q{quarter} ไม่เปลี่ยนจากรอบก่อน, ข้าม...")
+        result["status"] = "unchanged"
+        carried = snapshot is not None and snapshot.carry_forward(label, year_be, quarter)
+        if product_index is None and (snapshot is None or carried):
+            manifest.mark_period_done(run_id, section, year_be, quarter, content_hash, 0)
+            return result
+        # แยกข้อมูลจาก HTML ที่มีอยู่แล้ว (ไม่ต้องยิงเว็บ)
+        unchanged_products = dedupe_products(parse_product_data(html, year_be, quarter), year_be, quarter)
+        if product_index is not None:
+            # [แก้ไข] หน้าไม่เปลี่ยนก็ต้องเข้าดัชนีด้วย ไม่งั้นแถวรวมของสินค้าจะขาดค่าจากไตรมาสนี้
+            # แล้วค่าว่าง ('N/A') ของไตรมาสที่เปลี่ยนจะไปทับค่าดีใน Supabase
+            # เติม field แบบเดียวกับรอบก่อน (แคชหน้ารายละเอียด/ดัชนีรูปทำให้ไม่ต้องยิงซ้ำ) แถวรวมจะได้ตรงกับที่ส่งไปแล้ว
+            if enricher is not None:
+                enricher.enrich(unchanged_products)
+            if image_mirror is not None:
+                image_mirror.mirror(unchanged_products)
+        if snapshot is not None and not carried:
+            # ยังไม่มี partition นี้ใน snapshot ก่อนหน้า
+            snapshot.write_partition(label, year_be, quarter, unchanged_products)
+        if product_index is not None:
+            # mark done ตอน flush เหมือนงานอื่น (รอบที่ทำต่อจากที่ค้างจะได้ใส่ไตรมาสนี้เข้าดัชนีอีกครั้ง)
+            product_index.add((year_be, quarter, section), unchanged_products,
+                              on_flushed=lambda: manifest.mark_period_done(run_id, section, year_be, quarter,
+                                                                           content_hash, 0))
+        else:
+            manifest.mark_period_done(run_id, section, year_be, quarter, content_hash, 0)
+        return result
+
+    # ใช้ Parser แบบการ์ด (ตัวเดิม)
+    products_this_period = parse_product_data(html, year_be, quarter)
+    if not products_this_period:
+        print(f"   ⚠️ [{label}] ไม่พบข้อมูลผลิตภัณฑ์ในปี {year_be}/Q{quarter} (Parser ไม่เจอข้อมูล)")
+        result["status"] = "no_products"
+        return result
+
+    initial_count = len(products_this_period)
+
+    # --- 🎯 [เพิ่มเพื่อ DEBUG] --- (ปิดได้ด้วย --quiet)
+    # ลองพิมพ์ค่า carbon_value ของทุกรายการที่ดึงได้ในรอบนี้
+    if DEBUG_ROWS:
+        print(f"   [DEBUG] ตรวจสอบ {initial_count} รายการที่ดึงได้ (ก่อนกรอง ID ซ้ำ):")
+        for p in products_this_period:
+            print(f"     - ID: {p.get('product_id')}, Carbon: {p.get('carbon_value')}, Unit: {p.get('carbon_unit')}")
+        print("   [DEBUG] สิ้นสุดการตรวจสอบ")
+    # --- 🎯 [สิ้นสุด DEBUG] ---
+
+    unique_products_this_period = dedupe_products(products_this_period, year_be, quarter)
+    filtered_count = len(unique_products_this_period)
+    if filtered_count < initial_count:
+        print(f"   ⚠️ [{label}] กรอง ID ซ้ำแล้ว เหลือ {filtered_count} รายการในไตรมาสนี้")
+
+    print(f"   ✅ [{label}] แยกข้อมูลปี {year_be}/Q{quarter} สำเร็จ! ได้ {filtered_count} รายการ (หลังกรอง ID ซ้ำ)")
+    result["status"] = "ok"
+    result["products"] = filtered_count
+
+    if enricher is not None:
+        enricher.enrich(unique_products_this_period)
+    if image_mirror is not None:
+        image_mirror.mirror(unique_products_this_period)
+    if snapshot is not None:
+        snapshot.write_partition(label, year_be, quarter, unique_products_this_period)
+
+    if product_index is not None:
+        if manifest is not None:
+            mark_done = lambda: manifest.mark_period_done(run_id, section, year_be, quarter, content_hash, filtered_count)
+        else:
+            mark_done = None
+        product_index.add((year_be, quarter, section), unique_products_this_period, on_flushed=mark_done)
+        return result
+
+    to_upload = unique_products_this_period
+    if manifest is not None:
+        to_upload, unchanged = manifest.split_changed(unique_products_this_period)
+        result["rows_unchanged"] = len(unchanged)
+        print(f"   -> ใหม่/เปลี่ยน {len(to_upload)} รายการ | ไม่เปลี่ยน {len(unchanged)} รายการ (ไม่ต้องส่งซ้ำ)")
+    result["rows_changed"] = len(to_upload)
+
+    if not upload:
+        return result
+
+    def on_uploaded():
+        # บันทึก manifest หลังส่งสำเร็จจริงเท่านั้น (ตัวส่งเบื้องหลังจะเรียกหลัง upsert ครบทุกก้อน)
+        if manifest is not None:
+            manifest.commit_products(to_upload)
+            manifest.mark_period_done(run_id, section, year_be, quarter, content_hash, filtered_count)
+
+    if not upload(to_upload, on_success=on_uploaded):
+        print(f"   ❌ [{label}] ไม่สามารถส่งข้อมูลของปี {year_be}/Q{quarter} เข้า Supabase ได้, ข้าม...")
+        result["uploaded"] = False
+    return result
+
+def summarize_results(results):
+    summary = {"tasks": len(results), "skipped": 0, "resumed": 0, "known_empty": 0, "empty": 0, "not_cached": 0,
+               "unchanged": 0, "ok": 0, "no_products": 0, "failed": 0, "products": 0, "upload_failed": 0, "retries": 0,
+               "from_cache": 0, "rows_changed": 0, "rows_unchanged": 0}
+    for r in results:
+        summary[r["status"]] += 1
+        if r["from_cache"]: summary["from_cache"] += 1
+        summary["rows_changed"] += r["rows_changed"]
+        summary["rows_unchanged"] += r["rows_unchanged"]
+        summary["products"] += r["products"]
+        summary["retries"] += max(r["attempts"] - 1, 0)
+        if not r["uploaded"]: summary["upload_failed"] += 1
+    return summary
+
+def run_period_tasks(tasks, fetch_html, workers=1, max_rps=0.5, **task_options):
+    """
+    รันงานทุกชิ้นด้วย worker `workers` ตัว (thread ละ 1 งาน, แต่ละงานยืมเบราว์เซอร์ของตัวเองจาก pool)
+    ทุก worker ใช้ RateLimiter ตัวเดียวกัน จึงยิงเว็บรวมกันไม่เกิน `max_rps` ครั้ง/วินาที
+    `task_options` ส่งต่อให้ process_period_task (upload, base_url, retries, cache, manifest, ...)
+    คืน (summary, results) โดย results เรียงตามลำดับงานเดิมเสมอ
+    """
+    rate_limiter = RateLimiter(max_rps)
+
+    def run_one(task):
+        try:
+            with TRACER.span("task", label=task["label"], year=task["year"], quarter=task["quarter"]) as span_attrs:
+                result = process_period_task(task, fetch_html, rate_limiter=rate_limiter, **task_options)
+                span_attrs["status"] = result["status"]
+                return result
+        except Exception as e:
+            print(f"   ❌ [{task['label']}] งานปี {task['year']}/Q{task['quarter']} ล้มเหลว: {e}")
+            result = _new_task_result(task)
+            result.update(status="failed", attempts=1)
+            return result
+
+    if workers <= 1:
+        results = [run_one(task) for task in tasks]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(run_one, tasks))
+    return summarize_results(results), results
+
+def print_run_summary(summary):
     print(f"\n=== สิ้นสุดกระบวนการ ===")
-    print(f"ประมวลผลทั้งหมด {processed_tasks} งาน (ปี x ไตรมาส x ประเภท, รวมที่ข้าม)")
-    print(f"ดึงข้อมูลผลิตภัณฑ์ (CFP+CFR) (ที่ไม่ซ้ำ ID) ได้ทั้งหมด: {total_products_scraped_all_periods} รายการ")
+    print(f"ประมวลผลทั้งหมด {summary['tasks']} งาน (ปี x ไตรมาส x ประเภท, รวมที่ข้าม)")
+    print(f"  - มีข้อมูล {summary['ok']} | ไม่มีข้อมูล {summary['empty']} | Parser ไม่เจอข้อมูล {summary['no_products']}"
+          f" | ข้าม {summary['skipped']} | ล้มเหลว {summary['failed']} (retry {summary['retries']} ครั้ง)")
+    if summary["known_empty"]:
+        print(f"  - ⏭️ ข้ามไตรมาสที่ยืนยันแล้วว่าไม่มีข้อมูล {summary['known_empty']} งาน (ไม่ต้องยิงเว็บ)")
+    if summary["unchanged"] or summary["resumed"] or summary["rows_unchanged"]:
+        print(f"  - ⏭️ หน้าไม่เปลี่ยน {summary['unchanged']} งาน | ทำเสร็จแล้วจากรอบที่ค้าง {summary['resumed']} งาน"
+              f" | แถวที่ส่งใหม่/เปลี่ยน {summary['rows_changed']} | แถวไม่เปลี่ยน (ไม่ส่งซ้ำ) {summary['rows_unchanged']}")
+    if summary["from_cache"] or summary["not_cached"]:
+        print(f"  - ใช้ HTML จากแคช {summary['from_cache']} งาน | ไม่มีในแคช {summary['not_cached']} งาน")
+    if summary["upload_failed"]:
+        print(f"  - ❌ ส่งเข้า Supabase ไม่สำเร็จ {summary['upload_failed']} งาน")
+    print(f"ดึงข้อมูลผลิตภัณฑ์ (CFP+CFR) (ที่ไม่ซ้ำ ID) ได้ทั้งหมด: {summary['products']} รายการ")
+
+# --- 8.1 [ใหม่] Publish: สรุปจำนวนตามหมวด + ดัชนีค้นหา n-gram เป็นไฟล์ JSON ให้ index.html ---
+# index.html อ่านไฟล์เหล่านี้แทนการ select ทุกแถวมานับหมวดเอง และแทน ilike '%คำค้น%' (ต้องสแกนทั้งตาราง)
+#   <PUBLISH_DIR>/category_counts.json      [{label_type, category, count}, ...]
+#   <PUBLISH_DIR>/search/meta.json          {n, shards, docs, version}
+#   <PUBLISH_DIR>/search/docs.json          [product_id, ...] (ลำดับ = เลข doc ใน posting list)
+#   <PUBLISH_DIR>/search/shard-XX.json      {n-gram: [เลข doc แบบเก็บผลต่าง (delta)]}
+# shard ของ n-gram = FNV-1a 32 บิต (ทีละ code point) mod จำนวน shard (index.html คำนวณแบบเดียวกัน)
+PUBLISH_DIR = os.environ.get("TGO_PUBLISH_DIR", "data")
+SEARCH_NGRAM = 3
+SEARCH_SHARDS = 64
+PUBLISH_COLUMNS = "product_id,label_type,category,product_name"
+
+def fetch_published_rows(page_size=1000):
+    """อ่าน field ที่ใช้ publish ของทุกแถวในตาราง materials (ทีละหน้า)"""
+    rows = []
+    client = get_supabase_client()
+    while True:
+        page = (client.table('materials').select(PUBLISH_COLUMNS).order('product_id')
+                .range(len(rows), len(rows) + page_size - 1).execute().data)
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+
+def search_text(row):
+    """ข้อความที่ค้นได้ของ 1 แถว (normalize แบบเดียวกับแคชหมวดหมู่: ช่องว่างเดียว + ตัวพิมพ์เล็ก)
+    ค้นเฉพาะ product_name เหมือน ilike เดิม (หมวดหมู่ index.html เทียบกับ category_counts.json แยก)"""
+    return normalize_product_name(row.get('product_name') or '')
+
+def char_ngrams(text, n=SEARCH_NGRAM):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+def ngram_shard(gram, shards=SEARCH_SHARDS):
+    h = 0x811c9dc5
+    for char in gram:
+        h = ((h ^ ord(char)) * 0x01000193) & 0xffffffff
+    return h % shards
+
+def build_category_counts(rows):
+    counts = defaultdict(int)
+    for row in rows:
+        if row.get('category'):
+            counts[(row.get('label_type'), row['category'])] += 1
+    return [{"label_type": label, "category": category, "count": count}
+            for (label, category), count in sorted(counts.items(), key=lambda item: (str(item[0][0]), item[0][1]))]
+
+def build_search_index(rows, n=SEARCH_NGRAM, shards=SEARCH_SHARDS):
+    """คืน (docs, [ {n-gram: [doc, ...]} ต่อ shard ]) โดย doc = ลำดับใน docs (เรียงตาม product_id)"""
+    rows = sorted((row for row in rows if row.get('product_id')), key=lambda row: row['product_id'])
+    docs = [row['product_id'] for row in rows]
+    postings = defaultdict(list)
+    for doc, row in enumerate(rows):
+        for gram in char_ngrams(search_text(row), n):
+            postings[gram].append(doc) # doc เพิ่มขึ้นเรื่อย ๆ -> list เรียงอยู่แล้ว
+    shard_maps = [{} for _ in range(shards)]
+    for gram, doc_ids in postings.items():
+        shard_maps[ngram_shard(gram, shards)][gram] = [doc_ids[0]] + [b - a for a, b in zip(doc_ids, doc_ids[1:])]
+    return docs, shard_maps
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path) # เว็บจะไม่เจอไฟล์ที่เขียนไม่ครบ
+    return os.path.getsize(path)
+
+def publish_static(rows, out_dir=PUBLISH_DIR, n=SEARCH_NGRAM, shards=SEARCH_SHARDS):
+    """เขียนไฟล์ publish ทั้งหมดจาก `rows` คืนสถิติ (จำนวนแถว/n-gram/ขนาดไฟล์)"""
+    with TRACER.span("publish", rows=len(rows)):
+        counts = build_category_counts(rows)
+        docs, shard_maps = build_search_index(rows, n, shards)
+        size = _write_json(os.path.join(out_dir, "category_counts.json"), counts)
+        size += _write_json(os.path.join(out_dir, "search", "docs.json"), docs)
+        for shard, shard_map in enumerate(shard_maps):
+            size += _write_json(os.path.join(out_dir, "search", f"shard-{shard:02d}.json"), shard_map)
+        # meta เขียนท้ายสุด: version เปลี่ยน = index.html รู้ว่าต้องโหลด shard ใหม่
+        size += _write_json(os.path.join(out_dir, "search", "meta.json"),
+                            {"n": n, "shards": shards, "docs": len(docs), "version": int(time.time())})
+    return {"rows": len(rows), "categories": len(counts), "ngrams": sum(map(len, shard_maps)), "bytes": size}
+
+class SearchIndex:
+    """อ่านดัชนีที่ publish_static เขียนไว้ (ตรรกะเดียวกับ index.html) ใช้ทดสอบ/วัดความเร็ว"""
+    def __init__(self, out_dir=PUBLISH_DIR):
+        self.root = os.path.join(out_dir, "search")
+        with open(os.path.join(self.root, "meta.json"), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        with open(os.path.join(self.root, "docs.json"), encoding='utf-8') as f:
+            self.docs = json.load(f)
+        self._shards = {}
+        self._decoded = {}
+
+    def _postings(self, gram):
+        if gram in self._decoded: return self._decoded[gram]
+        shard = ngram_shard(gram, self.meta["shards"])
+        if shard not in self._shards:
+            with open(os.path.join(self.root, f"shard-{shard:02d}.json"), encoding='utf-8') as f:
+                self._shards[shard] = json.load(f)
+        doc, docs = 0, []
+        for gap in self._shards[shard].get(gram, []):
+            doc += gap
+            docs.append(doc)
+        self._decoded[gram] = docs
+        return docs
+
+    def candidates(self, query):
+        """product_id ที่มีทุก n-gram ของคำค้น (ต้องตรวจซ้ำกับข้อความจริง) หรือ None ถ้าคำค้นสั้นกว่า n"""
+        grams = char_ngrams(normalize_product_name(query), self.meta["n"])
+        if not grams: return None
+        postings = sorted((self._postings(gram) for gram in grams), key=len)
+        matched = set(postings[0])
+        for docs in postings[1:]:
+            matched.intersection_update(docs)
+            if not matched: break
+        return [self.docs[doc] for doc in sorted(matched)]
+
+def run_publish_stage(out_dir=PUBLISH_DIR):
+    print(f"\n=== Publish: สรุปจำนวนตามหมวด + ดัชนีค้นหา -> {out_dir}/ ===")
+    try:
+        rows = fetch_published_rows()
+    except Exception as e:
+        print(f"   ❌ อ่านข้อมูลจาก Supabase ไม่สำเร็จ (ไม่ publish รอบนี้): {e}")
+        return None
+    stats = publish_static(rows, out_dir)
+    print(f"   ✅ {stats['rows']} แถว | {stats['categories']} หมวด | {stats['ngrams']} n-gram"
+          f" | ไฟล์รวม {stats['bytes'] / 2**20:.2f} MiB")
+    return stats
+
+# --- 8.2 [ใหม่] Snapshot ข้อมูลแต่ละรอบเป็น Parquet (แบ่ง partition ตาม label/ปี/ไตรมาส) ---
+# <SNAPSHOT_DIR>/<snapshot_id>/label=CFP/year=2567/quarter=1/part-0.parquet  (1 ไฟล์ต่อ 1 งาน)
+# <SNAPSHOT_DIR>/<snapshot_id>/_snapshot.json                                 (เขียนตอนจบรอบ = snapshot ครบแล้ว)
+# ไว้วิเคราะห์/เทียบระหว่างรอบในเครื่อง โดยไม่ต้องดึงตาราง materials ทั้งหมดกลับมาจาก Supabase
+SNAPSHOT_DIR = os.path.join(STATE_DIR, "snapshots")
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_META_FILE = "_snapshot.json"
+SNAPSHOT_STRING_COLUMNS = ("product_id", "label_type", "product_name", "category", "functional_unit", "scope",
+                           "company_name", "contact_person", "phone", "email", "image_url", "detail_page_url",
+                           "carbon_unit", "image_mirror_path", "image_thumb_path")
+
+def _import_pyarrow():
+    """import pyarrow ตอนใช้ snapshot จริงเท่านั้น (pyarrow.dataset ดึง pandas มาด้วย ~0.4s ทุกครั้งที่ import scraper)
+    คืน (pa, pa_dataset, pq) หรือ raise RuntimeError ถ้าไม่ได้ติดตั้ง"""
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as pa_dataset
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("ต้องติดตั้ง pyarrow ก่อนใช้ snapshot (pip install pyarrow) หรือใช้ --no-snapshot") from None
+    return pa, pa_dataset, pq
+
+def snapshot_schema():
+    pa, _, _ = _import_pyarrow()
+    fields = [(name, pa.string()) for name in SNAPSHOT_STRING_COLUMNS]
+    fields += [("carbon_value", pa.float64()), ("cert_start_date", pa.date32()), ("cert_end_date", pa.date32()),
+               ("image_width", pa.int32()), ("image_height", pa.int32()),
+               ("detail_fields", pa.string())] # JSON ของ {หัวข้อ: ค่า}
+    return pa.schema(fields)
+
+def snapshot_partitioning():
+    pa, pa_dataset, _ = _import_pyarrow()
+    return pa_dataset.partitioning(
+        pa.schema([("label", pa.string()), ("year", pa.int16()), ("quarter", pa.int8())]), flavor="hive")
+
+def _iso_to_date(value):
+    """'2024-01-31' (ผลจาก convert_be_to_iso) -> date, วันที่ที่ไม่มีจริง (เช่น 2024-02-30) -> None"""
+    if not value: return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def products_to_table(products):
+    """แปลง list ของ dict สินค้าเป็น pyarrow.Table ตาม snapshot_schema() (คอลัมน์ที่ไม่มีใน dict = null)"""
+    pa, _, _ = _import_pyarrow()
+    columns = {name: [p.get(name) for p in products] for name in SNAPSHOT_STRING_COLUMNS}
+    columns["carbon_value"] = [None if p.get("carbon_value") is None else float(p["carbon_value"]) for p in products]
+    for name in ("cert_start_date", "cert_end_date"):
+        columns[name] = [_iso_to_date(p.get(name)) for p in products]
+    for name in ("image_width", "image_height"):
+        columns[name] = [p.get(name) for p in products]
+    columns["detail_fields"] = [None if p.get("detail_fields") is None else
+                                json.dumps(p["detail_fields"], ensure_ascii=False, sort_keys=True) for p in products]
+    return pa.table(columns, schema=snapshot_schema())
+
+def _partition_dir(label, year, quarter):
+    return os.path.join(f"label={label}", f"year={year}", f"quarter={quarter}")
+
+def list_snapshots(root=None):
+    """snapshot ที่เขียนครบแล้ว (มี _snapshot.json) เรียงจากเก่าไปใหม่ คืน list ของ meta dict"""
+    root = root or SNAPSHOT_DIR
+    snapshots = []
+    if not os.path.isdir(root): return snapshots
+    for name in os.listdir(root):
+        try:
+            with open(os.path.join(root, name, SNAPSHOT_META_FILE), encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return sorted(snapshots, key=lambda meta: (meta["finished_at"], meta["snapshot_id"]))
+
+class SnapshotWriter:
+    """
+    เขียน snapshot ของรอบนี้ทีละงาน (หลาย worker เขียนคนละ partition พร้อมกันได้)
+    - write_partition(): เขียนแถวของงานนั้นเป็น Parquet (zstd)
+    - carry_forward(): งานที่หน้าไม่เปลี่ยน ใช้ไฟล์ partition จาก snapshot ล่าสุด (hard link ถ้าได้)
+    - finish(): เขียน _snapshot.json เป็นตัวบอกว่า snapshot นี้ครบ/ใช้ query ได้
+    """
+    def __init__(self, snapshot_id, root=None, run_id=None):
+        _, _, self._pq = _import_pyarrow()
+        self.root = root or SNAPSHOT_DIR
+        self.snapshot_id = snapshot_id
+        self.path = os.path.join(self.root, snapshot_id)
+        self.run_id = run_id
+        self.started_at = time.time()
+        previous = [meta for meta in list_snapshots(self.root) if meta["snapshot_id"] != snapshot_id]
+        self.previous_id = previous[-1]["snapshot_id"] if previous else None
+        self.stats = {"partitions": 0, "rows": 0, "carried_forward": 0, "bytes": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, rows, nbytes, carried=False):
+        with self._lock:
+            self.stats["partitions"] += 1
+            self.stats["rows"] += rows
+            self.stats["bytes"] += nbytes
+            if carried: self.stats["carried_forward"] += 1
+
+    def write_partition(self, label, year, quarter, products):
+        path = os.path.join(self.path, _partition_dir(label, year, quarter), "part-0.parquet")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with TRACER.span("snapshot.write", label=label, year=year, quarter=quarter, rows=len(products)):
+            tmp_path = f"{path}.tmp-{threading.get_ident()}"
+            self._pq.write_table(products_to_table(products), tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+        self._count(len(products), os.path.getsize(path))
+
+    def carry_forward(self, label, year, quarter):
+        """ใช้ partition เดิมจาก snapshot ล่าสุด คืน False ถ้าไม่มีให้ใช้ (ผู้เรียกต้องเขียนเอง)"""
+        if self.previous_id is None: return False
+        relative = os.path.join(_partition_dir(label, year, quarter), "part-0.parquet")
+        source = os.path.join(self.root, self.previous_id, relative)
+        if not os.path.exists(source): return False
+        target = os.path.join(self.path, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(target): os.remove(target) # รอบที่ทำต่อจากที่ค้าง อาจเขียนไว้แล้ว
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+        self._count(self._pq.ParquetFile(target).metadata.num_rows, os.path.getsize(target), carried=True)
+        return True
+
+    def finish(self, **extra):
+        meta = {"snapshot_id": self.snapshot_id, "format_version": SNAPSHOT_FORMAT_VERSION, "run_id": self.run_id,
+                "started_at": self.started_at, "finished_at": time.time(), "previous": self.previous_id,
+                **self.stats, **extra}
+        os.makedirs(self.path, exist_ok=True)
+        _write_json(os.path.join(self.path, SNAPSHOT_META_FILE), meta)
+        return meta
+
+def _resolve_snapshot(snapshot, root):
+    if snapshot is None:
+        snapshots = list_snapshots(root)
+        if not snapshots: raise FileNotFoundError(f"ยังไม่มี snapshot ใน {root}")
+        snapshot = snapshots[-1]["snapshot_id"]
+    path = os.path.join(root, snapshot)
+    if not os.path.exists(os.path.join(path, SNAPSHOT_META_FILE)):
+        raise FileNotFoundError(f"ไม่พบ snapshot ที่เขียนครบแล้ว: {path}")
+    return path
+
+def load_snapshot(snapshot=None, columns=None, labels=None, years=None, quarters=None, root=None):
+    """
+    อ่าน snapshot (ค่าเริ่มต้นคือล่าสุด) เป็น pyarrow.Table
+    อ่านเฉพาะคอลัมน์ใน `columns` และเฉพาะ partition ที่ตรงกับ `labels`/`years`/`quarters` (ไม่เปิดไฟล์อื่นเลย)
+    คอลัมน์ partition (label, year, quarter) ขอใน `columns` ได้เหมือนคอลัมน์ปกติ
+    """
+    _, pa_dataset, _ = _import_pyarrow()
+    root = root or SNAPSHOT_DIR
+    dataset = pa_dataset.dataset(_resolve_snapshot(snapshot, root), format="parquet",
+                                 partitioning=snapshot_partitioning(), exclude_invalid_files=True)
+    condition = None
+    for name, values in (("label", labels), ("year", years), ("quarter", quarters)):
+        if values is None: continue
+        expression = pa_dataset.field(name).isin(list(values))
+        condition = expression if condition is None else condition & expression
+    return dataset.to_table(columns=list(columns) if columns else None, filter=condition)
+
+def diff_snapshots(old, new, columns=None, root=None, **filters):
+    """
+    เทียบ 2 snapshot ตาม product_id (ถ้า product_id เดียวกันอยู่หลายไตรมาส ใช้ไตรมาสล่าสุด เหมือน upsert)
+    คืน {"added": [ids], "removed": [ids], "changed": {id: {คอลัมน์: (ค่าเดิม, ค่าใหม่)}}, "unchanged": จำนวน}
+    `columns` = คอลัมน์ที่ใช้เทียบ (ค่าเริ่มต้นทุกคอลัมน์ข้อมูล), `filters` ส่งต่อให้ load_snapshot
+    """
+    columns = list(columns or snapshot_schema().names)
+    wanted = list(dict.fromkeys(["product_id", "year", "quarter"] + columns))
+
+    def rows_by_id(snapshot):
+        table = load_snapshot(snapshot, columns=wanted, root=root, **filters)
+        rows = sorted(table.to_pylist(), key=lambda row: (row["year"], row["quarter"]))
+        return {row["product_id"]: row for row in rows}
+
+    before, after = rows_by_id(old), rows_by_id(new)
+    diff = {"added": sorted(after.keys() - before.keys()), "removed": sorted(before.keys() - after.keys()),
+            "changed": {}, "unchanged": 0}
+    for pid in sorted(before.keys() & after.keys()):
+        changes = {name: (before[pid][name], after[pid][name]) for name in columns
+                   if name != "product_id" and before[pid][name] != after[pid][name]}
+        if changes: diff["changed"][pid] = changes
+        else: diff["unchanged"] += 1
+    return diff
+
+def print_snapshot_diff(old, new, root=None, examples=10):
+    diff = diff_snapshots(old, new, root=root)
+    print(f"=== เทียบ snapshot {old} -> {new} ===")
+    print(f"  เพิ่ม {len(diff['added'])} | หายไป {len(diff['removed'])} | เปลี่ยน {len(diff['changed'])}"
+          f" | เหมือนเดิม {diff['unchanged']}")
+    for pid, changes in list(diff["changed"].items())[:examples]:
+        print(f"  - {pid}: " + ", ".join(f"{name} {a!r} -> {b!r}" for name, (a, b) in changes.items()))
+    return diff
+
+# --- 9. ส่วนโปรแกรมหลัก (แบบวนลูป ปี -> ไตรมาส -> ประเภท + [แก้ไข] จัดระเบียบ print) ---
+def parse_args():
+    parser = argparse.ArgumentParser(description="ดึงข้อมูล CFP/CFR จาก thaicarbonlabel.tgo.or.th เข้า Supabase")
+    parser.add_argument("--start-year", type=int, default=2010, help="ปีเริ่มต้น (CFP เริ่ม 2010)")
+    parser.add_argument("--end-year", type=int, default=2025, help="ปีสิ้นสุด")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="จำนวนงานที่ทำพร้อมกัน (แต่ละงานใช้เบราว์เซอร์ของตัวเอง, ค่าเริ่มต้น 1 = ทีละงานแบบเดิม)")
+    parser.add_argument("--max-rps", type=float, default=0.5,
+                        help="จำนวนหน้าสูงสุดที่ยิงเว็บ TGO ต่อวินาที รวมทุก worker (ค่าเริ่มต้น 0.5)")
+    parser.add_argument("--retries", type=int, default=2, help="จำนวนครั้งที่ลองใหม่เมื่อดึงหน้าไม่สำเร็จ")
+    parser.add_argument("--base-url", default=BASE_URL,
+                        help="URL ของเว็บ (เปลี่ยนเป็น server ในเครื่องเพื่อทดสอบได้)")
+    parser.add_argument("--fetch-mode", choices=("auto", "http", "browser"), default="auto",
+                        help="auto = ลอง HTTP ก่อนแล้วค่อยใช้เบราว์เซอร์, http = HTTP อย่างเดียว, browser = Selenium อย่างเดียว")
+    parser.add_argument("--from-cache", action="store_true",
+                        help="ไม่ยิงเว็บเลย: แยกข้อมูล/จัดหมวดหมู่/ส่งขึ้น Supabase ใหม่จาก HTML ที่แคชไว้")
+    parser.add_argument("--no-cache", action="store_true", help="ไม่อ่าน/ไม่เขียนแคช HTML")
+    parser.add_argument("--no-upload", action="store_true", help="ไม่ส่งข้อมูลเข้า Supabase (ดูผลอย่างเดียว)")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="ไม่ใช้ manifest: ประมวลผลทุกหน้าและส่งทุกแถวขึ้น Supabase ใหม่ทั้งหมด")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="เริ่มรอบใหม่เสมอ แม้รอบก่อนหน้าจะค้างอยู่")
+    parser.add_argument("--upload-mode", choices=("background", "sync"), default="background",
+                        help="background = ส่งเบื้องหลังแบบแบ่งก้อน+retry ระหว่างดึงหน้าถัดไป, sync = ส่งทีละงานแบบเดิม")
+    parser.add_argument("--upload-chunk-rows", type=int, default=UPLOAD_CHUNK_ROWS,
+                        help=f"จำนวนแถวสูงสุดต่อ 1 request (ค่าเริ่มต้น {UPLOAD_CHUNK_ROWS})")
+    parser.add_argument("--dedupe-run", action="store_true",
+                        help="รวมสินค้าทุกไตรมาสตาม product_id แล้วส่งครั้งเดียวตอนจบรอบ (ตัด upsert ซ้ำข้ามไตรมาส"
+                             " และค่าว่างไม่ทับค่าเดิม) แต่จะไม่ส่งระหว่างดึงหน้า และไตรมาสจะ mark done ใน manifest"
+                             " หลังส่งครบเท่านั้น (พังกลางทาง = รอบหน้าเริ่มใหม่ทั้งหมด) ค่าเริ่มต้นคือส่งทีละไตรมาส")
+    parser.add_argument("--replay-dead-letters", action="store_true",
+                        help=f"ส่งข้อมูลที่ค้างใน {DEAD_LETTER_PATH} ใหม่ แล้วจบโปรแกรม")
+    parser.add_argument("--enrich-details", action="store_true",
+                        help="ดึงหน้ารายละเอียดของทุกสินค้า (aiohttp) มาเติม detail_fields ก่อนส่ง")
+    parser.add_argument("--detail-concurrency", type=int, default=DETAIL_CONCURRENCY,
+                        help=f"จำนวนหน้ารายละเอียดที่ดึงพร้อมกันสูงสุด (ค่าเริ่มต้น {DETAIL_CONCURRENCY})")
+    parser.add_argument("--detail-rps", type=float, default=DETAIL_RPS_PER_HOST,
+                        help=f"จำนวนหน้ารายละเอียดต่อวินาทีต่อ host (ค่าเริ่มต้น {DETAIL_RPS_PER_HOST})")
+    parser.add_argument("--mirror-images", action="store_true",
+                        help="สำเนารูปสินค้าเก็บไว้ใน <publish-dir>/images พร้อม thumbnail แล้วเติม path/ขนาดรูปก่อนส่ง")
+    parser.add_argument("--image-workers", type=int, default=IMAGE_MIRROR_WORKERS,
+                        help=f"จำนวน thread ดาวน์โหลดรูป (ค่าเริ่มต้น {IMAGE_MIRROR_WORKERS})")
+    parser.add_argument("--image-rps", type=float, default=IMAGE_MIRROR_RPS,
+                        help=f"จำนวนรูปต่อวินาทีรวมทุก thread (ค่าเริ่มต้น {IMAGE_MIRROR_RPS})")
+    parser.add_argument("--recheck-empty", action="store_true",
+                        help="เช็คทุกไตรมาสใหม่ รวมที่ยืนยันแล้วว่าไม่มีข้อมูล (ไม่ข้ามตามทะเบียนไตรมาสว่าง)")
+    parser.add_argument("--empty-recheck-days", type=float, default=EMPTY_RECHECK_DAYS,
+                        help=f"ไตรมาสที่ยืนยันแล้วว่าว่างจะกลับไปเช็คใหม่ทุกกี่วัน (ค่าเริ่มต้น {EMPTY_RECHECK_DAYS})")
+    parser.add_argument("--no-snapshot", action="store_true",
+                        help="ไม่เขียน snapshot ข้อมูลรอบนี้เป็น Parquet")
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR,
+                        help=f"โฟลเดอร์เก็บ snapshot (ค่าเริ่มต้น {SNAPSHOT_DIR})")
+    parser.add_argument("--snapshot-diff", nargs=2, metavar=("OLD", "NEW"),
+                        help="เทียบ snapshot 2 ชุด (ชื่อโฟลเดอร์ใน --snapshot-dir) แล้วจบโปรแกรม")
+    parser.add_argument("--no-publish", action="store_true",
+                        help="ไม่สร้างไฟล์สรุปจำนวนตามหมวด/ดัชนีค้นหาหลังจบรอบ")
+    parser.add_argument("--publish-dir", default=PUBLISH_DIR, help=f"โฟลเดอร์ไฟล์ publish (ค่าเริ่มต้น {PUBLISH_DIR})")
+    parser.add_argument("--quiet", action="store_true", help="ไม่พิมพ์ [DEBUG] carbon ของทุกแถว")
+    parser.add_argument("--report-dir", default=None,
+                        help="โฟลเดอร์เก็บ events (JSON lines) และสรุปการรัน (JSON) (ค่าเริ่มต้น .tgo_state/reports)")
+    parser.add_argument("--show-browser", action="store_true",
+                        help="เปิดเบราว์เซอร์แบบเห็นหน้าต่าง (ค่าเริ่มต้นคือ headless)")
+    parser.add_argument("--pages-per-browser", type=int, default=25,
+                        help="จำนวนหน้าที่ให้เบราว์เซอร์ 1 ตัวโหลด ก่อนปิดแล้วเปิดตัวใหม่ (ค่าเริ่มต้น 25)")
+    args = parser.parse_args()
+    if args.from_cache and args.no_cache:
+        parser.error("ใช้ --from-cache คู่กับ --no-cache ไม่ได้")
+    if args.replay_dead_letters and args.no_upload:
+        parser.error("ใช้ --replay-dead-letters คู่กับ --no-upload ไม่ได้")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.snapshot_diff:
+        try:
+            print_snapshot_diff(*args.snapshot_diff, root=args.snapshot_dir)
+        except (RuntimeError, FileNotFoundError) as e:
+            print(f"❌ {e}")
+            exit(1)
+        exit()
+    DEBUG_ROWS = not args.quiet
+    run_stamp = time.strftime('%Y%m%d-%H%M%S')
+    report_dir = args.report_dir or os.path.join(STATE_DIR, "reports")
+    report_base = os.path.join(report_dir, f"run-{run_stamp}")
+    TRACER.open_events(f"{report_base}.events.jsonl")
+    LATENCY.load(os.path.join(STATE_DIR, "latency_history.json"))
+    print(f"=== เริ่มกระบวนการดึงข้อมูล CFP ({args.start_year}+) และ CFR (2014+) ด้วย {args.workers} worker ... ===")
+    tasks = build_period_tasks(args.start_year, args.end_year)
+    html_cache = None if args.no_cache else HtmlCache()
+    if not args.no_upload:
+        try:
+            get_supabase_client() # เช็คการเชื่อมต่อตั้งแต่ต้น (แบบเดิม) ก่อนเริ่มดึงข้อมูล
+        except Exception:
+            exit()
+    if args.replay_dead_letters:
+        replay_dead_letters()
+        exit()
+
+    uploader = None
+    if args.no_upload:
+        upload = None
+    elif args.upload_mode == "background":
+        uploader = upload = BackgroundUploader(max_rows=args.upload_chunk_rows)
+    else:
+        upload = upload_to_supabase
+
+    # 🎯 [ใหม่] manifest ใช้เฉพาะตอนส่งข้อมูลจริง (--no-upload ไม่ควรทำให้ระบบคิดว่าส่งไปแล้ว)
+    manifest, run_id = None, None
+    if upload and not args.full_refresh:
+        manifest = ScrapeManifest()
+        run_id, resumed = manifest.start_run(resume=not args.no_resume)
+        print(f"   รอบการรัน #{run_id}" + (" (ทำต่อจากรอบที่ค้าง)" if resumed else ""))
+    enricher = None
+    if args.enrich_details:
+        try:
+            enricher = DetailEnricher(base_url=args.base_url, concurrency=args.detail_concurrency,
+                                      per_host_rps=args.detail_rps, cache=None if args.no_cache else DetailCache())
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            exit()
+    image_mirror = None
+    if args.mirror_images:
+        try:
+            image_mirror = ImageMirror(root=os.path.join(args.publish_dir, "images"), workers=args.image_workers,
+                                       max_rps=args.image_rps)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            exit()
+    # ทะเบียนไตรมาสว่างใช้เฉพาะตอนยิงเว็บจริง (--from-cache ไม่เสียเวลาเว็บอยู่แล้ว)
+    # --recheck-empty ยังบันทึกผลลงทะเบียน แค่ไม่ข้าม
+    empty_periods = None
+    if not args.from_cache:
+        empty_periods = EmptyPeriodRegistry(recheck_days=0 if args.recheck_empty else args.empty_recheck_days)
+    snapshot = None
+    if not args.no_snapshot:
+        try:
+            # รอบที่ทำต่อจากที่ค้างเขียนลง snapshot เดิม (partition ที่ทำเสร็จแล้วยังอยู่ครบ)
+            snapshot = SnapshotWriter(f"run-{run_id:05d}" if run_id else run_stamp, root=args.snapshot_dir,
+                                      run_id=run_id)
+        except RuntimeError as e:
+            print(f"⚠️ {e}")
+    # ดัชนีทั้งรอบเปิดเมื่อขอเท่านั้น: ค่าเริ่มต้นส่งทีละไตรมาสระหว่างดึงหน้าถัดไป และ mark done ทีละไตรมาส (ทำต่อได้)
+    product_index = ProductIndex() if upload and args.dedupe_run else None
+    task_options = {"upload": upload, "cache": html_cache, "manifest": manifest, "run_id": run_id, "enricher": enricher,
+                    "image_mirror": image_mirror, "empty_periods": empty_periods, "snapshot": snapshot,
+                    "product_index": product_index,
+                    # --from-cache มักใช้ตอนแก้ parser: หน้าเหมือนเดิมแต่ผลอาจเปลี่ยน จึงไม่ข้ามตาม hash หน้า
+                    "check_period_hash": not args.from_cache}
+
+    try:
+        if args.from_cache:
+            print("   โหมดออฟไลน์: ใช้ HTML จากแคชอย่างเดียว (ไม่ยิงเว็บ TGO)")
+            summary, _ = run_period_tasks(tasks, None, workers=args.workers, **task_options)
+        else:
+            # 🎯 [ใหม่] เปิดเบราว์เซอร์ไว้ชุดเดียวแล้วใช้ซ้ำทุกงาน (1 ตัวต่อ worker แทนการเปิด/ปิด Chrome ใหม่ทุกไตรมาส)
+            # (pool จะเปิด Chrome จริงก็ต่อเมื่อ HTTP ไม่พอและต้องใช้เบราว์เซอร์เท่านั้น)
+            with BrowserPool(size=args.workers, max_pages_per_driver=args.pages_per_browser,
+                             headless=not args.show_browser) as browser_pool:
+                get_http_session(pool_size=max(args.workers, 1))
+                fetch_html = lambda url: fetch_period_html(url, pool=browser_pool, mode=args.fetch_mode, raise_on_error=True)
+                summary, _ = run_period_tasks(tasks, fetch_html, workers=args.workers, max_rps=args.max_rps,
+                                              retries=args.retries, base_url=args.base_url, **task_options)
+        if product_index is not None:
+            # ส่งครั้งเดียวตอนจบ (ถ้าพังกลางทาง ไตรมาสที่ยังไม่ส่งจะไม่ถูก mark done และทำใหม่รอบหน้า)
+            if not product_index.flush(upload, manifest=manifest, max_rows=args.upload_chunk_rows):
+                summary["upload_failed"] += 1
+    finally:
+        if enricher is not None:
+            enricher.close()
+        if image_mirror is not None:
+            image_mirror.close()
+        if uploader is not None:
+            uploader.close() # ส่งที่ค้างในคิวให้หมดก่อนจบ (รวมกรณีกด Ctrl+C/โปรแกรมพัง)
+        LATENCY.save() # ประวัติเวลาที่ใช้จริง ให้รอบถัดไปตั้ง timeout ได้ตั้งแต่หน้าแรก
+
+    if manifest is not None:
+        manifest.finish_run(run_id)
+    snapshot_meta = None
+    if snapshot is not None:
+        snapshot_meta = snapshot.finish(failed_tasks=summary["failed"])
+
+    publish_stats = None
+    if upload and not args.no_publish:
+        publish_stats = run_publish_stage(args.publish_dir) # หลัง uploader.close() = ข้อมูลขึ้น Supabase ครบแล้ว
+
+    print_run_summary(summary)
+    if not args.from_cache:
+        print_fetch_stats()
+    print_classify_stats()
+    if enricher is not None:
+        print_detail_stats(enricher)
+    if image_mirror is not None:
+        print_image_stats(image_mirror)
+    if snapshot_meta is not None:
+        print(f"Snapshot {snapshot_meta['snapshot_id']}: {snapshot_meta['rows']} แถว {snapshot_meta['partitions']} partition"
+              f" (ใช้ของรอบก่อน {snapshot_meta['carried_forward']}) | {snapshot_meta['bytes'] / 2**20:.2f} MiB"
+              f" -> {snapshot.path}")
+    if html_cache is not None:
+        expired, removed = html_cache.prune()
+        print(f"แคช HTML: hit {html_cache.hits} | miss {html_cache.misses} | ลบที่หมดอายุ {expired} entry, {removed} ไฟล์")
+
+    TRACER.print_summary()
+    TRACER.close()
+    write_run_report(f"{report_base}.json", run=summary, fetch=FETCH_STATS, classify=CLASSIFY_STATS,
+                     uploader=uploader.stats if uploader else None, details=enricher.stats if enricher else None,
+                     images=image_mirror.stats if image_mirror else None, publish=publish_stats,
+                     snapshot=snapshot_meta, product_index=product_index.stats if product_index else None,
+                     html_cache={"hits": html_cache.hits, "misses": html_cache.misses} if html_cache else None)
+    print(f"บันทึกสรุปการรันไว้ที่ {report_base}.json (events: {report_base}.events.jsonl)")
@@ -1,47 +1,216 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
+import sklearn
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.pipeline import make_pipeline
 import joblib # Library สำหรับ save/load โมเดล
 
-print("--- 1. กำลังโหลดข้อมูลสอน (Training Data)... ---")
-# 1. โหลดข้อมูล "เฉลย" ที่เราทำไว้
-try:
-    df = pd.read_csv('training_data.csv')
-    df = df[['product_name', 'correct_category']].dropna()
-except FileNotFoundError:
-    print("❌ ไม่พบไฟล์ training_data.csv! กรุณาสร้างไฟล์ข้อมูลสอนก่อน")
-    exit()
-
-if df.empty:
-    print("❌ ข้อมูลสอนว่างเปล่า (กรุณาตรวจสอบไฟล์ CSV)")
-    exit()
-
-print(f"✅ โหลดข้อมูลสอนสำเร็จ {len(df)} รายการ")
-
-# 2. แบ่งข้อมูลเป็น X (คำถาม = ชื่อผลิตภัณฑ์) และ y (คำตอบ = หมวดหมู่)
-X_train = df['product_name']
-y_train = df['correct_category']
-
-print("--- 2. กำลังสร้างโมเดล... ---")
-# 3. สร้าง "ท่อ" (Pipeline)
-#    - TfidfVectorizer: คือตัวแปลงข้อความ (เช่น "ปูนฉาบ") ให้เป็นตัวเลข
-#    - MultinomialNB: คือ "สมอง" AI (Naive Bayes) ที่เหมาะกับการแยกประเภทข้อความ
-model_pipeline = make_pipeline(
-    TfidfVectorizer(analyzer='char', ngram_range=(2, 5)), # 💡 เทคนิค: ให้มันเรียนรู้จาก "ตัวอักษร" (เช่น "ปูนฉ", "ฉาบผ") จะแม่นกว่าคำ
-    MultinomialNB()
-)
-
-print("--- 3. กำลัง 'สอน' (Training) โมเดล... ---")
-# 4. "สอน" โมเดล โดยใช้ X_train (คำถาม) และ y_train (คำตอบ)
-model_pipeline.fit(X_train, y_train)
-
-print("--- 4. กำลังบันทึกโมเดล... ---")
-# 5. บันทึก "ท่อ" ทั้งหมด (ทั้งตัวแปลง TF-IDF และ สมอง AI) ลงไฟล์
-#    เราจะได้ไฟล์ชื่อ category_model.joblib
-try:
-    joblib.dump(model_pipeline, 'category_model.joblib')
-    print("✅ บันทึกโมเดลสำเร็จ! (category_model.joblib)")
-    print("\nคุณสามารถนำโมเดลนี้ไปใช้ในสคริปต์ Scraper ได้เลย")
-except Exception as e:
-    print(f"❌ บันทึกโมเดลไม่สำเร็จ: {e}")
\ No newline at end of file
+DATA_PATH = 'training_data.csv'
+MODEL_PATH = 'category_model.joblib'
+
+# 🎯 [ใหม่] โหมด "hashed": แปลงข้อความด้วย HashingVectorizer (ไม่ต้องเก็บ vocabulary, ไม่ต้อง fit)
+#    - เทรนเพิ่มทีละชุดได้ด้วย partial_fit (ไม่ต้องเทรนใหม่ทั้งไฟล์)
+#    - ไฟล์โมเดลมีแต่ array ขนาดคงที่ (float32) -> เล็กกว่า และโหลดแบบ mmap ได้ทั้งก้อน
+#    ห้ามบีบอัดไฟล์ (joblib compress) เพราะไฟล์ที่บีบอัดโหลดแบบ mmap ไม่ได้
+MODEL_FORMAT_VERSION = 1
+HASHED_N_FEATURES = 2 ** 15
+HASHED_ALPHA = 0.01 # ใช้จำนวนครั้งดิบ (norm=None) + smoothing น้อย ๆ แม่นกว่าค่าเริ่มต้นใน holdout
+
+def load_training_data(path=DATA_PATH):
+    """โหลดข้อมูล "เฉลย" (product_name, correct_category) คืน None ถ้าไม่มีไฟล์/ว่างเปล่า"""
+    try:
+        df = pd.read_csv(path)
+        df = df[['product_name', 'correct_category']].dropna()
+    except FileNotFoundError:
+        print(f"❌ ไม่พบไฟล์ {path}! กรุณาสร้างไฟล์ข้อมูลสอนก่อน")
+        return None
+    if df.empty:
+        print("❌ ข้อมูลสอนว่างเปล่า (กรุณาตรวจสอบไฟล์ CSV)")
+        return None
+    return df
+
+def build_tfidf_pipeline():
+    # สร้าง "ท่อ" (Pipeline)
+    #    - TfidfVectorizer: คือตัวแปลงข้อความ (เช่น "ปูนฉาบ") ให้เป็นตัวเลข
+    #    - MultinomialNB: คือ "สมอง" AI (Naive Bayes) ที่เหมาะกับการแยกประเภทข้อความ
+    return make_pipeline(
+        TfidfVectorizer(analyzer='char', ngram_range=(2, 5)), # 💡 เทคนิค: ให้มันเรียนรู้จาก "ตัวอักษร" (เช่น "ปูนฉ", "ฉาบผ") จะแม่นกว่าคำ
+        MultinomialNB()
+    )
+
+def build_hashed_pipeline(n_features=HASHED_N_FEATURES):
+    # ตัวอักษร 2-5 ตัวเหมือนเดิม แต่ hash เข้าช่องจำนวนคงที่แทนการจำ vocabulary
+    return make_pipeline(
+        HashingVectorizer(analyzer='char', ngram_range=(2, 5), alternate_sign=False, norm=None,
+                          n_features=n_features),
+        MultinomialNB(alpha=HASHED_ALPHA)
+    )
+
+def compact_model(model_pipeline):
+    """ลดขนาด array ของ Naive Bayes เหลือ float32 (ใช้กับโหมด hashed ทั้ง predict และ partial_fit ได้ตามปกติ)"""
+    nb = model_pipeline[-1]
+    nb.feature_count_ = nb.feature_count_.astype(np.float32)
+    nb.feature_log_prob_ = nb.feature_log_prob_.astype(np.float32)
+    return model_pipeline
+
+def row_digest(product_name, category):
+    return hashlib.sha1(f"{product_name}\t{category}".encode('utf-8')).hexdigest()[:12]
+
+def metadata_path(model_path):
+    """ไฟล์ข้อมูลประกอบโมเดล (JSON) วางข้างไฟล์โมเดล เช่น category_model.meta.json"""
+    return os.path.splitext(model_path)[0] + '.meta.json'
+
+def load_metadata(model_path):
+    try:
+        with open(metadata_path(model_path), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_model(model_pipeline, path, metadata):
+    joblib.dump(model_pipeline, path)
+    metadata = dict(metadata, size_bytes=os.path.getsize(path))
+    with open(metadata_path(path), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    return metadata
+
+def make_metadata(mode, model_pipeline, df, previous=None, last_version=0):
+    """version + ที่มาของโมเดล (row_digests ใช้กันไม่ให้ --update นับแถวเดิมซ้ำ)
+    previous = metadata ที่จะเทรนต่อ (--update), last_version = version ของไฟล์เดิมตอนเทรนใหม่ทั้งหมด"""
+    digests = set(previous.get('row_digests', [])) if previous else set()
+    digests.update(row_digest(name, category) for name, category in zip(df['product_name'], df['correct_category']))
+    metadata = {
+        "format_version": MODEL_FORMAT_VERSION,
+        "mode": mode,
+        "version": max((previous or {}).get("version", 0), last_version) + 1,
+        "trained_at": datetime.datetime.now().isoformat(timespec='seconds'),
+        "sklearn_version": sklearn.__version__,
+        "classes": [str(c) for c in model_pipeline[-1].classes_],
+        "trained_rows": (previous or {}).get("trained_rows", 0) + len(df),
+        "row_digests": sorted(digests),
+    }
+    if mode == "hashed":
+        metadata["n_features"] = model_pipeline[0].n_features
+    return metadata
+
+def train_full(df, mode, n_features=HASHED_N_FEATURES):
+    """เทรนใหม่ทั้งหมดจาก df"""
+    if mode == "hashed":
+        return compact_model(build_hashed_pipeline(n_features).fit(df['product_name'], df['correct_category']))
+    return build_tfidf_pipeline().fit(df['product_name'], df['correct_category'])
+
+def update_model(df, path):
+    """
+    [ใหม่] เทรนเพิ่ม (partial_fit) เฉพาะแถวที่โมเดลยังไม่เคยเห็น
+    คืน (model_pipeline, metadata, จำนวนแถวใหม่) หรือ None ถ้าอัปเดตไม่ได้
+    """
+    metadata = load_metadata(path)
+    if not metadata or metadata.get("mode") != "hashed":
+        print(f"❌ '{path}' ไม่ใช่โมเดลโหมด hashed (ต้องเทรนด้วย --mode hashed ก่อนจึงจะ --update ได้)")
+        return None
+    if metadata.get("format_version") != MODEL_FORMAT_VERSION:
+        print(f"❌ รูปแบบไฟล์โมเดล v{metadata.get('format_version')} ไม่ตรงกับ v{MODEL_FORMAT_VERSION} กรุณาเทรนใหม่ทั้งหมด")
+        return None
+    seen = set(metadata.get("row_digests", []))
+    is_new = [row_digest(name, category) not in seen for name, category in zip(df['product_name'], df['correct_category'])]
+    new_rows = df[is_new]
+    unknown = sorted(set(new_rows['correct_category']) - set(metadata["classes"]))
+    if unknown:
+        # MultinomialNB.partial_fit เพิ่มหมวดใหม่ภายหลังไม่ได้
+        print(f"❌ พบหมวดหมู่ใหม่ {unknown} ต้องเทรนใหม่ทั้งหมด (python train_model.py --mode hashed)")
+        return None
+    model_pipeline = joblib.load(path) # ไม่ใช้ mmap เพราะต้องแก้ค่า array
+    if len(new_rows):
+        model_pipeline[-1].partial_fit(model_pipeline[0].transform(new_rows['product_name']), new_rows['correct_category'])
+        compact_model(model_pipeline)
+    return model_pipeline, make_metadata("hashed", model_pipeline, new_rows, metadata), len(new_rows)
+
+def holdout_report(df, n_features=HASHED_N_FEATURES, seed=1):
+    """[ใหม่] เทียบโหมด tfidf (ตัวเดิม) กับ hashed บน holdout 20%: ความแม่น, เวลา predict, ขนาดไฟล์, เวลาโหลด"""
+    indexes = list(range(len(df)))
+    random.Random(seed).shuffle(indexes)
+    split = int(len(indexes) * 0.8)
+    train, holdout = df.iloc[indexes[:split]], df.iloc[indexes[split:]]
+    names = list(holdout['product_name'])
+    print(f"\n--- รายงาน Holdout (เทรน {len(train)} / ทดสอบ {len(holdout)} รายการ) ---")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("tfidf", "hashed"):
+            start = time.perf_counter()
+            model_pipeline = train_full(train, mode, n_features)
+            train_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            predicted = model_pipeline.predict(names)
+            predict_us = (time.perf_counter() - start) / len(names) * 1e6
+            accuracy = (predicted == holdout['correct_category'].to_numpy()).mean() * 100
+            path = os.path.join(tmp, f"{mode}.joblib")
+            joblib.dump(model_pipeline, path)
+            start = time.perf_counter()
+            joblib.load(path, mmap_mode='r')
+            load_ms = (time.perf_counter() - start) * 1000
+            print(f"  {mode:<6} แม่น {accuracy:6.2f}% | เทรน {train_seconds:5.2f}s | predict {predict_us:6.1f} µs/รายการ"
+                  f" | ไฟล์ {os.path.getsize(path) / 2**20:5.2f} MiB | โหลด {load_ms:6.1f} ms")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="เทรนโมเดลจัดหมวดหมู่สินค้าจาก training_data.csv")
+    parser.add_argument("--mode", choices=["tfidf", "hashed"], default="tfidf",
+                        help="tfidf = ตัวเดิม (เทรนใหม่ทั้งหมดทุกครั้ง), hashed = ไฟล์เล็ก เทรนเพิ่มได้")
+    parser.add_argument("--update", action="store_true",
+                        help="เทรนเพิ่มเฉพาะแถวใหม่ใน --data เข้าโมเดล hashed เดิม (ไม่เทรนใหม่ทั้งหมด)")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--output", default=MODEL_PATH)
+    parser.add_argument("--n-features", type=int, default=HASHED_N_FEATURES, help="จำนวนช่อง hash (โหมด hashed)")
+    parser.add_argument("--report", action="store_true", help="พิมพ์รายงานเทียบ tfidf กับ hashed บน holdout ก่อนเทรน")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    print("--- 1. กำลังโหลดข้อมูลสอน (Training Data)... ---")
+    # 1. โหลดข้อมูล "เฉลย" ที่เราทำไว้
+    df = load_training_data(args.data)
+    if df is None:
+        exit()
+    print(f"✅ โหลดข้อมูลสอนสำเร็จ {len(df)} รายการ")
+
+    if args.report:
+        holdout_report(df, args.n_features)
+
+    if args.update:
+        print(f"--- 2. กำลังเทรนเพิ่ม (partial_fit) เข้าโมเดลเดิม '{args.output}'... ---")
+        result = update_model(df, args.output)
+        if result is None:
+            exit(1)
+        model_pipeline, metadata, new_rows = result
+        if not new_rows:
+            print("✅ ไม่มีแถวใหม่ที่โมเดลยังไม่เคยเห็น ไม่ต้องบันทึกใหม่")
+            exit()
+        print(f"✅ เทรนเพิ่ม {new_rows} รายการใหม่ (รวมทั้งหมด {metadata['trained_rows']} รายการ)")
+    else:
+        print(f"--- 2. กำลังสร้างโมเดล ({args.mode})... ---")
+        print("--- 3. กำลัง 'สอน' (Training) โมเดล... ---")
+        # 2-3. แบ่งข้อมูลเป็น X (คำถาม = ชื่อผลิตภัณฑ์) และ y (คำตอบ = หมวดหมู่) แล้ว "สอน" โมเดล
+        model_pipeline = train_full(df, args.mode, args.n_features)
+        # [แก้ไข] เทรนใหม่ทั้งหมดก็ต้องนับ version ต่อจากไฟล์เดิม ไม่ใช่กลับไปเป็น v1 ทุกครั้ง
+        previous = load_metadata(args.output) or {}
+        metadata = make_metadata(args.mode, model_pipeline, df, last_version=previous.get("version", 0))
+
+    print("--- 4. กำลังบันทึกโมเดล... ---")
+    # 5. บันทึก "ท่อ" ทั้งหมด (ทั้งตัวแปลงข้อความ และ สมอง AI) ลงไฟล์ พร้อมไฟล์ข้อมูลประกอบ (.meta.json)
+    #    เราจะได้ไฟล์ชื่อ category_model.joblib
+    try:
+        metadata = save_model(model_pipeline, args.output, metadata)
+        print(f"✅ บันทึกโมเดลสำเร็จ! ({args.output}, {metadata['mode']} v{metadata['version']},"
+              f" {metadata['size_bytes'] / 2**20:.2f} MiB)")
+        print("\nคุณสามารถนำโมเดลนี้ไปใช้ในสคริปต์ Scraper ได้เลย")
+    except Exception as e:
+        print(f"❌ บันทึกโมเดลไม่สำเร็จ: {e}")
\ No newline at end of file